@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Adaptive Concurrency Control
+
+Per-host AIMD (additive increase, multiplicative decrease) limiter shared by
+the downloaders and the server's remote thumbnail generation. Concurrency
+grows while a host answers quickly and is cut sharply on 429/5xx responses,
+connection failures or rising latency; Retry-After pauses the host.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+from urllib.parse import urlparse
+
+# Where the downloaders publish their limiter state for serve.py's status endpoint
+CONCURRENCY_STATUS_PATH = Path('data') / 'download_concurrency.json'
+
+# Minimum seconds between status file writes
+STATUS_WRITE_INTERVAL = 2.0
+
+# Pause applied to a throttled host that did not send Retry-After
+DEFAULT_THROTTLE_PAUSE = 5.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostState:
+    """AIMD state for one host."""
+
+    def __init__(self, initial_limit: float):
+        self.limit = initial_limit
+        self.in_flight = 0
+        self.latency: Optional[float] = None   # EWMA of response latency (seconds)
+        self.baseline: Optional[float] = None  # Best latency seen recently (slowly forgets)
+        self.blocked_until = 0.0               # time.monotonic() before which no request starts
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.throttles = 0
+        self.errors = 0
+
+
+class AdaptiveConcurrencyLimiter:
+    """Caps in-flight requests per host with an AIMD-adjusted limit."""
+
+    def __init__(self, per_host_limit: int = 8, initial_limit: int = 2, min_limit: int = 1,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 3.0,
+                 status_path: Optional[Path] = None):
+        """
+        Initialize the limiter.
+
+        Args:
+            per_host_limit: Upper bound for any host's concurrency
+            initial_limit: Concurrency a host starts with
+            min_limit: Lower bound for any host's concurrency
+            decrease_factor: Multiplier applied on throttling or congestion
+            latency_tolerance: Latency above baseline * tolerance counts as congestion
+            status_path: JSON file the current state is published to (optional)
+        """
+        self.per_host_limit = max(1, per_host_limit)
+        self.min_limit = max(1, min(min_limit, self.per_host_limit))
+        self.initial_limit = max(self.min_limit, min(initial_limit, self.per_host_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.status_path = Path(status_path) if status_path else None
+        self.hosts: Dict[str, HostState] = {}
+        self.condition = threading.Condition()
+        self.last_status_write = 0.0
+
+    def get_state(self, host: str) -> HostState:
+        """Return the state for `host` (caller holds the condition)."""
+        if host not in self.hosts:
+            self.hosts[host] = HostState(float(self.initial_limit))
+        return self.hosts[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        """Context manager that holds one of the host's slots, waiting out Retry-After pauses."""
+        host = urlparse(url).netloc
+        with self.condition:
+            while True:
+                state = self.get_state(host)
+                pause = state.blocked_until - time.monotonic()
+                if pause <= 0 and state.in_flight < int(state.limit):
+                    break
+                self.condition.wait(timeout=pause if pause > 0 else None)
+            state.in_flight += 1
+        try:
+            yield
+        finally:
+            self.release(url)
+
+    def try_acquire(self, url: str) -> bool:
+        """Take one of the host's slots if one is free right now; never waits."""
+        host = urlparse(url).netloc
+        with self.condition:
+            state = self.get_state(host)
+            if state.blocked_until > time.monotonic() or state.in_flight >= int(state.limit):
+                return False
+            state.in_flight += 1
+            return True
+
+    def release(self, url: str) -> None:
+        """Give back a slot taken with try_acquire (or limit)."""
+        host = urlparse(url).netloc
+        with self.condition:
+            self.get_state(host).in_flight -= 1
+            self.condition.notify_all()
+
+    def record(self, url: str, status: Optional[int], latency: Optional[float] = None,
+               retry_after: Union[str, float, None] = None) -> None:
+        """
+        Feed one response (or failure) back into the host's limit.
+
+        Args:
+            url: Requested URL
+            status: HTTP status, or None for a timeout/connection failure
+            latency: Seconds until the response headers arrived
+            retry_after: Retry-After header value or seconds (optional)
+        """
+        host = urlparse(url).netloc
+        if isinstance(retry_after, str):
+            retry_after = parse_retry_after(retry_after)
+        now = time.monotonic()
+
+        with self.condition:
+            state = self.get_state(host)
+            throttled = status == 429 or status == 503
+            if throttled or status is None or status >= 500:
+                if throttled:
+                    state.throttles += 1
+                    pause = retry_after if retry_after is not None else DEFAULT_THROTTLE_PAUSE
+                    state.blocked_until = max(state.blocked_until, now + pause)
+                else:
+                    state.errors += 1
+                self.decrease(state, now)
+            else:
+                state.successes += 1
+                if latency is not None:
+                    state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+                    if state.baseline is None or latency < state.baseline:
+                        state.baseline = latency
+                    else:
+                        # Let the baseline drift up so a permanently slower host is not punished forever
+                        state.baseline += (latency - state.baseline) * 0.01
+                if state.latency is not None and state.latency > state.baseline * self.latency_tolerance:
+                    self.decrease(state, now)
+                else:
+                    # +1 per limit's worth of healthy responses (one "window")
+                    state.limit = min(float(self.per_host_limit), state.limit + 1.0 / state.limit)
+            self.condition.notify_all()
+
+        self.write_status()
+
+    def decrease(self, state: HostState, now: float) -> None:
+        """Cut a host's limit, at most once per latency window so one burst counts once."""
+        window = max(state.latency or 0.0, 1.0)
+        if now - state.last_decrease < window:
+            return
+        state.limit = max(float(self.min_limit), state.limit * self.decrease_factor)
+        state.last_decrease = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current per-host state for monitoring."""
+        now = time.monotonic()
+        with self.condition:
+            return {
+                'perHostLimit': self.per_host_limit,
+                'updated': time.time(),
+                'hosts': {
+                    host: {
+                        'limit': round(state.limit, 2),
+                        'inFlight': state.in_flight,
+                        'latencyMs': round(state.latency * 1000) if state.latency is not None else None,
+                        'baselineMs': round(state.baseline * 1000) if state.baseline is not None else None,
+                        'pausedFor': round(max(0.0, state.blocked_until - now), 1),
+                        'successes': state.successes,
+                        'throttles': state.throttles,
+                        'errors': state.errors,
+                    }
+                    for host, state in sorted(self.hosts.items())
+                },
+            }
+
+    def write_status(self, force: bool = False) -> None:
+        """Publish the snapshot to `status_path` (rate-limited unless forced)."""
+        if self.status_path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_status_write < STATUS_WRITE_INTERVAL:
+            return
+        self.last_status_write = now
+        try:
+            self.status_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.status_path.with_name(f"{self.status_path.name}.{threading.get_ident()}.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, indent=2)
+            os.replace(temp_path, self.status_path)
+        except OSError:
+            # Monitoring output must never break a download
+            pass
+
+
+def load_concurrency_status(status_path: Path = CONCURRENCY_STATUS_PATH) -> Optional[Dict[str, Any]]:
+    """Read the downloaders' last published limiter state, if any."""
+    try:
+        with open(status_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Streaming Annotation Reader
+Yields the result records of a VQA annotation file one at a time, so ingesting
+a file with millions of results only ever holds one batch of them in memory.
+Handles both layouts found under downloads/: {"results": [...], "time": ...}
+and a bare [...] array. Each record is decoded by the C scanner behind
+json.JSONDecoder.raw_decode from a sliding text buffer. Converted entries are
+spooled to a temporary file (VideoSpool) and read back in score order.
+"""
+
+import hashlib
+import json
+import mmap
+import re
+import tempfile
+from array import array
+from itertools import islice
+from pathlib import Path
+
+from stream_probe import SIDECAR_SUFFIX
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Characters read from the file per refill of the buffer
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Result records handed to the conversion step at a time
+ANNOTATION_BATCH_SIZE = 1000
+
+# JSON files under downloads/ that are never annotation files (besides downloader metadata sidecars)
+NON_ANNOTATION_FILES = ('ranking_results.json', 'query_metadata.json')
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+SEPARATOR = re.compile(r'[ \t\n\r]*,?[ \t\n\r]*')
+
+# Characters that can follow a complete value; anything else means a number was cut off by a read (`12.` of `12.5`)
+VALUE_END = frozenset(' \t\n\r,:]}')
+
+
+class AnnotationStream:
+    """Iterates an annotation file's results; top-level scalars ("time", ...) land in `meta` as they are passed"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = {}
+        # True once the file turned out to be a bare array of results
+        self.is_array = False
+
+    def __iter__(self):
+        # Text mode, so multi-byte characters split across reads decode correctly
+        with open(self.path, 'r', encoding='utf-8') as f:
+            yield from self.iter_raw(f)
+
+    def iter_raw(self, f):
+        """Walk the top level by hand and raw_decode one value at a time from a sliding buffer"""
+        reader = RawReader(f)
+        first = reader.peek()
+        if first == '[':
+            self.is_array = True
+            reader.advance(1)
+            yield from reader.iter_array()
+            return
+        if first != '{':
+            # Not an object or array: nothing to stream
+            return
+
+        reader.advance(1)
+        while True:
+            if reader.peek() == '}':
+                return
+            key = reader.decode()
+            reader.expect(':')
+            if key == 'results' and reader.peek() == '[':
+                reader.advance(1)
+                yield from reader.iter_array()
+            else:
+                value = reader.decode()
+                if not isinstance(value, (dict, list)):
+                    self.meta[key] = value
+            if reader.peek() == ',':
+                reader.advance(1)
+
+
+class RawReader:
+    """Buffered text reader that decodes one JSON value at a time"""
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Drop consumed text and append another chunk; False at end of file"""
+        chunk = self.f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of file)"""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def advance(self, count):
+        self.pos += count
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in {getattr(self.f, 'name', 'annotation file')}")
+        self.advance(1)
+
+    def decode(self):
+        """Decode the next value, reading more until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A value ending at the buffer edge or before a non-delimiter may be a number cut in half
+                if self.eof or (end < len(self.buf) and self.buf[end] in VALUE_END):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def iter_array(self):
+        """Yield the items of an array whose '[' was just consumed"""
+        scan_once = self.decoder.scan_once
+        # After the first item, the comma before the next one may only arrive with the next chunk
+        separator = WHITESPACE
+        while True:
+            # Decode every complete item in the buffer with locals only (the hot loop)
+            buf = self.buf
+            pos = separator.match(buf, self.pos).end()
+            while pos < len(buf) and buf[pos] != ']':
+                try:
+                    value, end = scan_once(buf, pos)
+                except (StopIteration, json.JSONDecodeError):
+                    # Incomplete item at the end of the buffer (or bad JSON, reported once the file is read)
+                    break
+                if not self.eof and (end >= len(buf) or buf[end] not in VALUE_END):
+                    break
+                yield value
+                separator = SEPARATOR
+                pos = SEPARATOR.match(buf, end).end()
+            self.pos = pos
+            
+            if pos < len(buf) and buf[pos] == ']':
+                self.advance(1)
+                return
+            if not self.fill():
+                if self.peek() == '':
+                    raise ValueError("Unexpected end of annotation file inside an array")
+                # Let the decoder report what is wrong with the remaining text
+                self.decode()
+                raise ValueError("Malformed array in annotation file")
+
+
+class VideoSpool:
+    """Converted video entries spooled to a temporary file as encoded JSON, read back by descending score"""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        # Start of every entry plus the end of the last one, and each entry's score
+        self.offsets = array('q', [0])
+        self.scores = array('d')
+
+    def __len__(self):
+        return len(self.scores)
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        self.offsets.append(self.file.tell())
+        self.scores.append(entry['confidenceScore'])
+
+    def ranked(self):
+        """Entry indices by descending score, equal scores in insertion order"""
+        if np is not None:
+            return np.argsort(-np.frombuffer(self.scores, dtype=np.float64), kind='stable')
+        return sorted(range(len(self.scores)), key=self.scores.__getitem__, reverse=True)
+
+    def iter_ranked(self):
+        """Yield the encoded entries (bytes) by descending score"""
+        if not len(self):
+            return
+        self.file.flush()
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for index in self.ranked():
+                yield data[self.offsets[index]:self.offsets[index + 1]]
+
+    def close(self):
+        self.file.close()
+
+
+def iter_batches(records, batch_size=ANNOTATION_BATCH_SIZE):
+    """Group an iterator of records into lists of at most batch_size"""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def find_annotation_files(downloads_dir):
+    """Annotation file candidates under downloads_dir, sorted for a stable output"""
+    downloads_dir = Path(downloads_dir)
+    if not downloads_dir.exists():
+        return []
+    return [json_file for json_file in sorted(downloads_dir.rglob('*.json'))
+            if json_file.name not in NON_ANNOTATION_FILES and not json_file.name.endswith(SIDECAR_SUFFIX)]
+
+
+def annotation_files_signature(downloads_dir):
+    """Hash of every annotation file's path, size and mtime: changes when one is added, edited or removed"""
+    digest = hashlib.sha256()
+    for json_file in find_annotation_files(downloads_dir):
+        try:
+            stats = json_file.stat()
+        except OSError:
+            continue
+        relative = json_file.relative_to(downloads_dir).as_posix()
+        digest.update(f"{relative}:{stats.st_size}:{stats.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def annotation_video_id(json_file_path, video_url, index):
+    """The 8-character ID the frontend knows an annotation result by (from the file path and the URL's video ID)"""
+    # e.g. adobe_stock_11573423, or dolly_out/1000564187.mp4
+    video_id_match = re.search(r'adobe_stock_(\d+)', video_url) or re.search(r'/([^/]+)\.mp4$', video_url)
+    video_id = video_id_match.group(1) if video_id_match else f"annotation_{index}"
+    return hashlib.md5(f"{json_file_path}_{video_id}".encode()).hexdigest()[:8]
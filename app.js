@@ -26,6 +26,8 @@ let scrapingResults = {
 
 // New variable to store ranking results
 let rankingResults = {};
+let rankingIndexEtag = null; // ETag of the last /api/rankings index, sent back as If-None-Match
+let rankingEtags = {}; // Content ETag of each loaded ranking, by folder key
 
 // New variables for enhanced ranking functionality
 let truePosGoal = 100; // Default goal for true positive videos
@@ -100,6 +102,9 @@ async function loadInitialData() {
     }
 }
 
+// ETag of the last annotation data received; the server answers 304 while it is unchanged
+let annotationDataETag = null;
+
 // Load annotation data from the new API endpoint
 async function loadAnnotationData() {
     try {
@@ -107,6 +112,7 @@ async function loadAnnotationData() {
         if (!response.ok) {
             throw new Error(`HTTP ${response.status}`);
         }
+        annotationDataETag = response.headers.get('ETag');
         const data = await response.json();
         
         // Replace the sample data with loaded data
@@ -123,6 +129,41 @@ async function loadAnnotationData() {
 
 // Load ranking results from ranking_results.json files
 async function loadRankingResults() {
+    try {
+        // Use the catalog's ranking index when the file monitor maintains one
+        const indexResponse = await fetch('/api/rankings', {
+            headers: rankingIndexEtag ? { 'If-None-Match': rankingIndexEtag } : {}
+        });
+        if (indexResponse.status === 304) {
+            return false;
+        }
+        if (indexResponse.ok) {
+            const index = await indexResponse.json();
+            const newRankingResults = {};
+            const newRankingEtags = {};
+            let hasChanges = Object.keys(rankingResults).some(folderKey => !(folderKey in index.rankings));
+            
+            // Only rankings whose content ETag changed are transferred again
+            for (const [folderKey, info] of Object.entries(index.rankings)) {
+                if (rankingEtags[folderKey] === info.etag && folderKey in rankingResults) {
+                    newRankingResults[folderKey] = rankingResults[folderKey];
+                } else {
+                    newRankingResults[folderKey] = await fetchRanking(folderKey);
+                    hasChanges = true;
+                }
+                newRankingEtags[folderKey] = info.etag;
+            }
+            
+            rankingResults = newRankingResults;
+            rankingEtags = newRankingEtags;
+            rankingIndexEtag = indexResponse.headers.get('ETag');
+            console.log('Ranking results loaded from the ranking index:', rankingResults);
+            return hasChanges;
+        }
+    } catch (error) {
+        console.log('Ranking index not available, trying the full ranking results:', error);
+    }
+    
     try {
         // Try the API endpoint first
         const apiResponse = await fetch('/api/ranking-results?t=' + Date.now());
@@ -172,6 +213,24 @@ async function loadRankingResults() {
     }
 }
 
+// Fetch one folder's ranking page by page and rebuild the ranking_results.json shape
+async function fetchRanking(folderKey) {
+    const results = [];
+    let page = null;
+    do {
+        const response = await fetch(`/api/rankings/${encodeURIComponent(folderKey)}?offset=${results.length}&limit=1000`);
+        if (!response.ok) {
+            throw new Error(`Failed to load rankings for ${folderKey}`);
+        }
+        page = await response.json();
+        results.push(...page.results);
+    } while (page.results.length > 0 && results.length < page.total);
+    
+    if (page.layout === 'array') return results;
+    if (page.layout === 'plain') return page.meta;
+    return { ...page.meta, results };
+}
+
 // Manual update function triggered by button click
 async function manualUpdate() {
     const button = document.getElementById('updateButton');
@@ -224,17 +283,25 @@ function stopAutoUpdate() {
 // Check for updates to the JSON file and annotation data
 async function checkForUpdates() {
     try {
-        // Check both annotation data and scraped data
-        const [annotationResponse, scrapedResponse] = await Promise.all([
-            fetch('/api/annotation-data?t=' + Date.now()).catch(() => null),
-            fetch('scraped-data.json?t=' + Date.now()).catch(() => null)
-        ]);
+        // Revalidate annotation data first: one ETag comparison covers the whole catalog
+        const annotationHeaders = annotationDataETag ? { 'If-None-Match': annotationDataETag } : {};
+        const annotationResponse = await fetch('/api/annotation-data?t=' + Date.now(), {
+            headers: annotationHeaders
+        }).catch(() => null);
+        
+        if (annotationResponse && annotationResponse.status === 304) {
+            console.log('No new data found (catalog version ' + annotationResponse.headers.get('X-Catalog-Version') + ')');
+            return false;
+        }
+        
+        const scrapedResponse = await fetch('scraped-data.json?t=' + Date.now()).catch(() => null);
         
         let hasUpdates = false;
         let combinedData = {};
         
         // Load annotation data if available
         if (annotationResponse && annotationResponse.ok) {
+            annotationDataETag = annotationResponse.headers.get('ETag');
             const annotationData = await annotationResponse.json();
             Object.assign(combinedData, annotationData);
             console.log('Checked annotation data');
@@ -1927,6 +1994,12 @@ let labelCache = {};
 let labelCacheInitialized = false;
 let pendingLabelUpdates = new Set(); // Track pending backend syncs
 let labelSyncTimeout = null; // Debounce backend syncing
+let labelSyncSeq = 0; // Last backend label sequence number merged into labelCache
+let labelSyncInProgress = false;
+let pendingLabelContexts = {}; // Query each pending label was made in
+let pendingPoolLabels = {}; // Dataset-pool label changes not yet pushed, by pool folder
+let poolLabelSyncTimeout = null; // Debounce pool label syncing
+let labelStats = null; // Backend label counts for the current query and its pools
 
 // Initialize label cache
 async function initializeLabelCache() {
@@ -1945,32 +2018,85 @@ async function initializeLabelCache() {
     return labelCache;
 }
 
-// Get labeled videos from backend (with localStorage fallback) - only call when initializing
+// Get labeled videos: the localStorage copy plus the backend changes made since it was saved - only call when initializing
 async function getLabeledVideosFromBackend() {
     try {
-        // Try to load from backend first
-        const response = await fetch('/api/labels');
-        if (response.ok) {
-            const backendLabels = await response.json();
-            
-            // Also update localStorage to keep it in sync
-            localStorage.setItem('labeledVideos', JSON.stringify(backendLabels));
-            
-            return backendLabels;
-        } else {
+        labelSyncSeq = parseInt(localStorage.getItem('labelSyncSeq') || '0', 10);
+        const labeled = localStorage.getItem('labeledVideos');
+        // Without a sequence number the stored copy cannot be brought up to date, so start over
+        labelCache = labeled && labelSyncSeq > 0 ? JSON.parse(labeled) : {};
+    } catch (error) {
+        console.error('Error getting labeled videos from localStorage:', error);
+        labelCache = {};
+        labelSyncSeq = 0;
+    }
+    
+    try {
+        if (!await pullLabelChanges()) {
             console.warn('Backend labels not available, using localStorage');
         }
     } catch (error) {
         console.warn('Error loading labels from backend:', error);
     }
     
-    // Fallback to localStorage
-    try {
-        const labeled = localStorage.getItem('labeledVideos');
-        return labeled ? JSON.parse(labeled) : {};
-    } catch (error) {
-        console.error('Error getting labeled videos from localStorage:', error);
-        return {};
+    return labelCache;
+}
+
+// Merge the backend's label changes since labelSyncSeq into labelCache; returns false if the backend is unavailable
+async function pullLabelChanges() {
+    const response = await fetch(`/api/labels?since=${labelSyncSeq}`);
+    if (!response.ok) return false;
+    
+    const delta = await response.json();
+    const changedIds = Object.keys(delta.labels);
+    if (delta.reset) {
+        // The backend's history does not reach back to our sequence number: take its full map
+        const localChanges = {};
+        pendingLabelUpdates.forEach(videoId => { localChanges[videoId] = labelCache[videoId]; });
+        labelCache = { ...delta.labels, ...localChanges };
+    } else {
+        changedIds.forEach(videoId => {
+            // Local changes not pushed yet win until the push reports a conflict
+            if (pendingLabelUpdates.has(videoId)) return;
+            if (delta.labels[videoId] === null) {
+                delete labelCache[videoId];
+            } else {
+                labelCache[videoId] = delta.labels[videoId];
+            }
+        });
+    }
+    
+    if (delta.reset || changedIds.length > 0 || delta.seq !== labelSyncSeq) {
+        labelSyncSeq = delta.seq;
+        localStorage.setItem('labeledVideos', JSON.stringify(labelCache));
+        localStorage.setItem('labelSyncSeq', String(labelSyncSeq));
+        applyLabelsToCurrentQuery(delta.reset ? null : changedIds);
+    }
+    return true;
+}
+
+// Reflect labels pulled from the backend in the current query's stored labels (null = all of its videos)
+function applyLabelsToCurrentQuery(videoIds) {
+    if (!currentQuery || currentQuery.isDatasetPool || !currentQuery.videos) return;
+    
+    const key = `labels_${currentQuery.folder}`;
+    const stored = localStorage.getItem(key);
+    const queryLabels = stored ? JSON.parse(stored) : {};
+    const queryVideoIds = new Set(currentQuery.videos.map(video => String(video.id)));
+    
+    let changed = false;
+    (videoIds || [...queryVideoIds]).forEach(videoId => {
+        if (!queryVideoIds.has(String(videoId)) || pendingLabelUpdates.has(videoId)) return;
+        if (labelCache[videoId] === undefined) {
+            delete queryLabels[videoId];
+        } else {
+            queryLabels[videoId] = labelCache[videoId];
+        }
+        changed = true;
+    });
+    
+    if (changed) {
+        localStorage.setItem(key, JSON.stringify(queryLabels));
     }
 }
 
@@ -2043,33 +2169,157 @@ function setVideoLabel(videoId, label) {
     labeledVideos[videoId] = label;
     localStorage.setItem(key, JSON.stringify(labeledVideos));
     
-    // Sync to backend if not TPR annotations
-    if (!currentQuery.isDatasetPool) {
-        syncLabelsToBackend();
+    // Pool samples reuse the query's video IDs, so their labels never enter the main label map
+    if (currentQuery.isDatasetPool) {
+        queuePoolLabelSync({ [videoId]: label });
+    } else {
+        queueLabelSync(videoId, label);
+    }
+}
+
+// Queue a label change for the backend, tagged with the query it was made in
+function queueLabelSync(videoId, label) {
+    if (label === null) {
+        delete labelCache[videoId];
+    } else {
+        labelCache[videoId] = label;
+    }
+    pendingLabelUpdates.add(videoId);
+    pendingLabelContexts[videoId] = getLabelContext();
+    
+    // Batch bursts of label clicks into one push
+    clearTimeout(labelSyncTimeout);
+    labelSyncTimeout = setTimeout(syncLabelsToBackend, 300);
+}
+
+// Query folder and dataset pool (null for the query itself) the current labels belong to
+function getLabelContext() {
+    if (currentQuery.isDatasetPool && currentQuery.originalQuery) {
+        const queryFolder = currentQuery.originalQuery.folder;
+        return { query: queryFolder, pool: currentQuery.folder.slice(`${queryFolder}_pool_`.length) };
+    }
+    return { query: currentQuery.folder, pool: null };
+}
+
+// Queue dataset-pool label changes ({videoId: label|null}) for the backend; `clear` drops the pool's other labels
+function queuePoolLabelSync(labels, clear = false) {
+    const context = getLabelContext();
+    const pending = clear ? { ...context, labels: {}, clear: true } :
+        (pendingPoolLabels[currentQuery.folder] || { ...context, labels: {}, clear: false });
+    Object.assign(pending.labels, labels);
+    pendingPoolLabels[currentQuery.folder] = pending;
+    
+    clearTimeout(poolLabelSyncTimeout);
+    poolLabelSyncTimeout = setTimeout(syncPoolLabelsToBackend, 300);
+}
+
+// Push the queued dataset-pool label changes, one request per pool
+async function syncPoolLabelsToBackend() {
+    const batches = pendingPoolLabels;
+    pendingPoolLabels = {};
+    
+    for (const [folder, batch] of Object.entries(batches)) {
+        try {
+            const response = await fetch('/api/labels/pool', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(batch)
+            });
+            if (!response.ok) {
+                console.warn('Failed to sync dataset pool labels to backend:', folder);
+            }
+        } catch (error) {
+            console.warn('Error syncing dataset pool labels to backend:', error);
+        }
+    }
+    await refreshLabelStats();
+}
+
+// Fetch the backend's label counters for the current query and its pools
+async function refreshLabelStats() {
+    if (!currentQuery) return;
+    
+    try {
+        const response = await fetch(`/api/label-stats?query=${encodeURIComponent(getLabelContext().query)}`);
+        if (response.ok) {
+            labelStats = await response.json();
+        }
+    } catch (error) {
+        console.warn('Error loading label stats from backend:', error);
     }
 }
 
-// Batch sync labels to backend
+// Backend counts ({total, yes, no, tpr}) for the current query, or null if they may be stale
+function getServerLabelStats() {
+    if (!currentQuery || !labelStats || pendingLabelUpdates.size > 0 || labelStats.seq < labelSyncSeq) return null;
+    // A pool's backend counters span every sample ever drawn from it; the current sample is counted locally
+    if (currentQuery.isDatasetPool) return null;
+    
+    if (labelStats.query !== currentQuery.folder) return null;
+    // Labels saved before they carried a query context are only counted locally
+    return labelStats.total > 0 ? labelStats : null;
+}
+
+// Push this client's label changes, then pull everyone else's changes since the last sync
 async function syncLabelsToBackend() {
-    if (pendingLabelUpdates.size === 0) return;
+    if (labelSyncInProgress) return;
+    labelSyncInProgress = true;
     
+    let synced = false;
     try {
-        const response = await fetch('/api/labels', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(labelCache)
-        });
+        if (pendingLabelUpdates.size > 0) {
+            const changes = {};
+            const contexts = {};
+            pendingLabelUpdates.forEach(videoId => {
+                changes[videoId] = labelCache[videoId] ?? null;
+                contexts[videoId] = pendingLabelContexts[videoId];
+            });
+            
+            const response = await fetch('/api/labels/sync', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ baseSeq: labelSyncSeq, changes, contexts })
+            });
+            if (!response.ok) {
+                console.warn('Failed to sync labels to backend');
+                return;
+            }
+            
+            const result = await response.json();
+            Object.keys(changes).forEach(videoId => {
+                // Labels changed again during the request stay pending
+                if ((labelCache[videoId] ?? null) === changes[videoId]) {
+                    pendingLabelUpdates.delete(videoId);
+                    delete pendingLabelContexts[videoId];
+                }
+            });
+            // Another labeler changed these videos first: keep their labels (pulled below)
+            result.conflicts.forEach(conflict => {
+                pendingLabelUpdates.delete(conflict.videoId);
+                delete pendingLabelContexts[conflict.videoId];
+                console.warn(`Label conflict on ${conflict.videoId}: kept backend label`, conflict.serverLabel,
+                             'instead of', conflict.label);
+            });
+            console.log('Labels synced to backend successfully:', result.applied, 'updates,',
+                        result.conflicts.length, 'conflicts');
+        }
         
-        if (response.ok) {
-            console.log('Labels synced to backend successfully:', pendingLabelUpdates.size, 'updates');
-            pendingLabelUpdates.clear();
-        } else {
-            console.warn('Failed to sync labels to backend');
+        synced = await pullLabelChanges();
+        if (synced) {
+            await refreshLabelStats();
         }
     } catch (error) {
         console.warn('Error syncing labels to backend:', error);
+    } finally {
+        labelSyncInProgress = false;
+        // Push changes made while this sync was running (failed pushes wait for the next label change)
+        if (synced && pendingLabelUpdates.size > 0) {
+            syncLabelsToBackend();
+        }
     }
 }
 
@@ -2170,7 +2420,7 @@ function updateLabelingStats() {
         let totalAnnotated = 0;
         let truePositives = 0;
         
-        // Count ALL videos in the pool (including default 'no' labels)
+        // Count ALL videos in the pool sample (including default 'no' labels)
         for (const video of currentQuery.videos) {
             totalAnnotated++; // Count all videos, not just explicitly labeled ones
             const actualLabel = labeledVideos[video.id] || 'no'; // Apply default 'no' label consistently
@@ -2192,6 +2442,7 @@ async function displayLabeling(queryData, preservePage = false) {
     
     // Initialize label cache if not already done
     await initializeLabelCache();
+    await refreshLabelStats();
     
     if (!queryData.videos || queryData.videos.length === 0) {
         mainContent.innerHTML = `
@@ -2604,6 +2855,8 @@ async function clearAllLabels() {
     // Handle TPR labels separately
     if (currentQuery.isDatasetPool) {
         const key = `tpr_labels_${currentQuery.folder}`;
+        // Clear the pool's labels on the backend so its counters follow (the query's labels stay)
+        queuePoolLabelSync({}, true);
         localStorage.removeItem(key);
         console.log('TPR labels cleared from localStorage'); await displayCurrentLabelingPage(currentQuery);
         return;
@@ -2629,6 +2882,9 @@ async function clearAllLabels() {
         const key = `labels_${currentQuery.folder}`; localStorage.removeItem(key); await displayCurrentLabelingPage(currentQuery);
         labelCache = {};
         pendingLabelUpdates.clear();
+        pendingLabelContexts = {};
+        // Keep labelSyncSeq: the next pull sees the clear and resets to the backend's labels
+        localStorage.removeItem('labeledVideos');
         console.log('Labels cleared from localStorage and cache');
     } catch (error) {
         console.error('Error clearing labels from localStorage:', error);
@@ -2657,7 +2913,9 @@ async function exportLabeledVideos(queryData) {
             thumbnail: video.thumbnail,
             duration: video.duration,
             resolution: video.resolution,
-            fileSize: video.fileSize
+            fileSize: video.fileSize,
+            confidenceScore: video.confidenceScore,
+            question: video.question
         }))
     };
     
@@ -2676,7 +2934,7 @@ async function exportLabeledVideos(queryData) {
         
         if (response.ok) {
             const result = await response.json();
-            alert(`Successfully exported ${yesVideos.length} videos to ${result.filename}`);
+            alert(`Exported ${result.added} new videos to ${result.filename} (${result.video_count} total)`);
         } else {
             const error = await response.json();
             throw new Error(error.error || 'Export failed');
@@ -3631,6 +3889,11 @@ function updateTruePosGoal(newGoal) {
 function calculateCurrentTruePositiveRate() {
     if (!currentQuery || !currentQuery.videos) return 0;
     
+    const serverStats = getServerLabelStats();
+    if (serverStats) {
+        return serverStats.tpr;
+    }
+    
     const labeledVideos = getLabeledVideos();
     let truePositives = 0;
     let labeledCount = 0;
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Offline Download Benchmark
+
+Runs the HuggingFace and Adobe Stock downloaders, and the multi-source
+scheduler, against local stand-in HTTP servers serving synthetic mp4
+payloads. The servers can inject latency, 429 throttling and mid-stream
+disconnects, so changes to the download path can be checked for throughput
+and recovery regressions on a machine with no network access.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from download_adobe_videos import AdobeVideoDownloader
+from download_huggingface_videos import HuggingFaceVideoDownloader
+from download_scheduler import AdobeSource, DownloadScheduler, HuggingFaceSource
+from download_utils import MB, aggregate_file_stats
+
+logger = logging.getLogger(__name__)
+
+# Bytes written per socket send (also the pacing granularity of --link-mbps)
+SEND_CHUNK_SIZE = 64 * 1024
+
+# Minimal ftyp box so payloads look like mp4 files to anything sniffing them
+MP4_HEADER = b'\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom'
+
+TARGETS = ['huggingface', 'adobe', 'scheduler']
+
+
+class FaultProfile(NamedTuple):
+    """Faults a benchmark server injects."""
+    latency: float = 0.0          # Seconds before response headers are sent
+    throttle_rate: float = 0.0    # Fraction of requests for byte 0 answered with 429
+    disconnect_rate: float = 0.0  # Fraction of the other requests for byte 0 cut off halfway through the body
+    retry_after: int = 1          # Retry-After sent with each 429
+
+
+SCENARIOS = {
+    'clean': FaultProfile(),
+    'latency': FaultProfile(latency=0.2),
+    'throttle': FaultProfile(throttle_rate=0.2),
+    'disconnect': FaultProfile(disconnect_rate=0.25),
+}
+
+
+class BenchmarkResult(NamedTuple):
+    """Outcome of one benchmark run."""
+    target: str
+    scenario: str
+    workers: int
+    videos: int
+    success: int
+    failed: int
+    bytes: int
+    elapsed: float
+    requests: int
+    throttled: int
+    disconnected: int
+    resumed: int
+    faulted_videos: int
+    recovered_videos: int
+
+    @property
+    def videos_per_second(self) -> float:
+        return self.success / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / MB / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class BenchmarkHandler(BaseHTTPRequestHandler):
+    """Serves the payloads of a BenchmarkServer with Range support and injected faults."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        # Payloads are keyed by video ID: HuggingFace URLs end in the file name, Adobe URLs in the title
+        name = Path(self.path.rstrip('/')).stem
+        payload = server.payloads.get(name)
+        if payload is None:
+            self.send_error(404)
+            return
+
+        start = 0
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            start = int(range_header[6:].split('-', 1)[0] or 0)
+        if start >= len(payload):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(payload)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if server.faults.latency:
+            time.sleep(server.faults.latency)
+
+        # Faults only hit requests for byte 0, so every video can still be completed by resuming.
+        # They are spread evenly (every 1/rate-th request) so small runs still see the configured share.
+        throttle = disconnect = False
+        with server.lock:
+            server.counters['requests'] += 1
+            if start:
+                server.counters['resumed'] += 1
+            else:
+                server.initial_requests += 1
+                throttle = server.fault_due(server.faults.throttle_rate)
+                if not throttle:
+                    server.unthrottled_requests += 1
+                    disconnect = server.fault_due(server.faults.disconnect_rate, server.unthrottled_requests)
+            if throttle or disconnect:
+                server.counters['throttled' if throttle else 'disconnected'] += 1
+                server.faulted.add(name)
+
+        if throttle:
+            self.send_response(429)
+            self.send_header('Retry-After', str(server.faults.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = payload[start:]
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Accept-Ranges', 'bytes')
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{len(payload) - 1}/{len(payload)}')
+        self.end_headers()
+
+        if disconnect:
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        try:
+            for offset in range(0, len(body), SEND_CHUNK_SIZE):
+                self.wfile.write(body[offset:offset + SEND_CHUNK_SIZE])
+                if server.link_rate:
+                    time.sleep(SEND_CHUNK_SIZE / server.link_rate)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BenchmarkServer(ThreadingHTTPServer):
+    """Local HTTP server standing in for a video host."""
+
+    daemon_threads = True
+
+    def __init__(self, payloads: Dict[str, bytes], faults: FaultProfile = FaultProfile(), link_mbps: float = 0.0):
+        """
+        Start serving on a free loopback port.
+
+        Args:
+            payloads: Video ID -> content
+            faults: Faults to inject
+            link_mbps: Per-connection throughput cap in MB/s (0 = unlimited)
+        """
+        super().__init__(('127.0.0.1', 0), BenchmarkHandler)
+        self.payloads = payloads
+        self.link_rate = link_mbps * MB
+        self.lock = threading.Lock()
+        self.completed = set()
+        self.reset(faults)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def reset(self, faults: FaultProfile) -> None:
+        """Clear the counters and set the faults for the next run."""
+        with self.lock:
+            self.faults = faults
+            self.counters = {'requests': 0, 'resumed': 0, 'throttled': 0, 'disconnected': 0}
+            self.initial_requests = 0
+            self.unthrottled_requests = 0
+            self.faulted = set()
+            self.completed = set()
+
+    def fault_due(self, rate: float, count: int = None) -> bool:
+        """Return True if the `count`-th request (default: current request for byte 0) gets a fault at `rate`."""
+        count = self.initial_requests if count is None else count
+        return int(count * rate) != int((count - 1) * rate)
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class LocalAdobeDownloader(AdobeVideoDownloader):
+    """Adobe downloader whose watermarked URLs point at a benchmark server."""
+
+    def __init__(self, base_url: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_url = base_url
+
+    def download_url(self, video_info: Dict[str, Any]) -> str:
+        return f"{self.base_url}/Download/Watermarked/{video_info.get('title')}"
+
+
+def make_payloads(prefix: str, count: int, size: int, seed: int) -> Dict[str, bytes]:
+    """Generate `count` deterministic pseudo-mp4 payloads of `size` bytes."""
+    rng = random.Random(seed)
+    return {
+        f"{prefix}_{i:04d}": MP4_HEADER + rng.randbytes(max(0, size - len(MP4_HEADER)))
+        for i in range(count)
+    }
+
+
+def write_export(directory: Path, source: str, server: BenchmarkServer) -> Tuple[Path, Dict[str, Any]]:
+    """Write an export JSON file in the source's format for every payload on `server`."""
+    videos = []
+    for video_id, payload in server.payloads.items():
+        video = {'id': video_id, 'title': video_id, 'filename': f"{video_id}.mp4",
+                 'sha256': hashlib.sha256(payload).hexdigest()}
+        if source == 'huggingface':
+            video['url'] = f"{server.base_url}/videos/{video_id}.mp4"
+        videos.append(video)
+    data = {'query': f"benchmark {source}", 'exported_videos': videos}
+    json_path = directory / f"{source}_export.json"
+    with open(json_path, 'w') as f:
+        json.dump(data, f)
+    return json_path, data
+
+
+def prepare_downloader(downloader):
+    """Keep a benchmark downloader quiet and away from the real environment."""
+    # Loopback requests must not go through any proxy configured in the environment
+    downloader.session.trust_env = False
+    downloader.show_progress = False
+    # Do not overwrite the real downloaders' published concurrency status
+    if hasattr(downloader.host_limiter, 'status_path'):
+        downloader.host_limiter.status_path = None
+    return downloader
+
+
+def run_target(target: str, workers: int, servers: Dict[str, BenchmarkServer], adaptive: bool) -> Tuple[int, float]:
+    """
+    Download every payload of the target's server(s) into a scratch directory.
+
+    Returns:
+        (bytes of videos on disk afterwards, elapsed seconds)
+    """
+    with tempfile.TemporaryDirectory(prefix='download_benchmark_') as scratch:
+        scratch = Path(scratch)
+        output_dir = scratch / 'video_data'
+        huggingface = adobe = None
+        if target in ('huggingface', 'scheduler'):
+            huggingface = prepare_downloader(HuggingFaceVideoDownloader(
+                str(output_dir), 0, max_workers=workers, per_host_limit=workers, adaptive=adaptive))
+        if target in ('adobe', 'scheduler'):
+            adobe = prepare_downloader(LocalAdobeDownloader(
+                servers['adobe'].base_url, str(output_dir), 0, use_auth=False, adaptive=adaptive))
+
+        started = time.monotonic()
+        if target == 'scheduler':
+            scheduler = DownloadScheduler([HuggingFaceSource(huggingface), AdobeSource(adobe)],
+                                          max_workers=workers, per_host_limit=workers, adaptive=adaptive)
+            if hasattr(scheduler.host_limiter, 'status_path'):
+                scheduler.host_limiter.status_path = None
+            huggingface.show_progress = adobe.show_progress = False
+            exports = {name: [write_export(scratch, name, servers[name])] for name in ('huggingface', 'adobe')}
+            aggregate_file_stats(scheduler.run(exports).items())
+        else:
+            downloader = huggingface or adobe
+            json_path, _ = write_export(scratch, target, servers[target])
+            downloader.process_json_file(json_path)
+        elapsed = time.monotonic() - started
+
+        downloaded = sum(path.stat().st_size for path in output_dir.rglob('*.mp4'))
+        on_disk = {path.stem for path in output_dir.rglob('*.mp4')}
+        for server in servers.values():
+            server.completed = set(server.payloads) & on_disk
+        return downloaded, elapsed
+
+
+def run_benchmark(target: str, scenario: str, workers: int, servers: Dict[str, BenchmarkServer],
+                  adaptive: bool) -> BenchmarkResult:
+    """Run one target at one concurrency level under one scenario."""
+    involved = [servers[name] for name in (['huggingface', 'adobe'] if target == 'scheduler' else [target])]
+    for server in involved:
+        server.reset(SCENARIOS[scenario])
+
+    size, elapsed = run_target(target, workers, servers, adaptive)
+
+    videos = sum(len(server.payloads) for server in involved)
+    success = sum(len(server.completed) for server in involved)
+    counter = lambda key: sum(server.counters[key] for server in involved)
+    return BenchmarkResult(
+        target=target, scenario=scenario, workers=workers, videos=videos, success=success,
+        failed=videos - success, bytes=size, elapsed=elapsed,
+        requests=counter('requests'), throttled=counter('throttled'),
+        disconnected=counter('disconnected'), resumed=counter('resumed'),
+        faulted_videos=sum(len(server.faulted) for server in involved),
+        recovered_videos=sum(len(server.faulted & server.completed) for server in involved),
+    )
+
+
+def print_report(results: List[BenchmarkResult]) -> None:
+    """Print the results as a table."""
+    header = (f"{'target':<12} {'scenario':<11} {'workers':>7} {'ok/total':>9} {'videos/s':>9} {'MB/s':>8} "
+              f"{'requests':>8} {'429s':>5} {'cuts':>5} {'resumes':>7} {'recovered':>9}")
+    print()
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r.target:<12} {r.scenario:<11} {r.workers:>7} {f'{r.success}/{r.videos}':>9} "
+              f"{r.videos_per_second:>9.2f} {r.mb_per_second:>8.1f} {r.requests:>8} {r.throttled:>5} "
+              f"{r.disconnected:>5} {r.resumed:>7} {f'{r.recovered_videos}/{r.faulted_videos}':>9}")
+
+
+def parse_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the downloaders against local stand-in servers")
+
+    parser.add_argument("--targets", default=','.join(TARGETS),
+                        help=f"Comma-separated targets to run (default: {','.join(TARGETS)})")
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS),
+                        help=f"Comma-separated fault scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--workers", "-w", default="1,4,8",
+                        help="Comma-separated concurrency levels (default: 1,4,8; Adobe alone always runs sequentially)")
+    parser.add_argument("--videos", "-n", type=int, default=16, help="Videos per source (default: 16)")
+    parser.add_argument("--size-mb", type=float, default=2.0, help="Size of each video in MB (default: 2)")
+    parser.add_argument("--link-mbps", type=float, default=20.0,
+                        help="Per-connection throughput cap of the stand-in servers in MB/s; 0 = unlimited (default: 20)")
+    parser.add_argument("--no-adaptive", action="store_true", help="Benchmark fixed per-host concurrency instead of AIMD")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic payloads (default: 0)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Show the downloaders' logging")
+
+    args = parser.parse_args()
+
+    # The downloaders log every video; only the report matters here unless asked
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    targets = parse_list(args.targets)
+    scenarios = parse_list(args.scenarios)
+    for name, valid in (('target', TARGETS), ('scenario', SCENARIOS)):
+        for value in targets if name == 'target' else scenarios:
+            if value not in valid:
+                parser.error(f"unknown {name} '{value}' (choose from {', '.join(valid)})")
+    try:
+        worker_levels = sorted({max(1, int(level)) for level in parse_list(args.workers)})
+    except ValueError:
+        parser.error("--workers must be a comma-separated list of integers")
+
+    size = int(args.size_mb * MB)
+    servers = {
+        name: BenchmarkServer(make_payloads(name, args.videos, size, args.seed + i), link_mbps=args.link_mbps)
+        for i, name in enumerate(('huggingface', 'adobe'))
+    }
+    print(f"Benchmarking {', '.join(targets)}: {args.videos} videos x {args.size_mb:g} MB per source, "
+          f"link cap {f'{args.link_mbps:g} MB/s' if args.link_mbps else 'none'}, "
+          f"{'fixed' if args.no_adaptive else 'adaptive'} concurrency")
+
+    results = []
+    try:
+        for scenario in scenarios:
+            for target in targets:
+                # The Adobe downloader only runs one download at a time
+                for workers in ([1] if target == 'adobe' else worker_levels):
+                    print(f"  {target} / {scenario} / {workers} workers...", flush=True)
+                    results.append(run_benchmark(target, scenario, workers, servers,
+                                                 not args.no_adaptive))
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([dict(r._asdict(), videos_per_second=r.videos_per_second, mb_per_second=r.mb_per_second)
+                       for r in results], f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    return 0 if all(r.failed == 0 for r in results) else 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Video Catalog Database
+Embedded SQLite catalog shared by the file monitor (writer) and the web server (reader)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Default location of the catalog database
+CATALOG_DB_PATH = Path('data') / 'catalog.db'
+
+# Monotonic catalog version + content hash of scraped-data.json and signature of the annotation files,
+# written by the file monitor
+CATALOG_VERSION_PATH = Path('data') / 'catalog_version.json'
+
+# Touched by a running file monitor; the version's annotation signature is only current while it is fresh
+MONITOR_HEARTBEAT_PATH = Path('data') / 'monitor_heartbeat'
+MONITOR_HEARTBEAT_INTERVAL = 5  # seconds between heartbeats
+MONITOR_HEARTBEAT_TIMEOUT = 3 * MONITOR_HEARTBEAT_INTERVAL
+
+# Sortable columns exposed to the API, mapped to their indexed database columns
+SORT_COLUMNS = {
+    'title': 'title',
+    'modified': 'modified',
+    'size': 'file_size',
+    'duration': 'duration_seconds',
+    'resolution': 'resolution',
+}
+
+def load_catalog_version(path=CATALOG_VERSION_PATH):
+    """Load the current catalog version info ({'version': int, 'contentHash': str, 'annotationHash': str})"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {'version': 0, 'contentHash': None, 'annotationHash': None}
+
+
+def save_catalog_version(version, content_hash, annotation_hash=None, path=CATALOG_VERSION_PATH):
+    """Atomically persist a new catalog version and return it"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'contentHash': content_hash, 'annotationHash': annotation_hash}, f)
+    os.replace(temp_path, path)
+    return version
+
+
+def touch_monitor_heartbeat(path=MONITOR_HEARTBEAT_PATH):
+    """Record that the file monitor is running"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def clear_monitor_heartbeat(path=MONITOR_HEARTBEAT_PATH):
+    """Record that the file monitor stopped"""
+    Path(path).unlink(missing_ok=True)
+
+
+def monitor_is_live(path=MONITOR_HEARTBEAT_PATH, timeout=MONITOR_HEARTBEAT_TIMEOUT):
+    """Whether a file monitor has touched its heartbeat within `timeout` seconds"""
+    try:
+        return time.time() - Path(path).stat().st_mtime < timeout
+    except OSError:
+        return False
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    query_key TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    subconcept TEXT NOT NULL,
+    query TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    timestamp TEXT,
+    total_results INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queries_category ON queries (category, subconcept);
+
+CREATE TABLE IF NOT EXISTS videos (
+    query_key TEXT NOT NULL,
+    filepath TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    duration TEXT,
+    duration_seconds INTEGER NOT NULL DEFAULT 0,
+    resolution TEXT,
+    file_size INTEGER NOT NULL DEFAULT 0,
+    file_size_label TEXT,
+    modified TEXT,
+    thumbnail TEXT,
+    url TEXT,
+    local_path TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (query_key, filepath)
+);
+CREATE INDEX IF NOT EXISTS idx_videos_id ON videos (id);
+CREATE INDEX IF NOT EXISTS idx_videos_title ON videos (query_key, title);
+CREATE INDEX IF NOT EXISTS idx_videos_modified ON videos (query_key, modified);
+CREATE INDEX IF NOT EXISTS idx_videos_size ON videos (query_key, file_size);
+CREATE INDEX IF NOT EXISTS idx_videos_duration ON videos (query_key, duration_seconds);
+CREATE INDEX IF NOT EXISTS idx_videos_resolution ON videos (resolution);
+
+CREATE TABLE IF NOT EXISTS thumbnails (
+    video_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rankings (
+    folder_key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ranking_entries (
+    folder_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (folder_key, position)
+);
+"""
+
+
+class VideoCatalog:
+    """SQLite catalog of queries, videos and thumbnails (WAL mode, one connection per thread)"""
+
+    def __init__(self, db_path=CATALOG_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.executescript(SCHEMA)
+
+    def get_connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            # WAL lets the web server read while the monitor writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def read_transaction(self):
+        """This thread's connection inside one read transaction, so several reads see the same snapshot"""
+        conn = self.get_connection()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    # ------------------------------------------------------------------
+    # Writers (file monitor)
+    # ------------------------------------------------------------------
+
+    def upsert_query(self, query_key, query_info, category, subconcept):
+        """Insert or update a query row from a scraped-data query entry"""
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.execute(
+                """
+                INSERT INTO queries (query_key, category, subconcept, query, folder,
+                                     timestamp, total_results, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (query_key) DO UPDATE SET
+                    category = excluded.category,
+                    subconcept = excluded.subconcept,
+                    query = excluded.query,
+                    folder = excluded.folder,
+                    timestamp = excluded.timestamp,
+                    total_results = excluded.total_results,
+                    updated_at = excluded.updated_at
+                """,
+                (query_key, category, subconcept, query_info['query'], query_info['folder'],
+                 query_info.get('timestamp'), query_info.get('totalResults', 0), time.time())
+            )
+
+    def upsert_video(self, query_key, video):
+        """Insert or update a video row from a scraped-data video entry"""
+        self.upsert_videos(query_key, [video])
+
+    def upsert_videos(self, query_key, videos):
+        """Insert or update several video rows in a single transaction"""
+        now = time.time()
+        rows = [
+            (query_key, video['filepath'], video['id'], video['title'], video['filename'],
+             video.get('duration'), self.parse_duration(video.get('duration')),
+             video.get('resolution'), video.get('fileSizeBytes', 0), video.get('fileSize'),
+             video.get('modified'), video.get('thumbnail'), video.get('url'),
+             video.get('localPath'), now)
+            for video in videos
+        ]
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.executemany(
+                """
+                INSERT INTO videos (query_key, filepath, id, title, filename, duration,
+                                    duration_seconds, resolution, file_size, file_size_label,
+                                    modified, thumbnail, url, local_path, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (query_key, filepath) DO UPDATE SET
+                    id = excluded.id,
+                    title = excluded.title,
+                    filename = excluded.filename,
+                    duration = excluded.duration,
+                    duration_seconds = excluded.duration_seconds,
+                    resolution = excluded.resolution,
+                    file_size = excluded.file_size,
+                    file_size_label = excluded.file_size_label,
+                    modified = excluded.modified,
+                    thumbnail = excluded.thumbnail,
+                    url = excluded.url,
+                    local_path = excluded.local_path,
+                    updated_at = excluded.updated_at
+                """,
+                rows
+            )
+
+    def upsert_thumbnail(self, video_id, thumbnail_path):
+        """Record that a thumbnail exists for a video"""
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.execute(
+                """
+                INSERT INTO thumbnails (video_id, path, created_at) VALUES (?, ?, ?)
+                ON CONFLICT (video_id) DO UPDATE SET path = excluded.path
+                """,
+                (video_id, str(thumbnail_path), time.time())
+            )
+            thumbnail_url = f"thumbnails/{Path(thumbnail_path).name}"
+            conn.execute("UPDATE videos SET thumbnail = ? WHERE id = ?", (thumbnail_url, video_id))
+
+    def prune_videos(self, query_key, keep_filepaths):
+        """Delete videos of a query that are no longer on disk"""
+        conn = self.get_connection()
+        keep = set(keep_filepaths)
+        with self.write_lock, conn:
+            rows = conn.execute("SELECT filepath FROM videos WHERE query_key = ?", (query_key,)).fetchall()
+            stale = [(query_key, row['filepath']) for row in rows if row['filepath'] not in keep]
+            if stale:
+                conn.executemany("DELETE FROM videos WHERE query_key = ? AND filepath = ?", stale)
+        return len(stale)
+
+    def prune_queries(self, keep_query_keys):
+        """Delete queries (and their videos) whose folders no longer exist"""
+        conn = self.get_connection()
+        keep = set(keep_query_keys)
+        with self.write_lock, conn:
+            rows = conn.execute("SELECT query_key FROM queries").fetchall()
+            stale = [(row['query_key'],) for row in rows if row['query_key'] not in keep]
+            if stale:
+                conn.executemany("DELETE FROM videos WHERE query_key = ?", stale)
+                conn.executemany("DELETE FROM queries WHERE query_key = ?", stale)
+            # Videos scanned under a folder that never became a query
+            conn.execute("DELETE FROM videos WHERE query_key NOT IN (SELECT query_key FROM queries)")
+        return len(stale)
+
+    def get_ranking_signatures(self):
+        """(file size, mtime_ns) of every indexed ranking file, by folder key"""
+        rows = self.get_connection().execute("SELECT folder_key, file_size, mtime_ns FROM rankings").fetchall()
+        return {row['folder_key']: (row['file_size'], row['mtime_ns']) for row in rows}
+
+    def upsert_ranking(self, folder_key, path, file_size, mtime_ns, content):
+        """Index a ranking_results.json file: its results list becomes one row per entry"""
+        data = json.loads(content)
+        if isinstance(data, list):
+            layout, meta, entries = 'array', {}, data
+        elif isinstance(data, dict) and isinstance(data.get('results'), list):
+            layout, entries = 'object', data['results']
+            meta = {key: value for key, value in data.items() if key != 'results'}
+        else:
+            # No results list to page through: the whole file is returned as meta
+            layout, meta, entries = 'plain', data if isinstance(data, dict) else {'value': data}, []
+        etag = hashlib.sha256(content).hexdigest()[:32]
+
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.execute(
+                """
+                INSERT INTO rankings (folder_key, path, file_size, mtime_ns, etag, layout, meta, total, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (folder_key) DO UPDATE SET
+                    path = excluded.path,
+                    file_size = excluded.file_size,
+                    mtime_ns = excluded.mtime_ns,
+                    etag = excluded.etag,
+                    layout = excluded.layout,
+                    meta = excluded.meta,
+                    total = excluded.total,
+                    updated_at = excluded.updated_at
+                """,
+                (folder_key, str(path), file_size, mtime_ns, etag, layout, json.dumps(meta), len(entries), time.time())
+            )
+            conn.execute("DELETE FROM ranking_entries WHERE folder_key = ?", (folder_key,))
+            conn.executemany(
+                "INSERT INTO ranking_entries (folder_key, position, entry) VALUES (?, ?, ?)",
+                ((folder_key, position, json.dumps(entry)) for position, entry in enumerate(entries))
+            )
+        return etag
+
+    def prune_rankings(self, keep_folder_keys):
+        """Delete rankings whose files no longer exist"""
+        conn = self.get_connection()
+        keep = set(keep_folder_keys)
+        with self.write_lock, conn:
+            rows = conn.execute("SELECT folder_key FROM rankings").fetchall()
+            stale = [(row['folder_key'],) for row in rows if row['folder_key'] not in keep]
+            if stale:
+                conn.executemany("DELETE FROM ranking_entries WHERE folder_key = ?", stale)
+                conn.executemany("DELETE FROM rankings WHERE folder_key = ?", stale)
+        return len(stale)
+
+    # ------------------------------------------------------------------
+    # Readers (web server)
+    # ------------------------------------------------------------------
+
+    def list_rankings(self):
+        """Indexed rankings (without entries) and a version tag covering all of them"""
+        rows = self.get_connection().execute(
+            "SELECT folder_key, etag, total, updated_at FROM rankings ORDER BY folder_key"
+        ).fetchall()
+        digest = hashlib.sha256()
+        for row in rows:
+            digest.update(f"{row['folder_key']}\0{row['etag']}\n".encode('utf-8'))
+        rankings = {row['folder_key']: {"etag": row['etag'], "total": row['total'], "updatedAt": row['updated_at']}
+                    for row in rows}
+        return digest.hexdigest()[:32], rankings
+
+    def get_ranking_page(self, folder_key, offset=0, limit=100):
+        """One page of a ranking's entries plus its other top-level fields, or None if it is not indexed"""
+        # The ETag and the entries must come from the same version of the file
+        with self.read_transaction() as conn:
+            row = conn.execute("SELECT * FROM rankings WHERE folder_key = ?", (folder_key,)).fetchone()
+            if row is None:
+                return None
+            entries = conn.execute(
+                "SELECT entry FROM ranking_entries WHERE folder_key = ? AND position >= ? ORDER BY position LIMIT ?",
+                (folder_key, int(offset), int(limit))
+            ).fetchall()
+        return {
+            "folderKey": folder_key,
+            "etag": row['etag'],
+            "layout": row['layout'],
+            "meta": json.loads(row['meta']),
+            "total": row['total'],
+            "offset": int(offset),
+            "limit": int(limit),
+            "results": [json.loads(entry['entry']) for entry in entries],
+        }
+
+    def build_video_filters(self, query_key=None, category=None, subconcept=None,
+                            resolution=None, search=None):
+        """Build a WHERE clause and parameters for video queries"""
+        clauses = []
+        params = []
+        if query_key:
+            clauses.append("v.query_key = ?")
+            params.append(query_key)
+        if category:
+            clauses.append("q.category = ?")
+            params.append(category)
+        if subconcept:
+            clauses.append("q.subconcept = ?")
+            params.append(subconcept)
+        if resolution:
+            clauses.append("v.resolution = ?")
+            params.append(resolution)
+        if search:
+            clauses.append("v.title LIKE ?")
+            params.append(f"%{search}%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def browse_videos(self, sort='title', order='asc', limit=50, offset=0, **filters):
+        """Return one page of videos matching the filters, in API format"""
+        where, params = self.build_video_filters(**filters)
+        column = SORT_COLUMNS.get(sort, 'title')
+        direction = 'DESC' if str(order).lower() == 'desc' else 'ASC'
+        rows = self.get_connection().execute(
+            f"""
+            SELECT v.* FROM videos v JOIN queries q ON q.query_key = v.query_key
+            {where}
+            ORDER BY v.{column} {direction}, v.filepath ASC
+            LIMIT ? OFFSET ?
+            """,
+            params + [int(limit), int(offset)]
+        ).fetchall()
+        return [self.row_to_video(row) for row in rows]
+
+    def count_videos(self, **filters):
+        """Count videos matching the filters"""
+        where, params = self.build_video_filters(**filters)
+        row = self.get_connection().execute(
+            f"SELECT COUNT(*) AS n FROM videos v JOIN queries q ON q.query_key = v.query_key {where}",
+            params
+        ).fetchone()
+        return row['n']
+
+    def list_queries(self, category=None, subconcept=None):
+        """List queries (without videos), optionally filtered by category/subconcept"""
+        clauses = []
+        params = []
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        if subconcept:
+            clauses.append("subconcept = ?")
+            params.append(subconcept)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.get_connection().execute(
+            f"SELECT * FROM queries {where} ORDER BY category, subconcept, folder", params
+        ).fetchall()
+        return [{
+            "key": row['query_key'],
+            "category": row['category'],
+            "subconcept": row['subconcept'],
+            "query": row['query'],
+            "folder": row['folder'],
+            "timestamp": row['timestamp'],
+            "totalResults": row['total_results'],
+        } for row in rows]
+
+    def get_tree(self):
+        """Return the full Category/Subconcept/queries structure (same shape as scraped-data.json)"""
+        conn = self.get_connection()
+        result = {}
+        query_rows = conn.execute(
+            "SELECT * FROM queries ORDER BY category, subconcept, folder, query_key"
+        ).fetchall()
+        videos_by_query = {}
+        for row in conn.execute("SELECT * FROM videos ORDER BY query_key, title, filepath"):
+            videos_by_query.setdefault(row['query_key'], []).append(self.row_to_video(row))
+
+        for row in query_rows:
+            videos = videos_by_query.get(row['query_key'], [])
+            if not videos:
+                continue
+            subconcepts = result.setdefault(row['category'], {})
+            subconcepts.setdefault(row['subconcept'], {"queries": []})["queries"].append({
+                "query": row['query'],
+                "folder": row['folder'],
+                "timestamp": row['timestamp'],
+                "totalResults": len(videos),
+                "videos": videos,
+            })
+        return result
+
+    def row_to_video(self, row):
+        """Convert a video row back into the scraped-data video format"""
+        return {
+            "id": row['id'],
+            "title": row['title'],
+            "filename": row['filename'],
+            "filepath": row['filepath'],
+            "duration": row['duration'],
+            "resolution": row['resolution'],
+            "fileSize": row['file_size_label'],
+            "fileSizeBytes": row['file_size'],
+            "modified": row['modified'],
+            "tags": [],
+            "thumbnail": row['thumbnail'],
+            "url": row['url'],
+            "localPath": row['local_path'],
+        }
+
+    @staticmethod
+    def parse_duration(duration):
+        """Convert an "m:ss" duration string into seconds"""
+        try:
+            minutes, seconds = str(duration).split(':')
+            return int(minutes) * 60 + int(seconds)
+        except (ValueError, AttributeError):
+            return 0
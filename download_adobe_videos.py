@@ -8,28 +8,32 @@ watermarked videos from Adobe Stock using their API endpoint.
 
 import os
 import json
+import importlib.util
+import shutil
 import requests
 import urllib.parse
 from pathlib import Path
 import time
 import argparse
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
-# Selenium imports for browser automation
-try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.service import Service
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    from selenium.common.exceptions import TimeoutException, WebDriverException
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
-    print("Warning: Selenium not installed. Install with: pip install selenium")
-    print("Browser authentication will not be available.")
+from download_utils import (DownloadStats, HostConcurrencyLimiter, IncompleteDownloadError, TransferMetrics,
+                            aggregate_file_stats,
+                            empty_stats, find_json_files, is_export_file, log_download_summary, open_download,
+                            parse_json_file, part_path_for, resumable_download)
+from download_ledger import DownloadLedger
+from adaptive_concurrency import CONCURRENCY_STATUS_PATH, AdaptiveConcurrencyLimiter
+from stream_probe import StreamProbe
+
+# Selenium is imported only when a browser login is actually needed
+SELENIUM_AVAILABLE = importlib.util.find_spec('selenium') is not None
+
+# Trust saved cookies without a network check if they were validated this recently (seconds)
+AUTH_CHECK_TTL = 6 * 60 * 60
+
+# Cookie domains kept from the browser session
+ADOBE_COOKIE_DOMAINS = ['.adobe.com', 'stock.adobe.com', '.stock.adobe.com']
 
 # Set up logging
 logging.basicConfig(
@@ -42,7 +46,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class AdobeVideoDownloader:
-    def __init__(self, base_output_dir: str = "video_data", delay_between_downloads: float = 1.0, use_auth: bool = True):
+    # Source name used for this downloader's jobs in the download ledger
+    LEDGER_SOURCE = 'adobe'
+    
+    def __init__(self, base_output_dir: str = "video_data", delay_between_downloads: float = 1.0, use_auth: bool = True,
+                 ledger: Optional[DownloadLedger] = None, preallocate: bool = False, adaptive: bool = True,
+                 inline_probe: bool = False, auth_ttl: float = AUTH_CHECK_TTL):
         """
         Initialize the downloader.
         
@@ -50,12 +59,34 @@ class AdobeVideoDownloader:
             base_output_dir: Base directory for downloads
             delay_between_downloads: Delay in seconds between downloads to be respectful
             use_auth: Whether to use browser-based authentication (default: True)
+            ledger: Persistent job ledger for crash-resume and skipping known failures (optional)
+            preallocate: Reserve each video's content-length on disk before writing
+            adaptive: Pace downloads by Adobe's 429/5xx responses, Retry-After and latency
+                instead of a fixed delay
+            inline_probe: Tee each download into ffmpeg for its thumbnail and metadata sidecar
+            auth_ttl: Seconds a successful authentication check stays valid (0 always re-checks)
         """
         self.base_output_dir = Path(base_output_dir)
         self.delay = delay_between_downloads
         self.use_auth = use_auth
+        self.ledger = ledger
+        self.preallocate = preallocate
+        self.metrics = TransferMetrics()
+        # Overridden by the multi-source scheduler
+        self.show_progress = True
+        self.bandwidth = None
+        self.adaptive = adaptive
+        self.inline_probe = inline_probe
+        if adaptive:
+            # Downloads run one at a time here; the limiter supplies Retry-After pauses and feedback
+            self.host_limiter = AdaptiveConcurrencyLimiter(1, initial_limit=1, status_path=CONCURRENCY_STATUS_PATH)
+        else:
+            self.host_limiter = HostConcurrencyLimiter(1)
         self.authenticated = False
         self.cookies_file = Path("adobe_stock_cookies.json")
+        self.auth_ttl = auth_ttl
+        # Wall-clock time until which the session is known to be authenticated
+        self.auth_valid_until = 0.0
         
         self.session = requests.Session()
         self.session.headers.update({
@@ -86,6 +117,11 @@ class AdobeVideoDownloader:
             logger.error("Selenium not available. Install with: pip install selenium")
             return False
         
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        from selenium.common.exceptions import WebDriverException
+        
         logger.info("Opening browser for Adobe Stock login...")
         
         # Set up Chrome options
@@ -142,30 +178,32 @@ class AdobeVideoDownloader:
                 logger.warning("No cookies found. Make sure you're logged in.")
                 return False
             
-            # Convert selenium cookies to requests format
-            cookies_dict = {}
-            for cookie in selenium_cookies:
-                if cookie['domain'] in ['.adobe.com', 'stock.adobe.com', '.stock.adobe.com']:
-                    cookies_dict[cookie['name']] = cookie['value']
+            # Keep the Adobe cookies with their expiry times
+            cookies = [
+                {'name': cookie['name'], 'value': cookie['value'], 'domain': cookie['domain'],
+                 'expiry': cookie.get('expiry')}
+                for cookie in selenium_cookies if cookie['domain'] in ADOBE_COOKIE_DOMAINS
+            ]
             
-            logger.info(f"Extracted {len(cookies_dict)} Adobe cookies")
-            
-            # Save cookies to file
-            self.save_cookies(cookies_dict)
+            logger.info(f"Extracted {len(cookies)} Adobe cookies")
             
             # Update session with cookies
-            self.session.cookies.update(cookies_dict)
+            self.session.cookies.update({cookie['name']: cookie['value'] for cookie in cookies})
             
             # Test authentication by accessing a protected page
             test_response = self.session.get("https://stock.adobe.com/search")
             if test_response.status_code == 200:
                 self.authenticated = True
+                self.auth_valid_until = time.time() + self.auth_ttl
                 logger.info("✅ Authentication successful!")
                 print("\n✅ Authentication successful! You can now close the browser.")
             else:
                 logger.warning("Authentication may have failed. Will attempt downloads anyway.")
                 self.authenticated = True  # Try anyway
             
+            # Save cookies to file (validated only if the test above passed)
+            self.save_cookies(cookies, validated_at=time.time() if self.auth_valid_until else 0.0)
+            
             return True
             
         except Exception as e:
@@ -183,6 +221,10 @@ class AdobeVideoDownloader:
         """
         Load saved cookies from file.
         
+        Expired cookies are dropped. If the remaining cookies passed an
+        authentication check within `auth_ttl` seconds they are trusted without
+        contacting Adobe Stock.
+        
         Returns:
             True if cookies loaded successfully, False otherwise
         """
@@ -191,16 +233,32 @@ class AdobeVideoDownloader:
             return False
         
         try:
-            with open(self.cookies_file, 'r') as f:
-                cookies = json.load(f)
+            cookies, validated_at = self.read_cookie_jar()
+            
+            now = time.time()
+            live_cookies = [cookie for cookie in cookies if not cookie.get('expiry') or cookie['expiry'] > now]
+            if len(live_cookies) < len(cookies):
+                logger.info(f"Dropped {len(cookies) - len(live_cookies)} expired cookies")
+            if not live_cookies:
+                logger.warning("⚠️ All saved cookies have expired.")
+                logger.info("Browser authentication will be required to refresh credentials.")
+                return False
+            
+            self.session.cookies.update({cookie['name']: cookie['value'] for cookie in live_cookies})
+            logger.info(f"✅ Loaded {len(live_cookies)} saved cookies from {self.cookies_file}")
             
-            self.session.cookies.update(cookies)
-            logger.info(f"✅ Loaded {len(cookies)} saved cookies from {self.cookies_file}")
+            if now - validated_at < self.auth_ttl:
+                self.authenticated = True
+                self.auth_valid_until = validated_at + self.auth_ttl
+                logger.info(f"✅ Saved cookies were validated {(now - validated_at) / 60:.0f} min ago. "
+                            "Skipping the authentication check.")
+                return True
             
             # Test if the loaded cookies are still valid
             logger.info("Testing if saved cookies are still valid...")
             if self._test_authentication():
                 self.authenticated = True
+                self.save_cookies(live_cookies, validated_at=now)
                 logger.info("✅ Saved cookies are valid. Authentication successful!")
                 return True
             else:
@@ -214,13 +272,43 @@ class AdobeVideoDownloader:
             logger.info("Browser authentication will be required.")
             return False
 
-    def _test_authentication(self) -> bool:
+    def read_cookie_jar(self) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Read the saved cookie jar.
+        
+        Returns:
+            (cookies, validated_at): cookie dicts with name, value, domain and
+            expiry, and when they last passed an authentication check (0 if never).
+            Files from older versions are a plain name-to-value mapping.
+        """
+        with open(self.cookies_file, 'r') as f:
+            data = json.load(f)
+        
+        if 'cookies' not in data or not isinstance(data['cookies'], list):
+            return [{'name': name, 'value': value, 'expiry': None} for name, value in data.items()], 0.0
+        return data['cookies'], float(data.get('validatedAt') or 0.0)
+
+    def _test_authentication(self, force: bool = False) -> bool:
         """
         Internal method to test if current session is authenticated.
         
+        A successful check is cached for `auth_ttl` seconds.
+        
+        Args:
+            force: Contact Adobe Stock even if a recent check succeeded
+        
         Returns:
             True if authenticated, False otherwise
         """
+        if not force and time.time() < self.auth_valid_until:
+            return True
+        
+        authenticated = self.check_authentication()
+        self.auth_valid_until = time.time() + self.auth_ttl if authenticated else 0.0
+        return authenticated
+
+    def check_authentication(self) -> bool:
+        """Test the session against Adobe Stock's download endpoint (network request)."""
         try:
             # Test with the actual download endpoint to see if we get an auth error
             test_video_id = "1557057041"  # This will fail, but we're checking the error type
@@ -275,19 +363,58 @@ class AdobeVideoDownloader:
         
         return False
     
-    def save_cookies(self, cookies: dict) -> bool:
+    def invalidate_authentication(self) -> None:
+        """Forget a cached successful check after Adobe Stock rejected the session."""
+        if not self.use_auth or not self.auth_valid_until:
+            return
+        logger.warning("⚠️ Adobe Stock rejected the saved session. It will be re-checked on the next run.")
+        self.auth_valid_until = 0.0
+        try:
+            cookies, _ = self.read_cookie_jar()
+            self.save_cookies(cookies, validated_at=0.0)
+        except (OSError, ValueError):
+            pass
+
+    def ensure_authenticated(self) -> bool:
+        """
+        Make sure downloads can proceed, logging in through the browser if needed.
+        
+        Returns:
+            False only if browser authentication was required and failed
+        """
+        if not self.is_authenticated():
+            if self.use_auth:
+                logger.info("🔐 Authentication required. Attempting browser authentication...")
+                if not self.authenticate_with_browser():
+                    return False
+                logger.info("✅ Browser authentication successful. Proceeding with downloads.")
+            else:
+                logger.warning("⚠️ Browser authentication is disabled. Please ensure you are logged in to Adobe Stock manually.")
+                logger.warning("You will need to provide cookies or use --no-auth to disable this warning.")
+        else:
+            if self.use_auth:
+                logger.info("✅ Authentication confirmed. Proceeding with downloads.")
+            else:
+                logger.info("Authentication disabled. Proceeding without login.")
+        return True
+    
+    def save_cookies(self, cookies: List[Dict[str, Any]], validated_at: float = 0.0) -> bool:
         """
         Save cookies to file.
         
         Args:
-            cookies: Dictionary of cookies to save
+            cookies: Cookies to save (name, value, domain, expiry)
+            validated_at: When the cookies last passed an authentication check (0 if never)
             
         Returns:
             True if saved successfully, False otherwise
         """
         try:
-            with open(self.cookies_file, 'w') as f:
-                json.dump(cookies, f, indent=2)
+            jar = {'savedAt': time.time(), 'validatedAt': validated_at, 'cookies': cookies}
+            temp_path = self.cookies_file.with_name(self.cookies_file.name + '.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump(jar, f, indent=2)
+            os.replace(temp_path, self.cookies_file)
             
             logger.debug(f"Saved {len(cookies)} cookies to {self.cookies_file}")
             return True
@@ -298,37 +425,59 @@ class AdobeVideoDownloader:
 
     def find_json_files(self, directory: str) -> List[Path]:
         """Find all JSON files in the given directory and subdirectories."""
-        json_files = []
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                if file.endswith('.json'):
-                    json_files.append(Path(root) / file)
-        
-        logger.info(f"Found {len(json_files)} JSON files")
-        return json_files
+        return find_json_files(directory)
     
     def parse_json_file(self, json_path: Path) -> Dict[str, Any]:
         """Parse a JSON file and return its contents."""
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"Parsed {json_path.name} - Query: {data.get('query', 'Unknown')}")
-            return data
-        except Exception as e:
-            logger.error(f"Error parsing {json_path}: {e}")
-            return {}
+        return parse_json_file(json_path)
     
-    def create_output_directory(self, query: str) -> Path:
-        """Create and return the output directory for a given query."""
+    def get_output_directory(self, query: str) -> Path:
+        """Return the output directory for a given query without creating it."""
         # Clean the query name to be filesystem-safe
         safe_query = "".join(c for c in query if c.isalnum() or c in (' ', '-', '_')).rstrip()
         safe_query = safe_query.replace(' ', '_').lower()
-        
-        output_dir = self.base_output_dir / safe_query
+        return self.base_output_dir / safe_query
+    
+    def create_output_directory(self, query: str) -> Path:
+        """Create and return the output directory for a given query."""
+        output_dir = self.get_output_directory(query)
         output_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"Created output directory: {output_dir}")
         return output_dir
     
+    def candidate_filenames(self, video_id: str, video_info: Dict[str, Any]) -> List[str]:
+        """
+        Filenames a video may be saved under, known before any request is made.
+        
+        Without an explicit filename the extension depends on the response
+        content-type, so both .mp4 and .mov are candidates.
+        """
+        if 'filename' in video_info:
+            return [video_info['filename']]
+        safe_title = "".join(c for c in video_info.get('title', video_id) if c.isalnum() or c in (' ', '-', '_'))[:100]
+        base_name = safe_title.replace(' ', '_')
+        return [f"{base_name}.mp4", f"{base_name}.mov"]
+    
+    def find_existing_file(self, video_id: str, video_info: Dict[str, Any], output_dir: Path):
+        """Return the path of an already-downloaded copy of the video in `output_dir`, or None."""
+        for filename in self.candidate_filenames(video_id, video_info):
+            file_path = output_dir / filename
+            if file_path.exists():
+                return file_path
+        return None
+    
+    def find_partial_file(self, video_id: str, video_info: Dict[str, Any], output_dir: Path):
+        """Return the final path of a video whose download left a .part file in `output_dir`, or None."""
+        for filename in self.candidate_filenames(video_id, video_info):
+            file_path = output_dir / filename
+            if part_path_for(file_path).exists():
+                return file_path
+        return None
+    
+    def download_url(self, video_info: Dict[str, Any]) -> str:
+        """Return the watermarked download URL for a video."""
+        return f"https://stock.adobe.com/Download/Watermarked/{video_info.get('title')}"
+    
     def download_video(self, video_id: str, output_path: Path, video_info: Dict[str, Any]) -> bool:
         """
         Download a single video from Adobe Stock.
@@ -341,104 +490,283 @@ class AdobeVideoDownloader:
         Returns:
             True if download was successful, False otherwise
         """
-        url = f"https://stock.adobe.com/Download/Watermarked/{video_info.get('title')}"
+        url = self.download_url(video_info)
+        
+        # Check the disk before issuing any request
+        existing_file = self.find_existing_file(video_id, video_info, output_path)
+        if existing_file:
+            logger.info(f"File already exists: {existing_file.name}")
+            if self.ledger:
+                self.ledger.mark_done(self.LEDGER_SOURCE, video_id, output_path, existing_file)
+            return True
+        
+        if self.ledger:
+            self.ledger.mark_in_flight(self.LEDGER_SOURCE, video_id, output_path)
         
+        probe = None
         try:
             logger.info(f"Downloading video {video_id}: {video_info.get('title', 'Unknown title')[:50]}...")
             
-            response = self.session.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # Get file extension from content-type or default to mp4
-            content_type = response.headers.get('content-type', '')
-            if 'video/mp4' in content_type:
-                extension = '.mp4'
-            elif 'video/quicktime' in content_type:
-                extension = '.mov'
-            else:
-                extension = '.mp4'  # Default fallback
-            
-            # Create filename from video info or use video ID
-            if 'filename' in video_info:
-                filename = video_info['filename']
-            else:
-                safe_title = "".join(c for c in video_info.get('title', video_id) if c.isalnum() or c in (' ', '-', '_'))[:100]
-                filename = f"{safe_title.replace(' ', '_')}{extension}"
-            
-            file_path = output_path / filename
-            
-            # Don't download if file already exists
-            if file_path.exists():
-                logger.info(f"File already exists: {filename}")
-                return True
-            
-            # Download with progress
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            print(f"\rProgress: {progress:.1f}%", end='', flush=True)
-            
-            print()  # New line after progress
-            logger.info(f"Successfully downloaded: {filename} ({downloaded} bytes)")
+            # A known name (explicit, or the one a partial download was started under) needs no
+            # initial request: resumable_download goes straight to a Range request for the rest
+            response = None
+            file_path = self.find_partial_file(video_id, video_info, output_path)
+            if file_path is None and 'filename' in video_info:
+                file_path = output_path / video_info['filename']
+            if file_path is None:
+                # The extension comes from the content-type; 429/5xx are retried, honoring Retry-After
+                response = open_download(self.session, url, limiter=self.host_limiter)
+                mp4_name, mov_name = self.candidate_filenames(video_id, video_info)
+                file_path = output_path / (mov_name if 'video/quicktime' in response.headers.get('content-type', '') else mp4_name)
+            filename = file_path.name
+            
+            # Streams into <filename>.part, resumes with Range after drops, renames when verified
+            probe = StreamProbe.create(file_path) if self.inline_probe else None
+            result = resumable_download(self.session, url, file_path, response=response,
+                                        expected_sha256=video_info.get('sha256'), show_progress=self.show_progress,
+                                        preallocate=self.preallocate, bandwidth=self.bandwidth,
+                                        limiter=self.host_limiter, stream_probe=probe)
+            self.metrics.record(result)
+            
+            logger.info(f"Successfully downloaded: {filename} ({result.size} bytes, {result.mb_per_second:.2f} MB/s)")
+            if self.ledger:
+                self.ledger.mark_done(self.LEDGER_SOURCE, video_id, output_path, file_path)
             return True
             
         except requests.exceptions.RequestException as e:
+            if getattr(e.response, 'status_code', None) in (401, 403):
+                self.invalidate_authentication()
             logger.error(f"Network error downloading video {video_id}: {e}")
-            return False
+            error = e
+        except IncompleteDownloadError as e:
+            logger.error(f"Incomplete download of video {video_id} (partial file kept for resume): {e}")
+            error = e
         except Exception as e:
             logger.error(f"Error downloading video {video_id}: {e}")
-            return False
+            error = e
+        
+        if probe is not None:
+            probe.abort()
+        if self.ledger:
+            self.ledger.mark_failed(self.LEDGER_SOURCE, video_id, output_path, error)
+        return False
+    
+    def log_throughput_summary(self) -> None:
+        """Log per-file and aggregate download throughput."""
+        for line in self.metrics.summary_lines():
+            logger.info(line)
+        if self.adaptive:
+            self.host_limiter.write_status(force=True)
+            for host, state in self.host_limiter.snapshot()['hosts'].items():
+                logger.info(f"Concurrency {host}: limit {state['limit']}, "
+                            f"{state['throttles']} throttled, {state['errors']} errors")
     
-    def process_json_file(self, json_path: Path) -> Dict[str, int]:
+    def log_ledger_summary(self) -> None:
+        """Log the ledger's job counts for this source."""
+        if not self.ledger:
+            return
+        counts = self.ledger.summary(self.LEDGER_SOURCE)
+        logger.info(f"Ledger: {counts['done']} done, {counts['failed']} failed "
+                    f"({counts['permanent_failures']} permanent), {counts['pending']} pending")
+    
+    def plan_downloads(self, json_files: List[Path]) -> Dict[str, Any]:
         """
-        Process a single JSON file and download all videos.
+        Build a download plan over all export files without any network I/O.
+        
+        Every export entry is classified as:
+            download: first occurrence of a video with no copy on disk
+            link:     duplicate occurrence that will be hard-linked from another copy
+            existing: already present in its own query folder
+            failed:   video the download ledger says to skip (known failure)
+            skipped:  entry without a video ID
         
         Returns:
-            Dictionary with download statistics
+            Plan dictionary with the classified entries and per-file totals
         """
-        data = self.parse_json_file(json_path)
-        if not data:
-            return {"total": 0, "success": 0, "failed": 0, "skipped": 0}
-        
-        query = data.get('query', 'unknown_query')
-        exported_videos = data.get('exported_videos', [])
-        
-        if not exported_videos:
-            logger.warning(f"No exported_videos found in {json_path.name}")
-            return {"total": 0, "success": 0, "failed": 0, "skipped": 0}
+        plan = {"files": {}, "download": [], "link": [], "existing": [], "failed": [], "skipped": [], "unique": 0}
+        occurrences_by_id: Dict[str, List[Dict[str, Any]]] = {}
+        
+        for json_path in json_files:
+            data = self.parse_json_file(json_path)
+            exported_videos = data.get('exported_videos', []) if data else []
+            plan["files"][str(json_path)] = len(exported_videos)
+            if not exported_videos:
+                logger.warning(f"No exported_videos found in {json_path.name}")
+                continue
+            
+            output_dir = self.get_output_directory(data.get('query', 'unknown_query'))
+            for i, video in enumerate(exported_videos, 1):
+                video_id = video.get('id')
+                if not video_id:
+                    logger.warning(f"No video ID found for video {i} in {json_path.name}")
+                    plan["skipped"].append({"group": str(json_path), "video": video})
+                    continue
+                occurrences_by_id.setdefault(str(video_id), []).append({
+                    "group": str(json_path),
+                    "video_id": str(video_id),
+                    "video": video,
+                    "output_dir": output_dir,
+                })
+        
+        plan["unique"] = len(occurrences_by_id)
+        
+        for video_id, occurrences in occurrences_by_id.items():
+            source = None
+            for occurrence in occurrences:
+                occurrence["existing"] = self.find_existing_file(video_id, occurrence["video"], occurrence["output_dir"])
+                if occurrence["existing"] and source is None:
+                    source = occurrence["existing"]
+            
+            # Only the first occurrence of a video that is nowhere on disk goes to the network
+            primary = None
+            if source is None:
+                primary = occurrences[0]
+                primary["skip_reason"] = self.ledger.skip_reason(
+                    self.LEDGER_SOURCE, video_id, primary["output_dir"]) if self.ledger else None
+                plan["failed" if primary["skip_reason"] else "download"].append(primary)
+            
+            for occurrence in occurrences:
+                if occurrence is primary:
+                    continue
+                if occurrence["existing"]:
+                    plan["existing"].append(occurrence)
+                else:
+                    occurrence["source"] = source
+                    occurrence["primary"] = primary
+                    plan["link"].append(occurrence)
         
-        output_dir = self.create_output_directory(query)
+        return plan
+    
+    def log_plan(self, plan: Dict[str, Any]) -> None:
+        """Log a summary of a download plan (used for --dry-run)."""
+        total_entries = sum(plan["files"].values())
+        logger.info("="*50)
+        logger.info("DOWNLOAD PLAN")
+        logger.info("="*50)
+        logger.info(f"Export files: {len(plan['files'])}")
+        logger.info(f"Export entries: {total_entries}")
+        logger.info(f"Unique videos: {plan['unique']}")
+        logger.info(f"Already on disk: {len(plan['existing'])}")
+        logger.info(f"Duplicates to hard-link: {len(plan['link'])}")
+        logger.info(f"Videos to download: {len(plan['download'])}")
+        logger.info(f"Known failures (skipped, see --retry-failed): {len(plan['failed'])}")
+        logger.info(f"Entries without ID (skipped): {len(plan['skipped'])}")
+        
+        per_file = {group: {"download": 0, "link": 0, "existing": 0, "failed": 0, "skipped": 0} for group in plan["files"]}
+        for action in ("download", "link", "existing", "failed", "skipped"):
+            for entry in plan[action]:
+                per_file[entry["group"]][action] += 1
+        for group, counts in per_file.items():
+            logger.info(f"  {Path(group).name}: {plan['files'][group]} entries - "
+                        f"{counts['download']} download, {counts['link']} link, "
+                        f"{counts['existing']} on disk, {counts['failed']} known failures, "
+                        f"{counts['skipped']} skipped")
+    
+    def link_file(self, source: Path, target: Path) -> bool:
+        """Hard-link `source` to `target`, falling back to a copy across filesystems."""
+        if target.exists():
+            return True
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, target)
+        except OSError:
+            try:
+                shutil.copy2(source, target)
+            except OSError as e:
+                logger.error(f"Error linking {source} to {target}: {e}")
+                return False
+        logger.info(f"Linked duplicate {target.name} into {target.parent}")
+        return True
+    
+    def execute_plan(self, plan: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        """
+        Run the network and linking stages of a plan.
         
-        stats = {"total": len(exported_videos), "success": 0, "failed": 0, "skipped": 0}
+        Returns:
+            Dictionary mapping each JSON file to its download statistics
+        """
+        stats = DownloadStats()
+        self.count_planned(plan, stats)
+        self.record_plan(plan)
         
-        for i, video in enumerate(exported_videos, 1):
-            video_id = video.get('id')
-            if not video_id:
-                logger.warning(f"No video ID found for video {i} in {json_path.name}")
-                stats["skipped"] += 1
-                continue
+        downloads = plan["download"]
+        for i, entry in enumerate(downloads, 1):
+            logger.info(f"Processing video {i}/{len(downloads)}: {entry['video_id']}")
+            output_dir = entry["output_dir"]
+            output_dir.mkdir(parents=True, exist_ok=True)
             
-            logger.info(f"Processing video {i}/{len(exported_videos)}: {video_id}")
-            
-            if self.download_video(video_id, output_dir, video):
-                stats["success"] += 1
-            else:
-                stats["failed"] += 1
+            # The slot waits out any Retry-After pause Adobe asked for
+            with self.host_limiter.limit(self.download_url(entry["video"])):
+                success = self.download_video(entry["video_id"], output_dir, entry["video"])
+            stats.add(entry["group"], "success" if success else "failed")
             
             # Rate limiting - be respectful to the server
-            if i < len(exported_videos):  # Don't delay after the last download
+            if not self.adaptive and i < len(downloads):  # Don't delay after the last download
                 time.sleep(self.delay)
         
-        return stats
+        self.link_duplicates(plan, stats)
+        return {group: stats.get(group) for group in plan["files"]}
+    
+    def count_planned(self, plan: Dict[str, Any], stats: DownloadStats) -> None:
+        """Record the totals and the entries a plan resolves without downloading."""
+        for group, count in plan["files"].items():
+            stats.add(group, "total", count)
+        for entry in plan["skipped"]:
+            stats.add(entry["group"], "skipped")
+        for entry in plan["existing"]:
+            stats.add(entry["group"], "success")
+        for entry in plan["failed"]:
+            logger.info(f"Skipping video {entry['video_id']}: {entry['skip_reason']}")
+            stats.add(entry["group"], "skipped")
+    
+    def record_plan(self, plan: Dict[str, Any]) -> None:
+        """Register planned downloads as pending and copies already on disk as done in the ledger."""
+        if not self.ledger:
+            return
+        for entry in plan["download"]:
+            self.ledger.mark_pending(self.LEDGER_SOURCE, entry["video_id"], entry["output_dir"])
+        for entry in plan["existing"]:
+            self.ledger.mark_done(self.LEDGER_SOURCE, entry["video_id"], entry["output_dir"], entry["existing"])
+    
+    def link_duplicates(self, plan: Dict[str, Any], stats: DownloadStats) -> None:
+        """Hard-link every planned duplicate from its downloaded (or existing) copy."""
+        for entry in plan["link"]:
+            source = entry["source"]
+            if source is None:
+                primary = entry["primary"]
+                if primary.get("skip_reason"):
+                    stats.add(entry["group"], "skipped")
+                    continue
+                source = self.find_existing_file(primary["video_id"], primary["video"], primary["output_dir"])
+            if source is None:
+                # The copy it depended on failed to download
+                stats.add(entry["group"], "failed")
+                continue
+            
+            target_name = entry["video"].get('filename', source.name)
+            target = entry["output_dir"] / target_name
+            if self.link_file(source, target):
+                if self.ledger:
+                    self.ledger.mark_done(self.LEDGER_SOURCE, entry["video_id"], entry["output_dir"], target)
+                stats.add(entry["group"], "success")
+            else:
+                stats.add(entry["group"], "failed")
+    
+    def process_json_file(self, json_path: Path, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Process a single JSON file and download all videos.
+        
+        Returns:
+            Dictionary with download statistics
+        """
+        plan = self.plan_downloads([json_path])
+        if dry_run:
+            self.log_plan(plan)
+            return empty_stats()
+        
+        return self.execute_plan(plan).get(str(json_path), empty_stats())
     
-    def process_directory(self, directory: str) -> None:
+    def process_directory(self, directory: str, dry_run: bool = False) -> None:
         """Process all JSON files in the given directory."""
         json_files = self.find_json_files(directory)
         
@@ -446,42 +774,39 @@ class AdobeVideoDownloader:
             logger.warning(f"No JSON files found in {directory}")
             return
         
-        total_stats = {"total": 0, "success": 0, "failed": 0, "skipped": 0}
-        
-        for json_file in json_files:
-            logger.info(f"Processing file: {json_file}")
-            stats = self.process_json_file(json_file)
-            
-            # Aggregate stats
-            for key in total_stats:
-                total_stats[key] += stats[key]
-            
-            logger.info(f"File {json_file.name} completed: {stats}")
-        
-        # Final summary
-        logger.info("="*50)
-        logger.info("DOWNLOAD SUMMARY")
-        logger.info("="*50)
-        logger.info(f"Total videos: {total_stats['total']}")
-        logger.info(f"Successfully downloaded: {total_stats['success']}")
-        logger.info(f"Failed downloads: {total_stats['failed']}")
-        logger.info(f"Skipped videos: {total_stats['skipped']}")
+        # Plan over every export first so duplicates are fetched once and linked elsewhere
+        plan = self.plan_downloads(json_files)
+        self.log_plan(plan)
+        if dry_run:
+            return
         
-        success_rate = (total_stats['success'] / total_stats['total']) * 100 if total_stats['total'] > 0 else 0
-        logger.info(f"Success rate: {success_rate:.1f}%")
+        log_download_summary(aggregate_file_stats(self.execute_plan(plan).items()))
+        self.log_throughput_summary()
+        self.log_ledger_summary()
 
 def main():
     parser = argparse.ArgumentParser(description="Download videos from Adobe Stock based on JSON metadata files")
     
     # Create mutually exclusive group for path and folder
     input_group = parser.add_mutually_exclusive_group(required=True)
-    input_group.add_argument("--path", "-p", help="Path to single JSON file containing video metadata")
+    input_group.add_argument("--path", "-p", help="Path to single JSON file (or labeled_videos*.jsonl stream) containing video metadata")
     input_group.add_argument("--folder", "-f", help="Path to folder containing JSON files with video metadata")
     
     parser.add_argument("--output", "-o", default="video_data", help="Base output directory (default: video_data)")
     parser.add_argument("--delay", "-d", type=float, default=1.0, help="Delay between downloads in seconds (default: 1.0)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
     parser.add_argument("--no-auth", action="store_true", help="Disable browser-based authentication (default: False)")
+    parser.add_argument("--auth-ttl", type=float, default=AUTH_CHECK_TTL,
+                        help=f"Seconds to trust saved cookies after a successful check; 0 always re-checks (default: {AUTH_CHECK_TTL})")
+    parser.add_argument("--dry-run", action="store_true", help="Show the download plan (new, duplicate, already on disk) without downloading")
+    parser.add_argument("--ledger", help="Download ledger database (default: <output>/download_ledger.db)")
+    parser.add_argument("--no-ledger", action="store_true", help="Do not record or consult the download ledger")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry videos the ledger recorded as failed")
+    parser.add_argument("--preallocate", action="store_true", help="Reserve each video's full size on disk before writing it")
+    parser.add_argument("--inline-probe", action="store_true",
+                        help="Extract the thumbnail and metadata sidecar from the stream while downloading (needs ffmpeg)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="Use a fixed --delay between downloads instead of adaptive pacing")
     
     args = parser.parse_args()
     
@@ -495,8 +820,8 @@ def main():
             logger.error(f"JSON file not found: {args.path}")
             return 1
         
-        if not json_path.suffix.lower() == '.json':
-            logger.error(f"File must be a JSON file: {args.path}")
+        if not is_export_file(json_path):
+            logger.error(f"File must be a JSON export or a labeled_videos*.jsonl stream: {args.path}")
             return 1
     
     if args.folder:
@@ -509,24 +834,28 @@ def main():
             logger.error(f"Path is not a directory: {args.folder}")
             return 1
     
-    downloader = AdobeVideoDownloader(args.output, args.delay, not args.no_auth)
+    ledger = None
+    if not args.no_ledger:
+        ledger = DownloadLedger(Path(args.ledger) if args.ledger else Path(args.output) / 'download_ledger.db',
+                                retry_failed=args.retry_failed)
+        if ledger.interrupted:
+            logger.info(f"Resuming {ledger.interrupted} downloads interrupted in a previous run")
     
-    if not downloader.is_authenticated():
-        if downloader.use_auth:
-            logger.info("🔐 Authentication required. Attempting browser authentication...")
-            if downloader.authenticate_with_browser():
-                logger.info("✅ Browser authentication successful. Proceeding with downloads.")
-            else:
-                logger.error("❌ Browser authentication failed. Exiting.")
-                return 1
-        else:
-            logger.warning("⚠️ Browser authentication is disabled. Please ensure you are logged in to Adobe Stock manually.")
-            logger.warning("You will need to provide cookies or use --no-auth to disable this warning.")
-    else:
-        if downloader.use_auth:
-            logger.info("✅ Authentication confirmed. Proceeding with downloads.")
+    if args.dry_run:
+        # Planning only looks at the JSON files, the disk and the ledger, so no login is needed
+        downloader = AdobeVideoDownloader(args.output, args.delay, use_auth=False, ledger=ledger)
+        if args.path:
+            downloader.process_json_file(json_path, dry_run=True)
         else:
-            logger.info("Authentication disabled. Proceeding without login.")
+            downloader.process_directory(str(folder_path), dry_run=True)
+        return 0
+    
+    downloader = AdobeVideoDownloader(args.output, args.delay, not args.no_auth, ledger, args.preallocate,
+                                      not args.no_adaptive, args.inline_probe, args.auth_ttl)
+    
+    if not downloader.ensure_authenticated():
+        logger.error("❌ Browser authentication failed. Exiting.")
+        return 1
     
     # Process either single file or folder
     if args.path:
@@ -535,16 +864,9 @@ def main():
         stats = downloader.process_json_file(json_path)
         
         # Display final summary
-        logger.info("="*50)
-        logger.info("DOWNLOAD SUMMARY")
-        logger.info("="*50)
-        logger.info(f"Total videos: {stats['total']}")
-        logger.info(f"Successfully downloaded: {stats['success']}")
-        logger.info(f"Failed downloads: {stats['failed']}")
-        logger.info(f"Skipped videos: {stats['skipped']}")
-        
-        success_rate = (stats['success'] / stats['total']) * 100 if stats['total'] > 0 else 0
-        logger.info(f"Success rate: {success_rate:.1f}%")
+        log_download_summary(stats)
+        downloader.log_throughput_summary()
+        downloader.log_ledger_summary()
         
     elif args.folder:
         # Process folder of JSON files
@@ -6,16 +6,22 @@ This script processes JSON files containing video metadata and downloads
 videos from HuggingFace datasets.
 """
 
-import os
-import json
 import requests
 import urllib.parse
 from pathlib import Path
 import time
 import argparse
-from typing import List, Dict, Any
+import concurrent.futures
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+from download_utils import (DownloadStats, HostConcurrencyLimiter, IncompleteDownloadError,
+                            TransferMetrics, aggregate_file_stats, create_pooled_session, find_json_files,
+                            is_export_file, log_download_summary, parse_json_file, resumable_download)
+from download_ledger import DownloadLedger
+from adaptive_concurrency import CONCURRENCY_STATUS_PATH, AdaptiveConcurrencyLimiter
+from stream_probe import StreamProbe
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,47 +33,60 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class HuggingFaceVideoDownloader:
-    def __init__(self, base_output_dir: str = "video_data", delay_between_downloads: float = 1.0):
+    # Source name used for this downloader's jobs in the download ledger
+    LEDGER_SOURCE = 'huggingface'
+    
+    def __init__(self, base_output_dir: str = "video_data", delay_between_downloads: float = 1.0,
+                 max_workers: int = 1, per_host_limit: int = 4, ledger: Optional[DownloadLedger] = None,
+                 preallocate: bool = False, adaptive: bool = True, inline_probe: bool = False):
         """
         Initialize the downloader.
         
         Args:
             base_output_dir: Base directory for downloads
             delay_between_downloads: Delay in seconds between downloads to be respectful
+                (applied per host slot in concurrent mode; unused when adaptive)
+            max_workers: Global number of concurrent downloads (1 = sequential)
+            per_host_limit: Maximum concurrent downloads from a single host
+            ledger: Persistent job ledger for crash-resume and skipping known failures (optional)
+            preallocate: Reserve each video's content-length on disk before writing
+            adaptive: Pace hosts with AIMD concurrency driven by 429/5xx and latency
+                instead of a fixed delay
+            inline_probe: Tee each download into ffmpeg for its thumbnail and metadata sidecar
         """
         self.base_output_dir = Path(base_output_dir)
         self.delay = delay_between_downloads
+        self.max_workers = max(1, max_workers)
+        self.adaptive = adaptive
+        self.inline_probe = inline_probe
+        if adaptive:
+            self.host_limiter = AdaptiveConcurrencyLimiter(per_host_limit, status_path=CONCURRENCY_STATUS_PATH)
+        else:
+            self.host_limiter = HostConcurrencyLimiter(per_host_limit)
+        # Per-chunk progress lines only make sense when one download runs at a time
+        self.show_progress = self.max_workers == 1
+        self.ledger = ledger
+        self.preallocate = preallocate
+        self.metrics = TransferMetrics()
+        # Shared throughput cap, set by the multi-source scheduler
+        self.bandwidth = None
         
-        self.session = requests.Session()
-        self.session.headers.update({
+        # One pooled session shared by all workers
+        self.session = create_pooled_session({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'application/octet-stream,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
             'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
-        })
+        }, pool_size=self.max_workers)
 
     def find_json_files(self, directory: str) -> List[Path]:
         """Find all JSON files in the given directory and subdirectories."""
-        json_files = []
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                if file.endswith('.json'):
-                    json_files.append(Path(root) / file)
-        
-        logger.info(f"Found {len(json_files)} JSON files")
-        return json_files
+        return find_json_files(directory)
     
     def parse_json_file(self, json_path: Path) -> Dict[str, Any]:
         """Parse a JSON file and return its contents."""
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"Parsed {json_path.name} - Query: {data.get('query', 'Unknown')}")
-            return data
-        except Exception as e:
-            logger.error(f"Error parsing {json_path}: {e}")
-            return {}
+        return parse_json_file(json_path)
     
     def create_output_directory(self, folder_path: str, query: str = None) -> Path:
         """Create and return the output directory based on folder path and query."""
@@ -110,40 +129,73 @@ class HuggingFaceVideoDownloader:
         
         file_path = output_path / filename
         
+        video_id = video_info.get('id', filename)
+        
         # Don't download if file already exists
         if file_path.exists():
             logger.info(f"File already exists: {filename}")
+            if self.ledger:
+                self.ledger.mark_done(self.LEDGER_SOURCE, video_id, output_path, file_path)
             return True
         
+        if self.ledger:
+            self.ledger.mark_in_flight(self.LEDGER_SOURCE, video_id, output_path)
+        
+        probe = StreamProbe.create(file_path) if self.inline_probe else None
         try:
             logger.info(f"Downloading: {filename} from {url}")
             
-            response = self.session.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            # Download with progress
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            progress = (downloaded / total_size) * 100
-                            print(f"\rProgress: {progress:.1f}%", end='', flush=True)
+            # Streams into <filename>.part, resumes with Range after drops, renames when verified
+            result = resumable_download(self.session, url, file_path,
+                                        expected_sha256=video_info.get('sha256'),
+                                        show_progress=self.show_progress, preallocate=self.preallocate,
+                                        bandwidth=self.bandwidth, limiter=self.host_limiter, stream_probe=probe)
+            self.metrics.record(result)
             
-            print()  # New line after progress
-            logger.info(f"Successfully downloaded: {filename} ({downloaded} bytes)")
+            logger.info(f"Successfully downloaded: {filename} ({result.size} bytes, {result.mb_per_second:.2f} MB/s)")
+            if self.ledger:
+                self.ledger.mark_done(self.LEDGER_SOURCE, video_id, output_path, file_path)
             return True
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Network error downloading {filename}: {e}")
-            return False
+            error = e
+        except IncompleteDownloadError as e:
+            logger.error(f"Incomplete download of {filename} (partial file kept for resume): {e}")
+            error = e
         except Exception as e:
             logger.error(f"Error downloading {filename}: {e}")
-            return False
+            error = e
+        
+        if probe is not None:
+            probe.abort()
+        if self.ledger:
+            self.ledger.mark_failed(self.LEDGER_SOURCE, video_id, output_path, error)
+        return False
+    
+    def ledger_skip_reason(self, video_id: str, output_dir: Path) -> Optional[str]:
+        """Return why the ledger says to skip this video on this run, or None to download it."""
+        if not self.ledger:
+            return None
+        return self.ledger.skip_reason(self.LEDGER_SOURCE, video_id, output_dir)
+    
+    def log_throughput_summary(self) -> None:
+        """Log per-file and aggregate download throughput."""
+        for line in self.metrics.summary_lines():
+            logger.info(line)
+        if self.adaptive:
+            self.host_limiter.write_status(force=True)
+            for host, state in self.host_limiter.snapshot()['hosts'].items():
+                logger.info(f"Concurrency {host}: limit {state['limit']}, "
+                            f"{state['throttles']} throttled, {state['errors']} errors")
+    
+    def log_ledger_summary(self) -> None:
+        """Log the ledger's job counts for this source."""
+        if not self.ledger:
+            return
+        counts = self.ledger.summary(self.LEDGER_SOURCE)
+        logger.info(f"Ledger: {counts['done']} done, {counts['failed']} failed "
+                    f"({counts['permanent_failures']} permanent), {counts['pending']} pending")
     
     def download_thumbnail(self, video_info: Dict[str, Any], output_path: Path) -> bool:
         """
@@ -187,6 +239,9 @@ class HuggingFaceVideoDownloader:
         
         output_dir = self.create_output_directory(folder, query)
         
+        if self.max_workers > 1:
+            return self.download_concurrently(self.build_jobs(json_path, exported_videos, output_dir)).get(str(json_path))
+        
         stats = {"total": len(exported_videos), "success": 0, "failed": 0, "skipped": 0}
         
         logger.info(f"Processing {len(exported_videos)} videos for query: {query}")
@@ -198,9 +253,18 @@ class HuggingFaceVideoDownloader:
                 stats["skipped"] += 1
                 continue
             
+            skip_reason = self.ledger_skip_reason(video_id, output_dir)
+            if skip_reason:
+                logger.info(f"Skipping video {i}/{len(exported_videos)}: {video_id} - {skip_reason}")
+                stats["skipped"] += 1
+                continue
+            
             logger.info(f"Processing video {i}/{len(exported_videos)}: {video_id}")
             
-            if self.download_video(video, output_dir):
+            # The slot waits out any Retry-After pause the host asked for
+            with self.host_limiter.limit(video.get('url') or ''):
+                success = self.download_video(video, output_dir)
+            if success:
                 stats["success"] += 1
                 
                 # Optionally download thumbnail
@@ -209,11 +273,83 @@ class HuggingFaceVideoDownloader:
                 stats["failed"] += 1
             
             # Rate limiting - be respectful to the server
-            if i < len(exported_videos):  # Don't delay after the last download
+            if not self.adaptive and i < len(exported_videos):  # Don't delay after the last download
                 time.sleep(self.delay)
         
         return stats
     
+    def build_jobs(self, json_path: Path, exported_videos: List[Dict[str, Any]],
+                   output_dir: Path) -> List[Tuple[str, Dict[str, Any], Path]]:
+        """Turn the exported videos of one JSON file into (group, video, output_dir) jobs."""
+        return [(str(json_path), video, output_dir) for video in exported_videos]
+    
+    def download_job(self, video: Dict[str, Any], output_dir: Path) -> bool:
+        """Download one video while holding a slot for its host (worker entry point)."""
+        url = video.get('url') or ''
+        with self.host_limiter.limit(url):
+            success = self.download_video(video, output_dir)
+            if success:
+                self.download_thumbnail(video, output_dir)
+            if not self.adaptive:
+                # Pace each host slot instead of the whole run
+                time.sleep(self.delay)
+        return success
+    
+    def download_concurrently(self, jobs: List[Tuple[str, Dict[str, Any], Path]]) -> Dict[str, Dict[str, int]]:
+        """
+        Download jobs on a worker pool with global and per-host concurrency caps.
+        
+        Args:
+            jobs: (group, video_info, output_dir) tuples; group is usually the source JSON path
+            
+        Returns:
+            Dictionary mapping each group to its download statistics
+        """
+        stats = DownloadStats()
+        groups = []
+        runnable = []
+        for group, video, output_dir in jobs:
+            if group not in groups:
+                groups.append(group)
+            stats.add(group, "total")
+            if not video.get('id'):
+                logger.warning(f"No video ID found for a video in {group}")
+                stats.add(group, "skipped")
+                continue
+            skip_reason = self.ledger_skip_reason(video['id'], output_dir)
+            if skip_reason:
+                logger.info(f"Skipping {video['id']}: {skip_reason}")
+                stats.add(group, "skipped")
+                continue
+            runnable.append((group, video, output_dir))
+        
+        total = len(jobs)
+        logger.info(f"Downloading {len(runnable)} videos with {self.max_workers} workers "
+                    f"(max {self.host_limiter.per_host_limit} per host)")
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_job = {
+                executor.submit(self.download_job, video, output_dir): (group, video)
+                for group, video, output_dir in runnable
+            }
+            
+            for future in concurrent.futures.as_completed(future_to_job):
+                group, video = future_to_job[future]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.error(f"Error downloading {video.get('id')}: {e}")
+                    success = False
+                stats.add(group, "success" if success else "failed")
+                
+                completed = stats.completed()
+                if completed % 10 == 0 or completed == total:
+                    totals = stats.totals()
+                    logger.info(f"Progress: {completed}/{total} videos "
+                                f"({totals['success']} ok, {totals['failed']} failed, {totals['skipped']} skipped)")
+        
+        return {group: stats.get(group) for group in groups}
+    
     def process_directory(self, directory: str) -> None:
         """Process all JSON files in the given directory."""
         json_files = self.find_json_files(directory)
@@ -222,41 +358,52 @@ class HuggingFaceVideoDownloader:
             logger.warning(f"No JSON files found in {directory}")
             return
         
-        total_stats = {"total": 0, "success": 0, "failed": 0, "skipped": 0}
-        
-        for json_file in json_files:
-            logger.info(f"Processing file: {json_file}")
-            stats = self.process_json_file(json_file)
-            
-            # Aggregate stats
-            for key in total_stats:
-                total_stats[key] += stats[key]
+        if self.max_workers > 1:
+            # Pool the videos of every file so the global cap applies across the whole run
+            jobs = []
+            for json_file in json_files:
+                data = self.parse_json_file(json_file)
+                exported_videos = data.get('exported_videos', []) if data else []
+                if not exported_videos:
+                    logger.warning(f"No exported_videos found in {json_file.name}")
+                    continue
+                output_dir = self.create_output_directory(data.get('folder', ''), data.get('query', 'unknown_query'))
+                jobs.extend(self.build_jobs(json_file, exported_videos, output_dir))
             
-            logger.info(f"File {json_file.name} completed: {stats}")
-        
-        # Final summary
-        logger.info("="*50)
-        logger.info("DOWNLOAD SUMMARY")
-        logger.info("="*50)
-        logger.info(f"Total videos: {total_stats['total']}")
-        logger.info(f"Successfully downloaded: {total_stats['success']}")
-        logger.info(f"Failed downloads: {total_stats['failed']}")
-        logger.info(f"Skipped videos: {total_stats['skipped']}")
-        
-        success_rate = (total_stats['success'] / total_stats['total']) * 100 if total_stats['total'] > 0 else 0
-        logger.info(f"Success rate: {success_rate:.1f}%")
+            file_stats = self.download_concurrently(jobs).items()
+        else:
+            def sequential_stats():
+                for json_file in json_files:
+                    logger.info(f"Processing file: {json_file}")
+                    yield str(json_file), self.process_json_file(json_file)
+            file_stats = sequential_stats()
+        
+        log_download_summary(aggregate_file_stats(file_stats))
+        self.log_throughput_summary()
+        self.log_ledger_summary()
 
 def main():
     parser = argparse.ArgumentParser(description="Download videos from HuggingFace datasets based on JSON metadata files")
     
     # Create mutually exclusive group for path and folder
     input_group = parser.add_mutually_exclusive_group(required=True)
-    input_group.add_argument("--path", "-p", help="Path to single JSON file containing video metadata")
+    input_group.add_argument("--path", "-p", help="Path to single JSON file (or labeled_videos*.jsonl stream) containing video metadata")
     input_group.add_argument("--folder", "-f", help="Path to folder containing JSON files with video metadata")
     
     parser.add_argument("--output", "-o", default="video_data", help="Base output directory (default: video_data)")
     parser.add_argument("--delay", "-d", type=float, default=1.0, help="Delay between downloads in seconds (default: 1.0)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
+    parser.add_argument("--workers", "-w", type=int, default=8, help="Number of concurrent downloads (default: 8)")
+    parser.add_argument("--per-host", type=int, default=4, help="Maximum concurrent downloads per host (default: 4)")
+    parser.add_argument("--sequential", action="store_true", help="Download one video at a time with a fixed --delay between downloads (previous behavior)")
+    parser.add_argument("--ledger", help="Download ledger database (default: <output>/download_ledger.db)")
+    parser.add_argument("--no-ledger", action="store_true", help="Do not record or consult the download ledger")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry videos the ledger recorded as failed")
+    parser.add_argument("--preallocate", action="store_true", help="Reserve each video's full size on disk before writing it")
+    parser.add_argument("--inline-probe", action="store_true",
+                        help="Extract the thumbnail and metadata sidecar from the stream while downloading (needs ffmpeg)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="Use fixed per-host concurrency and --delay instead of adaptive (AIMD) pacing")
     
     args = parser.parse_args()
     
@@ -270,8 +417,8 @@ def main():
             logger.error(f"JSON file not found: {args.path}")
             return 1
         
-        if not json_path.suffix.lower() == '.json':
-            logger.error(f"File must be a JSON file: {args.path}")
+        if not is_export_file(json_path):
+            logger.error(f"File must be a JSON export or a labeled_videos*.jsonl stream: {args.path}")
             return 1
     
     if args.folder:
@@ -284,7 +431,17 @@ def main():
             logger.error(f"Path is not a directory: {args.folder}")
             return 1
     
-    downloader = HuggingFaceVideoDownloader(args.output, args.delay)
+    workers = 1 if args.sequential else args.workers
+    # The previous behavior slept --delay between downloads, which adaptive pacing skips
+    adaptive = not (args.sequential or args.no_adaptive)
+    ledger = None
+    if not args.no_ledger:
+        ledger = DownloadLedger(Path(args.ledger) if args.ledger else Path(args.output) / 'download_ledger.db',
+                                retry_failed=args.retry_failed)
+        if ledger.interrupted:
+            logger.info(f"Resuming {ledger.interrupted} downloads interrupted in a previous run")
+    downloader = HuggingFaceVideoDownloader(args.output, args.delay, workers, args.per_host, ledger, args.preallocate,
+                                            adaptive, args.inline_probe)
     
     # Process either single file or folder
     if args.path:
@@ -293,16 +450,9 @@ def main():
         stats = downloader.process_json_file(json_path)
         
         # Display final summary
-        logger.info("="*50)
-        logger.info("DOWNLOAD SUMMARY")
-        logger.info("="*50)
-        logger.info(f"Total videos: {stats['total']}")
-        logger.info(f"Successfully downloaded: {stats['success']}")
-        logger.info(f"Failed downloads: {stats['failed']}")
-        logger.info(f"Skipped videos: {stats['skipped']}")
-        
-        success_rate = (stats['success'] / stats['total']) * 100 if stats['total'] > 0 else 0
-        logger.info(f"Success rate: {success_rate:.1f}%")
+        log_download_summary(stats)
+        downloader.log_throughput_summary()
+        downloader.log_ledger_summary()
         
     elif args.folder:
         # Process folder of JSON files
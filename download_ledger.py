@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Download Job Ledger
+
+On-disk (SQLite) record of every video download job so interrupted runs
+resume where they stopped and permanently failing videos are not retried.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from download_utils import IncompleteDownloadError
+
+# Job states
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+# HTTP statuses that will not succeed on a later run without intervention
+PERMANENT_STATUSES = {400, 401, 403, 404, 410, 451}
+
+# Back-off before retrying a transient failure on a later run (multiplied by the attempt count)
+TRANSIENT_RETRY_DELAY = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    source TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    reason TEXT,
+    permanent INTEGER NOT NULL DEFAULT 0,
+    retry_after REAL NOT NULL DEFAULT 0,
+    file_path TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (source, video_id, output_dir)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state);
+"""
+
+
+def classify_failure(error: Exception) -> Tuple[str, bool, float]:
+    """
+    Classify a download exception.
+
+    Returns:
+        (reason, permanent, retry_after_seconds)
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        reason = f"HTTP {status}"
+        if status in PERMANENT_STATUSES:
+            return reason, True, 0
+        retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+        if retry_after.isdigit():
+            return reason, False, float(retry_after)
+        return reason, False, TRANSIENT_RETRY_DELAY
+    if isinstance(error, IncompleteDownloadError):
+        return f"Incomplete: {error}", False, 0
+    if isinstance(error, requests.RequestException):
+        return f"Network error: {error.__class__.__name__}", False, TRANSIENT_RETRY_DELAY
+    return f"Error: {error}", False, TRANSIENT_RETRY_DELAY
+
+
+class DownloadLedger:
+    """SQLite-backed job ledger shared by the downloaders (one connection per thread)."""
+
+    def __init__(self, db_path: Path, retry_failed: bool = False):
+        """
+        Initialize the ledger.
+
+        Args:
+            db_path: Path of the SQLite database
+            retry_failed: Retry failed jobs regardless of their classification or retry-after time
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.retry_failed = retry_failed
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.executescript(SCHEMA)
+            # Jobs left in flight by a crash or Ctrl-C resume from their .part files
+            interrupted = conn.execute(
+                "UPDATE jobs SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT)
+            ).rowcount
+        self.interrupted = interrupted
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def get_job(self, source: str, video_id: str, output_dir: Path) -> Optional[sqlite3.Row]:
+        """Return the ledger row for a job, if any."""
+        return self.get_connection().execute(
+            "SELECT * FROM jobs WHERE source = ? AND video_id = ? AND output_dir = ?",
+            (source, str(video_id), str(output_dir))
+        ).fetchone()
+
+    def skip_reason(self, source: str, video_id: str, output_dir: Path) -> Optional[str]:
+        """
+        Return why a job should be skipped on this run, or None to run it.
+
+        Permanent failures are skipped until --retry-failed; transient failures
+        are skipped until their retry-after time has passed.
+        """
+        if self.retry_failed:
+            return None
+        job = self.get_job(source, video_id, output_dir)
+        if job is None or job['state'] != FAILED:
+            return None
+        if job['permanent']:
+            return f"permanent failure ({job['reason']})"
+        if job['retry_after'] > time.time():
+            return f"retry after {time.strftime('%H:%M:%S', time.localtime(job['retry_after']))} ({job['reason']})"
+        return None
+
+    def upsert(self, source: str, video_id: str, output_dir: Path, state: str,
+               reason: Optional[str] = None, permanent: bool = False, retry_after: float = 0,
+               file_path: Optional[Path] = None, count_attempt: bool = False) -> None:
+        """Insert or update a job's state."""
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (source, video_id, output_dir, state, attempts, reason,
+                                  permanent, retry_after, file_path, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source, video_id, output_dir) DO UPDATE SET
+                    state = excluded.state,
+                    attempts = jobs.attempts + excluded.attempts,
+                    reason = excluded.reason,
+                    permanent = excluded.permanent,
+                    retry_after = excluded.retry_after,
+                    file_path = COALESCE(excluded.file_path, jobs.file_path),
+                    updated_at = excluded.updated_at
+                """,
+                (source, str(video_id), str(output_dir), state, 1 if count_attempt else 0, reason,
+                 1 if permanent else 0, retry_after, str(file_path) if file_path else None, time.time())
+            )
+
+    def mark_pending(self, source: str, video_id: str, output_dir: Path) -> None:
+        """Register a job that has not been attempted yet (keeps existing state)."""
+        conn = self.get_connection()
+        with self.write_lock, conn:
+            conn.execute(
+                """
+                INSERT OR IGNORE INTO jobs (source, video_id, output_dir, state, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (source, str(video_id), str(output_dir), PENDING, time.time())
+            )
+
+    def mark_in_flight(self, source: str, video_id: str, output_dir: Path) -> None:
+        """Record that a download attempt started."""
+        self.upsert(source, video_id, output_dir, IN_FLIGHT, count_attempt=True)
+
+    def mark_done(self, source: str, video_id: str, output_dir: Path, file_path: Optional[Path] = None) -> None:
+        """Record a completed download."""
+        self.upsert(source, video_id, output_dir, DONE, file_path=file_path)
+
+    def mark_failed(self, source: str, video_id: str, output_dir: Path, error: Exception) -> None:
+        """Record a failed download, classified as permanent or transient."""
+        reason, permanent, retry_delay = classify_failure(error)
+        job = self.get_job(source, video_id, output_dir)
+        attempts = job['attempts'] if job is not None else 1
+        retry_after = time.time() + retry_delay * max(1, attempts) if retry_delay else 0
+        self.upsert(source, video_id, output_dir, FAILED, reason=reason,
+                    permanent=permanent, retry_after=retry_after)
+
+    def summary(self, source: Optional[str] = None) -> Dict[str, int]:
+        """Return job counts by state (permanent failures reported separately)."""
+        where = "WHERE source = ?" if source else ""
+        params = (source,) if source else ()
+        rows = self.get_connection().execute(
+            f"SELECT state, permanent, COUNT(*) AS n FROM jobs {where} GROUP BY state, permanent", params
+        ).fetchall()
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0, 'permanent_failures': 0}
+        for row in rows:
+            counts[row['state']] += row['n']
+            if row['state'] == FAILED and row['permanent']:
+                counts['permanent_failures'] += row['n']
+        return counts
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Multi-Source Download Scheduler
+
+Downloads the exports of every source (Adobe Stock, HuggingFace) in one run
+with a shared connection pool, a global concurrency and bandwidth budget,
+and fair interleaving across sources and queries.
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+from download_adobe_videos import AdobeVideoDownloader
+from download_huggingface_videos import HuggingFaceVideoDownloader
+from download_ledger import DownloadLedger
+from adaptive_concurrency import CONCURRENCY_STATUS_PATH, AdaptiveConcurrencyLimiter
+from download_utils import (MB, BandwidthLimiter, DownloadStats, HostConcurrencyLimiter, TransferMetrics,
+                            aggregate_file_stats, create_pooled_adapter, find_json_files,
+                            log_download_summary, mount_adapter, parse_json_file)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between dispatch passes while every host with queued jobs is at its limit or paused
+DISPATCH_POLL_INTERVAL = 0.1
+
+
+class DownloadJob(NamedTuple):
+    """One video to fetch from the network."""
+    source: str                 # Adapter name
+    group: str                  # Export JSON file the video came from (for statistics)
+    queue: str                  # Fairness queue within the source (one per query folder)
+    video_id: str
+    video: Dict[str, Any]
+    output_dir: Path
+    url: str                    # Used for per-host limiting
+
+
+class SourceAdapter(ABC):
+    """How one source turns its exports into jobs, authenticates and downloads."""
+
+    name = 'source'
+
+    def __init__(self, downloader):
+        self.downloader = downloader
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        """Whether an export (auto-detected from a mixed folder) belongs to this source."""
+        return False
+
+    def authenticate(self) -> bool:
+        """Prepare the source's session; False aborts the run."""
+        return True
+
+    @abstractmethod
+    def plan(self, exports: List[Tuple[Path, Dict[str, Any]]], stats: DownloadStats) -> List[DownloadJob]:
+        """Count the exports' videos in `stats` and return the ones that need downloading."""
+
+    @abstractmethod
+    def download(self, job: DownloadJob) -> bool:
+        """Download one job's video."""
+
+    def finish(self, stats: DownloadStats) -> None:
+        """Work that must wait until every download has finished."""
+
+
+class HuggingFaceSource(SourceAdapter):
+    """HuggingFace dataset exports: direct file URLs, one folder per export folder."""
+
+    name = HuggingFaceVideoDownloader.LEDGER_SOURCE
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        return any(urlparse(video.get('url') or '').netloc.endswith('huggingface.co')
+                   for video in data.get('exported_videos', []))
+
+    def plan(self, exports: List[Tuple[Path, Dict[str, Any]]], stats: DownloadStats) -> List[DownloadJob]:
+        jobs = []
+        for json_path, data in exports:
+            group = str(json_path)
+            exported_videos = data.get('exported_videos', [])
+            stats.add(group, "total", len(exported_videos))
+            if not exported_videos:
+                logger.warning(f"No exported_videos found in {json_path.name}")
+                continue
+
+            output_dir = self.downloader.create_output_directory(data.get('folder', ''), data.get('query', 'unknown_query'))
+            for video in exported_videos:
+                video_id = video.get('id')
+                if not video_id:
+                    logger.warning(f"No video ID found for a video in {json_path.name}")
+                    stats.add(group, "skipped")
+                    continue
+                skip_reason = self.downloader.ledger_skip_reason(video_id, output_dir)
+                if skip_reason:
+                    logger.info(f"Skipping {video_id}: {skip_reason}")
+                    stats.add(group, "skipped")
+                    continue
+                jobs.append(DownloadJob(self.name, group, str(output_dir), str(video_id), video,
+                                        output_dir, video.get('url') or ''))
+        return jobs
+
+    def download(self, job: DownloadJob) -> bool:
+        success = self.downloader.download_video(job.video, job.output_dir)
+        if success:
+            self.downloader.download_thumbnail(job.video, job.output_dir)
+        return success
+
+
+class AdobeSource(SourceAdapter):
+    """Adobe Stock exports: watermarked URLs built from the title, browser-cookie auth, one folder per query."""
+
+    name = AdobeVideoDownloader.LEDGER_SOURCE
+
+    def __init__(self, downloader: AdobeVideoDownloader):
+        super().__init__(downloader)
+        self.download_plan: Optional[Dict[str, Any]] = None
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        # Adobe exports are the default for any export not recognized by another source;
+        # other JSON in the folder (query metadata, ranking results) has no exported videos
+        return bool(data.get('exported_videos'))
+
+    def authenticate(self) -> bool:
+        return self.downloader.ensure_authenticated()
+
+    def plan(self, exports: List[Tuple[Path, Dict[str, Any]]], stats: DownloadStats) -> List[DownloadJob]:
+        # The Adobe planner dedupes across exports; only first copies go to the network
+        self.download_plan = self.downloader.plan_downloads([json_path for json_path, _ in exports])
+        self.downloader.count_planned(self.download_plan, stats)
+        return [
+            DownloadJob(self.name, entry["group"], str(entry["output_dir"]), entry["video_id"], entry["video"],
+                        entry["output_dir"], self.downloader.download_url(entry["video"]))
+            for entry in self.download_plan["download"]
+        ]
+
+    def download(self, job: DownloadJob) -> bool:
+        job.output_dir.mkdir(parents=True, exist_ok=True)
+        return self.downloader.download_video(job.video_id, job.output_dir, job.video)
+
+    def finish(self, stats: DownloadStats) -> None:
+        if self.download_plan is not None:
+            self.downloader.link_duplicates(self.download_plan, stats)
+
+
+def round_robin(sequences: List[List[Any]]) -> List[Any]:
+    """Interleave sequences one item at a time: a1, b1, c1, a2, b2, ..."""
+    sentinel = object()
+    return [item for batch in itertools.zip_longest(*sequences, fillvalue=sentinel)
+            for item in batch if item is not sentinel]
+
+
+def interleave_jobs(jobs_by_source: Dict[str, List[DownloadJob]]) -> List[DownloadJob]:
+    """Order jobs fairly: alternate between sources, and within a source between queries."""
+    per_source = []
+    for jobs in jobs_by_source.values():
+        queues: Dict[str, List[DownloadJob]] = OrderedDict()
+        for job in jobs:
+            queues.setdefault(job.queue, []).append(job)
+        per_source.append(round_robin(list(queues.values())))
+    return round_robin(per_source)
+
+
+def queue_by_host(jobs: List[DownloadJob]) -> Dict[str, Deque[Tuple[int, DownloadJob]]]:
+    """Split ordered jobs into per-host queues, keeping each job's position in the fair order."""
+    queues: Dict[str, Deque[Tuple[int, DownloadJob]]] = OrderedDict()
+    for position, job in enumerate(jobs):
+        queues.setdefault(urlparse(job.url).netloc, deque()).append((position, job))
+    return queues
+
+
+class DownloadScheduler:
+    """Runs the jobs of several sources on one worker pool with shared budgets."""
+
+    def __init__(self, adapters: List[SourceAdapter], max_workers: int = 8, per_host_limit: int = 4,
+                 bandwidth_limit: Optional[float] = None, adaptive: bool = True):
+        """
+        Initialize the scheduler.
+
+        Args:
+            adapters: Source adapters taking part in the run
+            max_workers: Global number of concurrent downloads across all sources
+            per_host_limit: Maximum concurrent downloads from a single host
+            bandwidth_limit: Combined throughput cap in MB/s (None = unlimited)
+            adaptive: Adjust each host's concurrency (up to per_host_limit) with AIMD
+                instead of fixed slots plus each source's delay
+        """
+        self.adapters = OrderedDict((adapter.name, adapter) for adapter in adapters)
+        self.max_workers = max(1, max_workers)
+        self.adaptive = adaptive
+        if adaptive:
+            self.host_limiter = AdaptiveConcurrencyLimiter(per_host_limit, status_path=CONCURRENCY_STATUS_PATH)
+        else:
+            self.host_limiter = HostConcurrencyLimiter(per_host_limit)
+        self.bandwidth = BandwidthLimiter(bandwidth_limit * MB) if bandwidth_limit else None
+        self.metrics = TransferMetrics()
+
+        # Every source keeps its own headers and cookies but draws from one connection pool
+        pool = create_pooled_adapter(self.max_workers)
+        for adapter in self.adapters.values():
+            downloader = adapter.downloader
+            mount_adapter(downloader.session, pool)
+            downloader.bandwidth = self.bandwidth
+            downloader.metrics = self.metrics
+            downloader.show_progress = self.max_workers == 1
+            # One limiter sees every source's responses, so feedback from a host is shared
+            downloader.host_limiter = self.host_limiter
+            downloader.adaptive = adaptive
+
+    def classify_exports(self, directory: str) -> Dict[str, List[Tuple[Path, Dict[str, Any]]]]:
+        """Assign every export in a mixed folder to the first adapter that recognizes it."""
+        exports = {name: [] for name in self.adapters}
+        for json_path in find_json_files(directory):
+            data = parse_json_file(json_path)
+            for name, adapter in self.adapters.items():
+                if adapter.matches(data):
+                    exports[name].append((json_path, data))
+                    break
+            else:
+                logger.debug(f"Skipping {json_path.name}: not a video export")
+        return exports
+
+    def take_next_job(self, queues: Dict[str, Deque[Tuple[int, DownloadJob]]]) -> Optional[DownloadJob]:
+        """
+        Take the earliest queued job whose host has a free slot, claiming that slot.
+
+        Returns:
+            The job, or None when every host with queued jobs is at its limit or paused
+        """
+        for host in sorted(queues, key=lambda host: queues[host][0][0]):
+            _, job = queues[host][0]
+            if self.host_limiter.try_acquire(job.url):
+                queues[host].popleft()
+                if not queues[host]:
+                    del queues[host]
+                return job
+        return None
+
+    def run_job(self, job: DownloadJob) -> bool:
+        """Download one job on the host slot claimed for it by the dispatcher (worker entry point)."""
+        adapter = self.adapters[job.source]
+        try:
+            success = adapter.download(job)
+            if not self.adaptive:
+                # Pace each host slot with the source's own delay
+                time.sleep(adapter.downloader.delay)
+        finally:
+            self.host_limiter.release(job.url)
+        return success
+
+    def run(self, exports: Dict[str, List[Tuple[Path, Dict[str, Any]]]]) -> Dict[str, Dict[str, int]]:
+        """
+        Download the exports of every source.
+
+        Args:
+            exports: Adapter name -> list of (json_path, parsed export) pairs
+
+        Returns:
+            Dictionary mapping each export file to its download statistics
+        """
+        stats = DownloadStats()
+        jobs_by_source = OrderedDict()
+        for name, adapter in self.adapters.items():
+            source_exports = exports.get(name, [])
+            if not source_exports:
+                continue
+            if not adapter.authenticate():
+                logger.error(f"❌ Authentication for {name} failed; skipping its {len(source_exports)} exports")
+                continue
+            jobs_by_source[name] = adapter.plan(source_exports, stats)
+            logger.info(f"{name}: {len(source_exports)} exports, {len(jobs_by_source[name])} videos to download")
+
+        jobs = interleave_jobs(jobs_by_source)
+        logger.info(f"Downloading {len(jobs)} videos with {self.max_workers} workers "
+                    f"(max {self.host_limiter.per_host_limit} per host"
+                    f"{f', {self.bandwidth.rate / MB:.1f} MB/s total' if self.bandwidth else ''})")
+
+        # A worker only gets a job whose host has a free slot, so a throttled or paused host
+        # never ties up the pool while other hosts' jobs wait behind it
+        queues = queue_by_host(jobs)
+        in_flight: Dict[concurrent.futures.Future, DownloadJob] = {}
+        done = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while queues or in_flight:
+                while len(in_flight) < self.max_workers:
+                    job = self.take_next_job(queues)
+                    if job is None:
+                        break
+                    in_flight[executor.submit(self.run_job, job)] = job
+
+                if not in_flight:
+                    # Every remaining host is paused by Retry-After
+                    time.sleep(DISPATCH_POLL_INTERVAL)
+                    continue
+
+                # Wake up periodically as well: a pause can end or a limit grow without a download finishing
+                finished, _ = concurrent.futures.wait(in_flight, timeout=DISPATCH_POLL_INTERVAL,
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    job = in_flight.pop(future)
+                    try:
+                        success = future.result()
+                    except Exception as e:
+                        logger.error(f"Error downloading {job.source} video {job.video_id}: {e}")
+                        success = False
+                    stats.add(job.group, "success" if success else "failed")
+
+                    done += 1
+                    if done % 10 == 0 or done == len(jobs):
+                        totals = stats.totals()
+                        logger.info(f"Progress: {done}/{len(jobs)} downloads "
+                                    f"({totals['success']} ok, {totals['failed']} failed, {totals['skipped']} skipped)")
+
+        for name in jobs_by_source:
+            self.adapters[name].finish(stats)
+
+        groups = [str(json_path) for source_exports in exports.values() for json_path, _ in source_exports]
+        return {group: stats.get(group) for group in groups}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download Adobe Stock and HuggingFace exports in one scheduled run")
+
+    parser.add_argument("--adobe", action="append", default=[], help="Folder of Adobe Stock export JSON files (repeatable)")
+    parser.add_argument("--huggingface", action="append", default=[], help="Folder of HuggingFace export JSON files (repeatable)")
+    parser.add_argument("--folder", "-f", action="append", default=[],
+                        help="Folder of mixed exports; the source is detected from the video URLs (repeatable)")
+
+    parser.add_argument("--output", "-o", default="video_data", help="Base output directory (default: video_data)")
+    parser.add_argument("--delay", "-d", type=float, default=1.0, help="Delay between downloads per host slot in seconds (default: 1.0)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
+    parser.add_argument("--workers", "-w", type=int, default=8, help="Concurrent downloads across all sources (default: 8)")
+    parser.add_argument("--per-host", type=int, default=4, help="Maximum concurrent downloads per host (default: 4)")
+    parser.add_argument("--bandwidth", type=float, help="Combined bandwidth cap in MB/s (default: unlimited)")
+    parser.add_argument("--no-auth", action="store_true", help="Disable browser-based Adobe Stock authentication")
+    parser.add_argument("--ledger", help="Download ledger database (default: <output>/download_ledger.db)")
+    parser.add_argument("--no-ledger", action="store_true", help="Do not record or consult the download ledger")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry videos the ledger recorded as failed")
+    parser.add_argument("--preallocate", action="store_true", help="Reserve each video's full size on disk before writing it")
+    parser.add_argument("--inline-probe", action="store_true",
+                        help="Extract the thumbnail and metadata sidecar from the stream while downloading (needs ffmpeg)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="Use fixed per-host concurrency and --delay instead of adaptive (AIMD) pacing")
+
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    folders = args.adobe + args.huggingface + args.folder
+    if not folders:
+        parser.error("at least one of --adobe, --huggingface or --folder is required")
+    for folder in folders:
+        if not Path(folder).is_dir():
+            logger.error(f"Folder not found: {folder}")
+            return 1
+
+    ledger = None
+    if not args.no_ledger:
+        ledger = DownloadLedger(Path(args.ledger) if args.ledger else Path(args.output) / 'download_ledger.db',
+                                retry_failed=args.retry_failed)
+        if ledger.interrupted:
+            logger.info(f"Resuming {ledger.interrupted} downloads interrupted in a previous run")
+
+    # HuggingFace is listed first so auto-detection checks its URLs before falling back to Adobe
+    huggingface = HuggingFaceSource(HuggingFaceVideoDownloader(args.output, args.delay, args.workers, args.per_host,
+                                                               ledger, args.preallocate,
+                                                               inline_probe=args.inline_probe))
+    adobe = AdobeSource(AdobeVideoDownloader(args.output, args.delay, not args.no_auth, ledger, args.preallocate,
+                                             inline_probe=args.inline_probe))
+    scheduler = DownloadScheduler([huggingface, adobe], args.workers, args.per_host, args.bandwidth,
+                                  not args.no_adaptive)
+
+    exports = {huggingface.name: [], adobe.name: []}
+    for folder in args.folder:
+        for name, source_exports in scheduler.classify_exports(folder).items():
+            exports[name].extend(source_exports)
+    for adapter, source_folders in ((adobe, args.adobe), (huggingface, args.huggingface)):
+        for folder in source_folders:
+            exports[adapter.name].extend((json_path, parse_json_file(json_path)) for json_path in find_json_files(folder))
+
+    log_download_summary(aggregate_file_stats(scheduler.run(exports).items()))
+    huggingface.downloader.log_throughput_summary()
+    huggingface.downloader.log_ledger_summary()
+    adobe.downloader.log_ledger_summary()
+
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+"""
+Shared Download Utilities
+
+Concurrency primitives, session helpers and resumable file transfers
+used by the video downloaders.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from adaptive_concurrency import parse_retry_after
+from label_export import EXPORT_STREAM_NAME
+from stream_probe import SIDECAR_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+STAT_KEYS = ("total", "success", "failed", "skipped")
+
+# Suffix for in-progress downloads; the final name only appears once the file is complete
+PART_SUFFIX = '.part'
+
+# Marker kept next to a preallocated .part file; its size says nothing about progress until truncated
+PREALLOC_SUFFIX = '.prealloc'
+
+# Read sizes adapt between these bounds, aiming for one read every TARGET_READ_SECONDS
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+TARGET_READ_SECONDS = 0.25
+
+# Minimum seconds between progress lines
+PROGRESS_INTERVAL = 0.5
+
+MB = 1024 * 1024
+
+
+class IncompleteDownloadError(Exception):
+    """Raised when a transfer ends before the expected length or fails its checksum."""
+
+
+def empty_stats() -> Dict[str, int]:
+    """Return a zeroed statistics dictionary."""
+    return {key: 0 for key in STAT_KEYS}
+
+
+def is_export_file(path: Path) -> bool:
+    """
+    True for JSON exports and labeled-video export streams (labeled_videos*.jsonl).
+
+    Other JSONL files, such as the label journal in data/, are not video exports,
+    and neither are the per-video metadata sidecars (*.meta.json).
+    """
+    name = Path(path).name.lower()
+    if name.endswith('.json'):
+        return not name.endswith(SIDECAR_SUFFIX)
+    return name.endswith('.jsonl') and name.startswith(Path(EXPORT_STREAM_NAME).stem)
+
+
+def find_json_files(directory: str) -> List[Path]:
+    """Find all JSON exports (and JSONL export streams) in the given directory and subdirectories."""
+    json_files = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if is_export_file(Path(file)):
+                json_files.append(Path(root) / file)
+
+    logger.info(f"Found {len(json_files)} JSON files")
+    return json_files
+
+
+def parse_json_file(json_path: Path) -> Dict[str, Any]:
+    """
+    Parse an export file and return its contents (empty dict on error).
+
+    A JSONL export stream (one video record per line, see label_export.py) is
+    returned in the JSON export shape, taking query and folder from its records.
+    """
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            if json_path.suffix == '.jsonl':
+                videos = [json.loads(line) for line in f if line.strip()]
+                first = videos[0] if videos else {}
+                data = {'query': first.get('query', ''), 'folder': first.get('folder', ''), 'exported_videos': videos}
+            else:
+                data = json.load(f)
+        logger.info(f"Parsed {json_path.name} - Query: {data.get('query', 'Unknown')}")
+        return data
+    except Exception as e:
+        logger.error(f"Error parsing {json_path}: {e}")
+        return {}
+
+
+def aggregate_file_stats(file_stats: Iterable[Tuple[str, Dict[str, int]]]) -> Dict[str, int]:
+    """Log each export file's statistics and return their sum."""
+    total_stats = empty_stats()
+    for group, stats in file_stats:
+        for key in total_stats:
+            total_stats[key] += stats[key]
+        logger.info(f"File {Path(group).name} completed: {stats}")
+    return total_stats
+
+
+def log_download_summary(stats: Dict[str, int]) -> None:
+    """Log the final download summary."""
+    logger.info("="*50)
+    logger.info("DOWNLOAD SUMMARY")
+    logger.info("="*50)
+    logger.info(f"Total videos: {stats['total']}")
+    logger.info(f"Successfully downloaded: {stats['success']}")
+    logger.info(f"Failed downloads: {stats['failed']}")
+    logger.info(f"Skipped videos: {stats['skipped']}")
+
+    success_rate = (stats['success'] / stats['total']) * 100 if stats['total'] > 0 else 0
+    logger.info(f"Success rate: {success_rate:.1f}%")
+
+
+def create_pooled_adapter(pool_size: int = 10) -> HTTPAdapter:
+    """Create an HTTP adapter whose connection pool can serve `pool_size` concurrent workers."""
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+
+def mount_adapter(session: requests.Session, adapter: HTTPAdapter) -> None:
+    """Route all of a session's HTTP(S) traffic through `adapter` (and its connection pool)."""
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def create_pooled_session(headers: Dict[str, str], pool_size: int = 10) -> requests.Session:
+    """
+    Create a requests session whose connection pool can serve `pool_size` concurrent workers.
+
+    Args:
+        headers: Default headers for every request
+        pool_size: Maximum number of pooled connections per host
+
+    Returns:
+        Configured requests session
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    mount_adapter(session, create_pooled_adapter(pool_size))
+    return session
+
+
+class HostConcurrencyLimiter:
+    """Caps the number of in-flight requests per host."""
+
+    def __init__(self, per_host_limit: int = 4):
+        """
+        Initialize the limiter.
+
+        Args:
+            per_host_limit: Maximum concurrent requests to any single host
+        """
+        self.per_host_limit = max(1, per_host_limit)
+        self.semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self.lock = threading.Lock()
+
+    def get_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        """Return the semaphore guarding the host of `url`."""
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.semaphores[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        """Context manager that holds one of the host's slots for the duration of the block."""
+        semaphore = self.get_semaphore(url)
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def try_acquire(self, url: str) -> bool:
+        """Take one of the host's slots if one is free right now; never waits."""
+        return self.get_semaphore(url).acquire(blocking=False)
+
+    def release(self, url: str) -> None:
+        """Give back a slot taken with try_acquire."""
+        self.get_semaphore(url).release()
+
+    def record(self, url: str, status: Optional[int], latency: Optional[float] = None,
+               retry_after=None) -> None:
+        """Fixed limits ignore response feedback (see AdaptiveConcurrencyLimiter)."""
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all transfers to cap their combined throughput."""
+
+    def __init__(self, bytes_per_second: float, burst_seconds: float = 1.0):
+        """
+        Initialize the limiter.
+
+        Args:
+            bytes_per_second: Combined throughput budget
+            burst_seconds: Budget that may accumulate while transfers are idle
+        """
+        self.rate = float(bytes_per_second)
+        self.capacity = self.rate * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, count: int) -> None:
+        """Account for `count` received bytes, sleeping while the budget is overdrawn."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class DownloadStats:
+    """Thread-safe download counters, aggregated per group (e.g. JSON file) and overall."""
+
+    def __init__(self):
+        self.groups: Dict[str, Dict[str, int]] = defaultdict(empty_stats)
+        self.lock = threading.Lock()
+
+    def add(self, group: str, key: str, count: int = 1) -> None:
+        """Add `count` to counter `key` of `group`."""
+        with self.lock:
+            self.groups[group][key] += count
+
+    def get(self, group: str) -> Dict[str, int]:
+        """Return a copy of the counters for one group."""
+        with self.lock:
+            return dict(self.groups.get(group, empty_stats()))
+
+    def totals(self, group: Optional[str] = None) -> Dict[str, int]:
+        """Return counters summed over all groups (or a single group if given)."""
+        if group is not None:
+            return self.get(group)
+        with self.lock:
+            total = empty_stats()
+            for stats in self.groups.values():
+                for key in STAT_KEYS:
+                    total[key] += stats[key]
+            return total
+
+    def completed(self) -> int:
+        """Number of videos that finished (successfully, failed or skipped)."""
+        totals = self.totals()
+        return totals["success"] + totals["failed"] + totals["skipped"]
+
+
+class TransferResult(NamedTuple):
+    """Outcome of a completed download."""
+    size: int           # Final file size in bytes
+    transferred: int    # Bytes received during this call (excludes a resumed prefix)
+    started_at: float   # time.monotonic() when the call started
+    finished_at: float  # time.monotonic() when the file was finalized
+    
+    @property
+    def seconds(self) -> float:
+        return max(self.finished_at - self.started_at, 1e-6)
+    
+    @property
+    def mb_per_second(self) -> float:
+        return self.transferred / MB / self.seconds
+
+
+class TransferMetrics:
+    """Thread-safe collection of per-file transfer results for throughput reporting."""
+    
+    def __init__(self):
+        self.results: List[TransferResult] = []
+        self.lock = threading.Lock()
+    
+    def record(self, result: TransferResult) -> None:
+        """Add one completed transfer."""
+        with self.lock:
+            self.results.append(result)
+    
+    def summary_lines(self) -> List[str]:
+        """Return per-file and aggregate throughput lines for the final summary."""
+        with self.lock:
+            results = list(self.results)
+        if not results:
+            return []
+        
+        transferred = sum(result.transferred for result in results)
+        # Wall-clock span of all transfers, so concurrent downloads count once
+        wall_seconds = max(max(r.finished_at for r in results) - min(r.started_at for r in results), 1e-6)
+        rates = sorted(result.mb_per_second for result in results)
+        return [
+            f"Transferred: {transferred / MB:.1f} MB in {wall_seconds:.1f}s "
+            f"({transferred / MB / wall_seconds:.2f} MB/s aggregate)",
+            f"Per-file MB/s: min {rates[0]:.2f}, median {rates[len(rates) // 2]:.2f}, max {rates[-1]:.2f}",
+        ]
+
+
+def part_path_for(file_path: Path) -> Path:
+    """Return the in-progress path used while downloading `file_path`."""
+    return file_path.with_name(file_path.name + PART_SUFFIX)
+
+
+def parse_total_size(response: requests.Response) -> int:
+    """
+    Return the full size of the remote file, or 0 if unknown.
+
+    Uses Content-Range for 206 responses and Content-Length otherwise.
+    """
+    if response.status_code == 206:
+        match = re.match(r'bytes\s+\d+-\d+/(\d+)', response.headers.get('content-range', ''))
+        return int(match.group(1)) if match else 0
+    return int(response.headers.get('content-length', 0) or 0)
+
+
+def iter_adaptive_chunks(response: requests.Response):
+    """
+    Yield the response body in chunks whose size adapts to the link speed.
+    
+    Reads start at MIN_CHUNK_SIZE and double while each read completes well
+    within TARGET_READ_SECONDS (halving when reads get slow), so fast links
+    use a few large writes instead of many 8 KB ones.
+    """
+    chunk_size = MIN_CHUNK_SIZE
+    while True:
+        started = time.monotonic()
+        try:
+            chunk = response.raw.read(chunk_size, decode_content=True)
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            # Surface stream failures the same way iter_content does
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        if not chunk:
+            return
+        yield chunk
+        
+        elapsed = time.monotonic() - started
+        if elapsed < TARGET_READ_SECONDS / 2 and len(chunk) == chunk_size:
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+        elif elapsed > TARGET_READ_SECONDS * 2:
+            chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+
+
+def preallocate_file(f, size: int) -> bool:
+    """Reserve `size` bytes for an open file where the platform supports it."""
+    if not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+        return True
+    except OSError as e:
+        logger.debug(f"Preallocation not supported here: {e}")
+        return False
+
+
+def file_sha256(file_path: Path) -> str:
+    """Compute the SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def resumable_download(session: requests.Session, url: str, file_path: Path,
+                       response: Optional[requests.Response] = None, max_attempts: int = 3,
+                       timeout: float = 30, expected_sha256: Optional[str] = None,
+                       show_progress: bool = True, preallocate: bool = False,
+                       bandwidth: Optional[BandwidthLimiter] = None, limiter=None,
+                       stream_probe=None) -> TransferResult:
+    """
+    Download `url` to `file_path` through a .part file with HTTP Range resumption.
+
+    Bytes are appended to `<file>.part`; after a dropped connection the next
+    attempt (or the next run) continues from the current offset. The file is
+    only renamed to its final name once its length matches the server's and,
+    if given, its SHA-256 matches `expected_sha256`.
+
+    Args:
+        session: Session used for requests
+        url: Remote file URL
+        file_path: Final destination path
+        response: Already-open streaming response for the first attempt (optional)
+        max_attempts: Attempts before giving up (the .part file is kept for later runs)
+        timeout: Request timeout in seconds
+        expected_sha256: Optional checksum the finished file must match
+        show_progress: Print a progress line (at most every PROGRESS_INTERVAL seconds)
+        preallocate: Reserve the full content-length on disk before writing
+        bandwidth: Shared limiter capping the combined throughput of all transfers (optional)
+        limiter: Concurrency limiter to report response status and latency to (optional)
+        stream_probe: StreamProbe fed the bytes as they are written (optional)
+
+    Returns:
+        TransferResult with the file size and the bytes/time spent in this call
+
+    Raises:
+        requests.RequestException or IncompleteDownloadError after the last failed attempt
+    """
+    part_path = part_path_for(file_path)
+    prealloc_marker = part_path.with_name(part_path.name + PREALLOC_SUFFIX)
+    started_at = time.monotonic()
+    transferred = 0
+
+    for attempt in range(1, max_attempts + 1):
+        if prealloc_marker.exists():
+            # A crash left a preallocated file whose size does not reflect what was written
+            logger.warning(f"Discarding partial file {part_path.name} left preallocated by an interrupted run")
+            part_path.unlink(missing_ok=True)
+            prealloc_marker.unlink()
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        try:
+            if response is not None and offset:
+                # The caller's response starts at byte 0; re-request from where we left off
+                response.close()
+                response = None
+            if response is None:
+                # Ask for identity encoding so byte offsets refer to the file itself
+                headers = {'Accept-Encoding': 'identity'}
+                if offset:
+                    headers['Range'] = f'bytes={offset}-'
+                response = session.get(url, stream=True, timeout=timeout, headers=headers)
+                if limiter is not None:
+                    limiter.record(url, response.status_code, response.elapsed.total_seconds(),
+                                   response.headers.get('Retry-After'))
+
+            if response.status_code == 416 and offset:
+                # Nothing left to fetch: the .part file already holds the whole resource
+                match = re.match(r'bytes\s+\*/(\d+)', response.headers.get('content-range', ''))
+                if match and int(match.group(1)) == offset:
+                    if stream_probe is not None:
+                        stream_probe.finish(offset)
+                    size = finalize_download(part_path, file_path, expected_sha256)
+                    return TransferResult(size, transferred, started_at, time.monotonic())
+                logger.warning(f"Discarding unusable partial file {part_path.name}")
+                part_path.unlink()
+                raise IncompleteDownloadError("Range not satisfiable")
+            response.raise_for_status()
+
+            if offset and response.status_code == 206:
+                logger.info(f"Resuming {file_path.name} from byte {offset}")
+            else:
+                # Server ignored the Range header; start over
+                offset = 0
+            total_size = parse_total_size(response)
+            if response.headers.get('content-encoding', 'identity') != 'identity':
+                # Decoded bytes cannot be compared with the encoded length
+                total_size = 0
+
+            downloaded = offset
+            with open(part_path, 'r+b' if offset else 'wb') as f:
+                f.seek(offset)
+                preallocated = preallocate and total_size > offset and preallocate_file(f, total_size)
+                if preallocated:
+                    prealloc_marker.touch()
+                try:
+                    last_report = 0.0
+                    for chunk in iter_adaptive_chunks(response):
+                        f.write(chunk)
+                        if stream_probe is not None:
+                            stream_probe.feed(downloaded, chunk)
+                        downloaded += len(chunk)
+                        transferred += len(chunk)
+                        if bandwidth is not None:
+                            bandwidth.consume(len(chunk))
+                        now = time.monotonic()
+                        if show_progress and (now - last_report >= PROGRESS_INTERVAL or downloaded == total_size):
+                            last_report = now
+                            rate = transferred / MB / max(now - started_at, 1e-6)
+                            if total_size > 0:
+                                print(f"\rProgress: {downloaded / total_size * 100:.1f}% ({rate:.1f} MB/s)",
+                                      end='', flush=True)
+                            else:
+                                print(f"\rDownloaded: {downloaded / MB:.1f} MB ({rate:.1f} MB/s)",
+                                      end='', flush=True)
+                finally:
+                    if preallocated:
+                        # Shrink back to the bytes actually written so the offset stays meaningful
+                        f.truncate(downloaded)
+                        prealloc_marker.unlink()
+            if show_progress:
+                print()  # New line after progress
+
+            if total_size and downloaded != total_size:
+                raise IncompleteDownloadError(f"Received {downloaded} of {total_size} bytes")
+
+            if stream_probe is not None:
+                stream_probe.finish(downloaded)
+            size = finalize_download(part_path, file_path, expected_sha256)
+            return TransferResult(size, transferred, started_at, time.monotonic())
+
+        except (requests.RequestException, IncompleteDownloadError) as e:
+            if limiter is not None and isinstance(e, requests.RequestException) and getattr(e, 'response', None) is None:
+                # Timeouts and dropped connections count as congestion
+                limiter.record(url, None)
+            delay = retry_delay(e, attempt)
+            if attempt == max_attempts or delay is None:
+                raise
+            logger.warning(f"Download of {file_path.name} interrupted ({e}); "
+                           f"retrying in {delay}s (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(delay)
+        finally:
+            if response is not None:
+                response.close()
+                response = None
+
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """
+    Seconds to wait before retrying after `error` on attempt `attempt`, or None if retrying is pointless.
+
+    Client errors (404, 403, ...) are not retried; 408, 429, 5xx and dropped
+    connections back off exponentially, at least as long as the Retry-After header asks.
+    """
+    error_response = getattr(error, 'response', None)
+    status = getattr(error_response, 'status_code', None)
+    if status and status < 500 and status not in (408, 429):
+        return None
+    delay = 2 ** attempt
+    retry_after = parse_retry_after(error_response.headers.get('Retry-After')) if error_response is not None else None
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def open_download(session: requests.Session, url: str, max_attempts: int = 3, timeout: float = 30,
+                  limiter=None) -> requests.Response:
+    """
+    Open a streaming GET for the start of `url`, with resumable_download's retry policy.
+
+    Use this when the response itself is needed before the download starts (e.g.
+    to pick the file extension from its content-type), then hand it to
+    resumable_download as `response`.
+
+    Args:
+        session: Session used for requests
+        url: Remote file URL
+        max_attempts: Attempts before giving up
+        timeout: Request timeout in seconds
+        limiter: Concurrency limiter to report response status and latency to (optional)
+
+    Returns:
+        The open streaming response (status 2xx)
+
+    Raises:
+        requests.RequestException after the last failed attempt (HTTPError carries the response)
+    """
+    for attempt in range(1, max_attempts + 1):
+        response = None
+        try:
+            response = session.get(url, stream=True, timeout=timeout, headers={'Accept-Encoding': 'identity'})
+            if limiter is not None:
+                limiter.record(url, response.status_code, response.elapsed.total_seconds(),
+                               response.headers.get('Retry-After'))
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            if response is not None:
+                response.close()
+            elif limiter is not None:
+                limiter.record(url, None)
+            delay = retry_delay(e, attempt)
+            if attempt == max_attempts or delay is None:
+                raise
+            logger.warning(f"Request for {url} failed ({e}); retrying in {delay}s (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(delay)
+
+
+def finalize_download(part_path: Path, file_path: Path, expected_sha256: Optional[str] = None) -> int:
+    """Verify a completed .part file and atomically move it to its final name."""
+    if expected_sha256:
+        actual = file_sha256(part_path)
+        if actual.lower() != expected_sha256.lower():
+            # A corrupt prefix cannot be repaired by resuming, so start from scratch next time
+            part_path.unlink()
+            raise IncompleteDownloadError(f"Checksum mismatch for {file_path.name}")
+    size = part_path.stat().st_size
+    os.replace(part_path, file_path)
+    return size
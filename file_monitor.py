@@ -8,20 +8,46 @@ import os
 import json
 import time
 import hashlib
+import shutil
 import subprocess
+import threading
 from datetime import datetime
 from pathlib import Path
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import concurrent.futures
+from catalog_db import (VideoCatalog, CATALOG_DB_PATH, MONITOR_HEARTBEAT_INTERVAL, clear_monitor_heartbeat,
+                        load_catalog_version, save_catalog_version, touch_monitor_heartbeat)
+from stream_probe import load_sidecar, thumbnail_path_for
+from annotation_stream import annotation_files_signature
+
+# Bounds for the metadata probing stage
+PROBE_WORKERS = min(16, (os.cpu_count() or 1) + 4)  # ffprobe is subprocess-bound, not CPU-bound in Python
+PROBE_TIMEOUT = 30  # seconds per ffprobe call
+THUMBNAIL_TIMEOUT = 60  # seconds per ffmpeg thumbnail call
+DEBOUNCE_SECONDS = 1  # at most one rescan per second; changes in between get a trailing rescan
 
 class VideoFileHandler(FileSystemEventHandler):
-    def __init__(self, downloads_path, output_file):
+    def __init__(self, downloads_path, output_file, catalog=None,
+                 probe_workers=PROBE_WORKERS, probe_timeout=PROBE_TIMEOUT):
         self.downloads_path = Path(downloads_path)
         self.output_file = output_file
         self.last_update = 0
         self.thumbnails_dir = Path("thumbnails")
         self.thumbnails_dir.mkdir(exist_ok=True)
+        # Optional SQLite catalog, updated incrementally alongside the JSON output
+        self.catalog = catalog
+        self.catalog_primed = False
+        self.probe_workers = probe_workers
+        self.probe_timeout = probe_timeout
+        # Scan snapshot: directory listings keyed by mtime and per-file records keyed by (size, mtime)
+        self.snapshot_file = Path("data") / "scan_snapshot.json"
+        self.snapshot_dirs = {}
+        self.snapshot_files = {}
+        # Rescans run on the observer thread and the trailing-rescan timer, one at a time
+        self.generate_lock = threading.Lock()
+        self.trailing_timer = None
+        self.trailing_lock = threading.Lock()
         
     def get_category_and_subconcept(self, query_folder_name):
         """
@@ -50,25 +76,132 @@ class VideoFileHandler(FileSystemEventHandler):
         return "Uncategorized", query_folder_name.replace('_', ' ').replace('-', ' ').title()
         
     def on_any_event(self, event):
-        # Debounce: only update once per second
+        # Debounce: only update once per second, catching up on skipped events afterwards
         current_time = time.time()
-        if current_time - self.last_update < 1:
+        if current_time - self.last_update < DEBOUNCE_SECONDS:
+            # e.g. a ranking_results.json still being written when the last rescan read it
+            self.schedule_trailing_rescan(DEBOUNCE_SECONDS - (current_time - self.last_update))
             return
         
         self.last_update = current_time
         print(f"File system change detected: {event.event_type} - {event.src_path}")
         self.generate_json()
 
+    def schedule_trailing_rescan(self, delay):
+        """Rescan once the debounce window has passed (one pending rescan covers any number of events)"""
+        with self.trailing_lock:
+            if self.trailing_timer is not None:
+                return
+            self.trailing_timer = threading.Timer(delay, self.run_trailing_rescan)
+            self.trailing_timer.daemon = True
+            self.trailing_timer.start()
+
+    def run_trailing_rescan(self):
+        with self.trailing_lock:
+            self.trailing_timer = None
+        self.last_update = time.time()
+        print("Catching up on file system changes skipped by the debounce")
+        self.generate_json()
+
     def generate_json(self):
         """Generate JSON from the Downloads folder structure"""
+        with self.generate_lock:
+            self.generate_json_locked()
+
+    def generate_json_locked(self):
+        """generate_json's body (caller holds generate_lock)"""
         try:
             data = self.scan_downloads_folder()
-            with open(self.output_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            print(f"Updated {self.output_file} with {len(data)} queries")
+            content = json.dumps(data, indent=2)
+            content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            # Annotation files are served by serve.py, whose ETag is this version
+            annotation_hash = annotation_files_signature(self.downloads_path)
+            
+            # Only rewrite (and bump the catalog version) when the content actually changed
+            version_info = load_catalog_version()
+            content_changed = content_hash != version_info.get('contentHash') or not Path(self.output_file).exists()
+            if not content_changed and annotation_hash == version_info.get('annotationHash'):
+                print(f"No changes in {self.output_file} (catalog version {version_info.get('version')})")
+            else:
+                if content_changed:
+                    with open(self.output_file, 'w') as f:
+                        f.write(content)
+                version = save_catalog_version(version_info.get('version', 0) + 1, content_hash, annotation_hash)
+                if content_changed:
+                    print(f"Updated {self.output_file} with {len(data)} queries (catalog version {version})")
+                else:
+                    print(f"Annotation files changed (catalog version {version})")
+            self.save_snapshot()
+            if self.catalog:
+                self.index_rankings()
         except Exception as e:
             print(f"Error generating JSON: {e}")
 
+    def index_rankings(self):
+        """Index new or changed ranking_results.json files into the catalog and drop deleted ones"""
+        indexed = self.catalog.get_ranking_signatures()
+        found = []
+        for ranking_file in self.downloads_path.rglob('ranking_results.json'):
+            folder_key = str(ranking_file.parent.relative_to(self.downloads_path))
+            try:
+                stats = ranking_file.stat()
+                found.append(folder_key)
+                # Unchanged files (same size and mtime) are not read again
+                if indexed.get(folder_key) == (stats.st_size, stats.st_mtime_ns):
+                    continue
+                with open(ranking_file, 'rb') as f:
+                    content = f.read()
+                self.catalog.upsert_ranking(folder_key, ranking_file, stats.st_size, stats.st_mtime_ns, content)
+                print(f"🏆 Indexed rankings for {folder_key}")
+            except (OSError, ValueError) as e:
+                print(f"Error indexing rankings in {ranking_file}: {e}")
+        
+        removed = self.catalog.prune_rankings(found)
+        if removed:
+            print(f"🏆 Removed {removed} deleted rankings from the index")
+
+    def load_snapshot(self):
+        """Load the scan snapshot persisted by a previous run (enables a warm start)"""
+        if not self.snapshot_file.exists():
+            print("No scan snapshot found - performing a full scan")
+            return False
+        
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            
+            if snapshot.get('downloadsPath') != str(self.downloads_path):
+                print("Scan snapshot is for a different downloads folder - ignoring it")
+                return False
+            
+            self.snapshot_dirs = snapshot.get('dirs', {})
+            self.snapshot_files = snapshot.get('files', {})
+            print(f"♻️ Loaded scan snapshot: {len(self.snapshot_dirs)} folders, {len(self.snapshot_files)} videos")
+            return True
+            
+        except (json.JSONDecodeError, OSError, UnicodeDecodeError) as e:
+            print(f"Error loading scan snapshot from {self.snapshot_file}: {e}")
+            self.snapshot_dirs = {}
+            self.snapshot_files = {}
+            return False
+
+    def save_snapshot(self):
+        """Persist directory mtimes and per-file records for the next startup"""
+        try:
+            self.snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+            snapshot = {
+                'downloadsPath': str(self.downloads_path),
+                'dirs': self.snapshot_dirs,
+                'files': self.snapshot_files
+            }
+            # Write to a temp file and rename so a crash never leaves a truncated snapshot
+            temp_file = self.snapshot_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_file, self.snapshot_file)
+        except OSError as e:
+            print(f"Error saving scan snapshot: {e}")
+
     def scan_downloads_folder(self):
         """Scan Downloads folder and create hierarchical data structure"""
         result = {}
@@ -79,16 +212,19 @@ class VideoFileHandler(FileSystemEventHandler):
         
         # Collect all query folders and their paths
         query_folders = []
+        self.seen_dirs = set()
+        self.seen_files = set()
         
         # First, scan for nested structure (Category/Subconcept/Query)
-        for category_folder in self.downloads_path.iterdir():
+        # Folders are visited in sorted order so the output is stable across rebuilds
+        for category_folder in sorted(self.downloads_path.iterdir()):
             if category_folder.is_dir() and not category_folder.name.startswith('.'):
                 # Check if this folder contains subconcept folders
                 has_subconcepts = False
-                for subconcept_folder in category_folder.iterdir():
+                for subconcept_folder in sorted(category_folder.iterdir()):
                     if subconcept_folder.is_dir() and not subconcept_folder.name.startswith('.'):
                         # Check if this subconcept contains query folders
-                        for query_folder in subconcept_folder.iterdir():
+                        for query_folder in sorted(subconcept_folder.iterdir()):
                             if query_folder.is_dir() and not query_folder.name.startswith('.'):
                                 videos = self.scan_query_folder(query_folder)
                                 if videos:  # Only add if we found videos
@@ -113,7 +249,8 @@ class VideoFileHandler(FileSystemEventHandler):
                             'videos': videos
                         })
         
-        # Build the result structure
+        # Build the result structure (sorted by category, subconcept and folder)
+        query_folders.sort(key=lambda q: (q['category'], q['subconcept'], q['name'], str(q['path'])))
         for query_data in query_folders:
             category = query_data['category']
             subconcept = query_data['subconcept']
@@ -133,35 +270,202 @@ class VideoFileHandler(FileSystemEventHandler):
             query_info = {
                 "query": formatted_query,
                 "folder": query_data['name'],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                # Newest video mtime, so the timestamp only changes when the files do
+                "timestamp": max(video['modified'] for video in query_data['videos']),
                 "totalResults": len(query_data['videos']),
                 "videos": query_data['videos']
             }
             
             result[category][subconcept]["queries"].append(query_info)
+            
+            if self.catalog:
+                self.catalog.upsert_query(self.get_query_key(query_data['path']), query_info,
+                                          category, subconcept)
+        
+        # Drop catalog rows for query folders that disappeared
+        if self.catalog:
+            self.catalog.prune_queries(self.get_query_key(q['path']) for q in query_folders)
+            self.catalog_primed = True
+        
+        # Forget snapshot entries for folders and files that no longer exist
+        self.snapshot_dirs = {k: v for k, v in self.snapshot_dirs.items() if k in self.seen_dirs}
+        self.snapshot_files = {k: v for k, v in self.snapshot_files.items() if k in self.seen_files}
                     
         return result
 
+    def get_query_key(self, query_folder):
+        """Stable catalog key for a query folder (path relative to downloads)"""
+        return str(query_folder.relative_to(self.downloads_path))
+
     def scan_query_folder(self, query_folder):
         """Scan a query folder for video files"""
         videos = []
-        video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv'}
+        query_key = self.get_query_key(query_folder)
+        metadata_mtime = self.get_mtime_ns(query_folder / 'query_metadata.json')
         
-        # Collect all video files first
+        # Collect all video files first, reusing snapshot records for unchanged files
         video_files = []
-        for file_path in query_folder.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in video_extensions:
+        cached_videos = []
+        for file_path in self.list_video_files(query_folder):
+            cached = self.get_cached_record(file_path, query_key, metadata_mtime)
+            if cached is not None:
+                cached_videos.append((file_path, cached))
+            else:
                 video_files.append(file_path)
         
-        # Generate thumbnails in parallel
-        self.generate_thumbnails_parallel(video_files)
+        # Generate thumbnails in parallel (also retried for unchanged videos that still lack one)
+        missing_thumbnails = [file_path for file_path, record in cached_videos if record.get('thumbnail') is None]
+        self.generate_thumbnails_parallel(video_files + missing_thumbnails)
         
-        # Now extract video info (thumbnails should be ready)
-        for file_path in video_files:
-            video_info = self.extract_video_info(file_path, query_folder)
+        for file_path, record in cached_videos:
+            if record.get('thumbnail') is None:
+                self.refresh_thumbnail(record)
+            videos.append(record)
+        
+        # Rows for unchanged files only need writing once per process (the catalog may be new)
+        if cached_videos and self.catalog and not self.catalog_primed:
+            self.catalog.upsert_videos(query_key, [record for _, record in cached_videos])
+        
+        # Now extract video info (thumbnails should be ready); records stream in as probes finish
+        for file_path, video_info, complete in self.extract_video_info_parallel(video_files, query_folder):
             videos.append(video_info)
+            # Fallback records are not reused, so the next scan extracts the file again
+            if complete:
+                self.remember_record(file_path, query_key, metadata_mtime, video_info)
+            if self.catalog:
+                self.catalog.upsert_video(query_key, video_info)
+        
+        if video_files:
+            print(f"🔄 {query_key}: processed {len(video_files)} new/changed videos, reused {len(cached_videos)}")
+        
+        if self.catalog:
+            self.catalog.prune_videos(query_key, [v['filepath'] for v in videos])
                 
-        return sorted(videos, key=lambda x: x['title'])
+        return sorted(videos, key=lambda x: (x['title'], x['filepath']))
+
+    def list_video_files(self, query_folder):
+        """
+        List video files under a folder (recursively).
+        
+        Directories whose mtime matches the snapshot reuse the stored listing
+        instead of being re-read; only changed directories are listed again.
+        """
+        video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv'}
+        video_files = []
+        pending = [query_folder]
+        
+        while pending:
+            directory = pending.pop()
+            dir_key = str(directory)
+            dir_mtime = self.get_mtime_ns(directory)
+            if dir_mtime is None:
+                continue
+            
+            listing = self.snapshot_dirs.get(dir_key)
+            if listing is None or listing.get('mtime') != dir_mtime:
+                files, subdirs = [], []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            if entry.is_dir():
+                                subdirs.append(entry.name)
+                            elif entry.is_file() and Path(entry.name).suffix.lower() in video_extensions:
+                                files.append(entry.name)
+                except OSError as e:
+                    print(f"Error listing {directory}: {e}")
+                    continue
+                listing = {'mtime': dir_mtime, 'files': sorted(files), 'dirs': sorted(subdirs)}
+                self.snapshot_dirs[dir_key] = listing
+            
+            self.seen_dirs.add(dir_key)
+            video_files.extend(directory / name for name in listing['files'])
+            pending.extend(directory / name for name in listing['dirs'])
+        
+        return video_files
+
+    def get_cached_record(self, file_path, query_key, metadata_mtime):
+        """Return the snapshot record for a file if its size and mtime are unchanged"""
+        file_key = str(file_path)
+        try:
+            stats = file_path.stat()
+        except OSError:
+            return None
+        self.seen_files.add(file_key)
+        
+        entry = self.snapshot_files.get(file_key)
+        if (entry is None or entry.get('query') != query_key
+                or entry.get('size') != stats.st_size
+                or entry.get('mtime') != stats.st_mtime_ns
+                or entry.get('metadataMtime') != metadata_mtime):
+            return None
+        
+        return entry['record']
+
+    def refresh_thumbnail(self, record):
+        """Pick up a thumbnail that was generated after the record was stored"""
+        thumbnail_path = self.thumbnails_dir / f"{record['id']}.jpg"
+        if thumbnail_path.exists():
+            record['thumbnail'] = f"thumbnails/{thumbnail_path.name}"
+            if self.catalog:
+                self.catalog.upsert_thumbnail(record['id'], thumbnail_path)
+
+    def remember_record(self, file_path, query_key, metadata_mtime, record):
+        """Store a freshly extracted record in the snapshot"""
+        try:
+            stats = file_path.stat()
+        except OSError:
+            return
+        self.seen_files.add(str(file_path))
+        self.snapshot_files[str(file_path)] = {
+            'query': query_key,
+            'size': stats.st_size,
+            'mtime': stats.st_mtime_ns,
+            'metadataMtime': metadata_mtime,
+            'record': record
+        }
+
+    def get_mtime_ns(self, path):
+        """Return a path's mtime in nanoseconds, or None if it does not exist"""
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def extract_video_info_parallel(self, video_files, query_folder):
+        """
+        Extract video info (ffprobe) for many files with a bounded worker pool.
+        
+        Yields (file_path, video_info, complete) as each probe completes, so callers
+        can stream results into the catalog instead of waiting for the whole folder.
+        A file whose extraction fails still yields a fallback record (complete=False),
+        so it is never dropped from the catalog.
+        """
+        if not video_files:
+            return
+        
+        if len(video_files) == 1 or self.probe_workers <= 1:
+            for file_path in video_files:
+                yield (file_path, *self.extract_video_info_or_fallback(file_path, query_folder))
+            return
+        
+        print(f"🔍 Probing {len(video_files)} videos with {self.probe_workers} workers...")
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.probe_workers) as executor:
+            future_to_path = {
+                executor.submit(self.extract_video_info_or_fallback, file_path, query_folder): file_path
+                for file_path in video_files
+            }
+            
+            for future in concurrent.futures.as_completed(future_to_path):
+                yield (future_to_path[future], *future.result())
+
+    def extract_video_info_or_fallback(self, file_path, query_folder):
+        """Return (video_info, True), or (fallback record, False) if extraction fails"""
+        try:
+            return self.extract_video_info(file_path, query_folder), True
+        except Exception as e:
+            print(f"❌ Error extracting video info for {file_path.name}: {e}")
+            return self.fallback_video_info(file_path, query_folder), False
 
     def generate_thumbnails_parallel(self, video_files):
         """Generate thumbnails for multiple videos in parallel"""
@@ -184,12 +488,15 @@ class VideoFileHandler(FileSystemEventHandler):
             
             # Only generate if thumbnail doesn't exist
             if not thumbnail_path.exists():
+                if self.use_inline_thumbnail(file_path, thumbnail_path):
+                    continue
                 videos_needing_thumbnails.append((file_path, thumbnail_path))
         
         if not videos_needing_thumbnails:
             return
         
         print(f"🖼️ Generating {len(videos_needing_thumbnails)} thumbnails in parallel...")
+        thumbnail_paths = dict(videos_needing_thumbnails)
         
         # Use ThreadPoolExecutor for parallel thumbnail generation
         with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
@@ -206,11 +513,28 @@ class VideoFileHandler(FileSystemEventHandler):
                     success = future.result()
                     if success:
                         print(f"✅ Generated thumbnail for {file_path.name}")
+                        if self.catalog:
+                            thumbnail_path = thumbnail_paths[file_path]
+                            self.catalog.upsert_thumbnail(thumbnail_path.stem, thumbnail_path)
                     else:
                         print(f"❌ Failed to generate thumbnail for {file_path.name}")
                 except Exception as e:
                     print(f"❌ Error generating thumbnail for {file_path.name}: {e}")
 
+    def use_inline_thumbnail(self, video_path, thumbnail_path):
+        """Copy the thumbnail a downloader extracted from the stream, if it left one"""
+        inline_thumbnail = thumbnail_path_for(video_path)
+        if not inline_thumbnail.exists() or load_sidecar(video_path) is None:
+            return False
+        try:
+            shutil.copyfile(inline_thumbnail, thumbnail_path)
+        except OSError as e:
+            print(f"❌ Error copying inline thumbnail for {video_path.name}: {e}")
+            return False
+        if self.catalog:
+            self.catalog.upsert_thumbnail(thumbnail_path.stem, thumbnail_path)
+        return True
+
     def generate_thumbnail(self, video_path, output_path):
         """Generate thumbnail from video using ffmpeg"""
         try:
@@ -228,19 +552,24 @@ class VideoFileHandler(FileSystemEventHandler):
                 str(output_path)
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=THUMBNAIL_TIMEOUT)
             if result.returncode == 0:
                 return True
             else:
                 print(f"FFmpeg error: {result.stderr}")
                 return False
                 
+        except subprocess.TimeoutExpired:
+            print(f"⏰ Thumbnail generation timed out for {video_path}")
+            return False
         except (subprocess.CalledProcessError, FileNotFoundError):
             # FFmpeg not available, return False
             return False
 
-    def get_video_info(self, video_path):
-        """Get video information using ffprobe"""
+    def get_video_info(self, video_path, timeout=None):
+        """Get video information using ffprobe (bounded by a timeout so corrupt files cannot hang the scan)"""
+        if timeout is None:
+            timeout = self.probe_timeout
         try:
             cmd = [
                 'ffprobe', '-v', 'quiet',
@@ -249,7 +578,7 @@ class VideoFileHandler(FileSystemEventHandler):
                 str(video_path)
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
             if result.returncode == 0:
                 data = json.loads(result.stdout)
                 
@@ -260,41 +589,46 @@ class VideoFileHandler(FileSystemEventHandler):
                         video_stream = stream
                         break
                 
-                info = {}
-                
-                # Get duration
+                duration_seconds = None
                 if 'format' in data and 'duration' in data['format']:
                     duration_seconds = float(data['format']['duration'])
-                    minutes = int(duration_seconds // 60)
-                    seconds = int(duration_seconds % 60)
-                    info['duration'] = f"{minutes}:{seconds:02d}"
-                else:
-                    info['duration'] = "0:00"
+                height = video_stream.get('height', 0) if video_stream else 0
                 
-                # Get resolution
-                if video_stream:
-                    width = video_stream.get('width', 0)
-                    height = video_stream.get('height', 0)
-                    if height >= 2160:
-                        info['resolution'] = '4K'
-                    elif height >= 1080:
-                        info['resolution'] = '1080p'
-                    elif height >= 720:
-                        info['resolution'] = '720p'
-                    elif height > 0:
-                        info['resolution'] = f"{height}p"
-                    else:
-                        info['resolution'] = 'Unknown'
-                else:
-                    info['resolution'] = 'Unknown'
-                
-                return info
+                return self.format_video_info(duration_seconds, height)
                 
+        except subprocess.TimeoutExpired:
+            print(f"⏰ ffprobe timed out after {timeout}s for {video_path}")
         except (subprocess.CalledProcessError, FileNotFoundError, json.JSONDecodeError):
             pass
         
         return {'duration': '0:00', 'resolution': 'Unknown'}
 
+    def format_video_info(self, duration_seconds, height):
+        """Format probed duration (seconds) and frame height as display strings"""
+        info = {}
+        
+        # Get duration
+        if duration_seconds is not None:
+            minutes = int(duration_seconds // 60)
+            seconds = int(duration_seconds % 60)
+            info['duration'] = f"{minutes}:{seconds:02d}"
+        else:
+            info['duration'] = "0:00"
+        
+        # Get resolution
+        if height >= 2160:
+            info['resolution'] = '4K'
+        elif height >= 1080:
+            info['resolution'] = '1080p'
+        elif height >= 720:
+            info['resolution'] = '720p'
+        elif height > 0:
+            info['resolution'] = f"{height}p"
+        else:
+            info['resolution'] = 'Unknown'
+        
+        return info
+
     def load_query_metadata(self, query_folder):
         """Load query metadata from query_metadata.json if it exists"""
         metadata_path = query_folder / 'query_metadata.json'
@@ -362,8 +696,12 @@ class VideoFileHandler(FileSystemEventHandler):
         filename_stem = file_path.stem  # Get filename without extension
         title = filename_stem.replace('_', ' ')
         
-        # Get video information using ffprobe
-        video_info = self.get_video_info(file_path)
+        # Get video information from the downloader's sidecar, falling back to ffprobe
+        sidecar = load_sidecar(file_path)
+        if sidecar is not None:
+            video_info = self.format_video_info(sidecar.get('durationSeconds'), sidecar.get('height', 0))
+        else:
+            video_info = self.get_video_info(file_path)
 
         duration = video_info.get('duration', self.extract_duration_from_filename(file_name))
         resolution = video_info.get('resolution', self.extract_resolution_from_filename(file_name))
@@ -390,6 +728,7 @@ class VideoFileHandler(FileSystemEventHandler):
             "duration": duration,
             "resolution": resolution,
             "fileSize": self.format_file_size(file_size),
+            "fileSizeBytes": file_size,
             "modified": modified_time.strftime("%Y-%m-%d %H:%M:%S"),
             "tags": tags,
             "thumbnail": thumbnail_url,
@@ -397,6 +736,32 @@ class VideoFileHandler(FileSystemEventHandler):
             "localPath": str(file_path.absolute())
         }
 
+    def fallback_video_info(self, file_path, query_folder):
+        """Video record built from the file name and stats alone (no metadata, sidecar or ffprobe)"""
+        try:
+            stats = file_path.stat()
+            file_size = stats.st_size
+            modified_time = datetime.fromtimestamp(stats.st_mtime)
+        except OSError:
+            file_size = 0
+            modified_time = datetime.now()
+        
+        return {
+            "id": hashlib.md5(str(file_path).encode()).hexdigest()[:8],
+            "title": file_path.stem.replace('_', ' '),
+            "filename": file_path.name,
+            "filepath": str(file_path.relative_to(query_folder)),
+            "duration": self.extract_duration_from_filename(file_path.stem),
+            "resolution": self.extract_resolution_from_filename(file_path.stem),
+            "fileSize": self.format_file_size(file_size),
+            "fileSizeBytes": file_size,
+            "modified": modified_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "tags": [],
+            "thumbnail": None,
+            "url": str(file_path.relative_to(self.downloads_path.parent)),
+            "localPath": str(file_path.absolute())
+        }
+
     def extract_duration_from_filename(self, filename):
         """Try to extract duration from filename patterns"""
         import re
@@ -474,10 +839,13 @@ def main():
     # Configuration
     downloads_path = "/Users/jackieli/Downloads/prof_code/scraping_vis/downloads"
     output_file = "scraped-data.json"
+    use_catalog = True  # Also maintain the SQLite catalog read by serve.py
     
     print(f"Adobe Stock File Monitor")
     print(f"Monitoring: {downloads_path}")
     print(f"Output file: {output_file}")
+    if use_catalog:
+        print(f"Catalog database: {CATALOG_DB_PATH}")
     print(f"Expected structure: Downloads/query_name/video_files")
     
     # Check for ffmpeg
@@ -491,11 +859,15 @@ def main():
     print("-" * 50)
     
     # Create handler
-    handler = VideoFileHandler(downloads_path, output_file)
+    catalog = VideoCatalog(CATALOG_DB_PATH) if use_catalog else None
+    handler = VideoFileHandler(downloads_path, output_file, catalog)
     
-    # Generate initial JSON
+    # Generate initial JSON (warm start: only folders/files changed since the last run are re-processed)
     print("Generating initial data...")
+    start_time = time.time()
+    handler.load_snapshot()
     handler.generate_json()
+    print(f"Initial data ready in {time.time() - start_time:.1f}s")
     
     # Set up file system monitoring
     observer = Observer()
@@ -506,10 +878,14 @@ def main():
     
     try:
         while True:
-            time.sleep(1)
+            # Tells serve.py the annotation signature in the catalog version is being kept current
+            touch_monitor_heartbeat()
+            time.sleep(MONITOR_HEARTBEAT_INTERVAL)
     except KeyboardInterrupt:
         observer.stop()
         print("\nFile monitoring stopped.")
+    finally:
+        clear_monitor_heartbeat()
     
     observer.join()
 
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Labeled Video Export
+Append-only JSONL stream of exported videos per query folder, with a persisted
+ID index (`<id>\t<byte offset>` per line) so repeat exports dedupe in O(1) and
+single records can be read back without scanning. The stream can be converted
+to a columnar file (Parquet or Arrow IPC with pyarrow, NumPy .npz otherwise)
+for training pipelines.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+# Export stream and its ID index inside data/<queryFolder>/
+EXPORT_STREAM_NAME = 'labeled_videos.jsonl'
+EXPORT_INDEX_NAME = 'labeled_videos.ids'
+
+# Video fields copied into every record (the frontend's export shape)
+VIDEO_FIELDS = ('id', 'title', 'filename', 'url', 'thumbnail', 'duration', 'resolution', 'fileSize',
+                'confidenceScore', 'question')
+
+# Columns of the columnar export, in order
+COLUMNS = VIDEO_FIELDS + ('query', 'folder', 'exported_at')
+
+# Columns stored as float64 (NaN when missing); every other column is a string
+NUMERIC_COLUMNS = ('confidenceScore',)
+
+COLUMNAR_SUFFIXES = {'parquet': '.parquet', 'arrow': '.arrow', 'npz': '.npz'}
+
+
+class LabelExport:
+    """One query folder's export stream and the in-memory copy of its ID index"""
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.stream_path = self.data_dir / EXPORT_STREAM_NAME
+        self.index_path = self.data_dir / EXPORT_INDEX_NAME
+        self.lock = threading.Lock()
+        # Byte offset of each exported video's record in the stream
+        self.offsets = {}
+        self.load_index()
+
+    def load_index(self):
+        """Read the ID index, then index any records appended after it was last written"""
+        indexed_end = 0
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    video_id, sep, offset = line.rstrip('\n').rpartition('\t')
+                    if sep and offset.isdigit():
+                        self.offsets[video_id] = int(offset)
+                        indexed_end = max(indexed_end, int(offset) + 1)
+        if not self.stream_path.exists():
+            return
+
+        # A crash between the stream append and the index append leaves unindexed records
+        missing = []
+        with open(self.stream_path, 'rb') as f:
+            if indexed_end:
+                f.seek(indexed_end - 1)
+                f.readline()
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    if line:
+                        # Torn final record: drop it, the video is re-exported next time
+                        self.truncate_stream(offset)
+                    break
+                try:
+                    video_id = json.loads(line)['id']
+                except (ValueError, KeyError):
+                    continue
+                if video_id not in self.offsets:
+                    self.offsets[video_id] = offset
+                    missing.append((video_id, offset))
+        if missing:
+            self.append_index(missing)
+            print(f"🔁 Re-indexed {len(missing)} exported videos in {self.stream_path}")
+
+    def truncate_stream(self, size):
+        """Cut the stream back to `size` bytes"""
+        with open(self.stream_path, 'r+b') as f:
+            f.truncate(size)
+
+    def append_index(self, entries):
+        """Append (video_id, offset) pairs to the ID index"""
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.writelines(f"{video_id}\t{offset}\n" for video_id, offset in entries)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, video_id):
+        return video_id in self.offsets
+
+    def append(self, videos, query='', folder='', exported_at=''):
+        """Append the videos not exported yet; returns how many were added"""
+        with self.lock:
+            records = []
+            seen = set()
+            for video in videos:
+                video_id = str(video.get('id') or '')
+                if not video_id or video_id in self.offsets or video_id in seen:
+                    continue
+                seen.add(video_id)
+                record = {field: video.get(field) for field in VIDEO_FIELDS}
+                record.update({'id': video_id, 'query': query, 'folder': folder, 'exported_at': exported_at})
+                records.append(record)
+            if not records:
+                return 0
+
+            entries = []
+            with open(self.stream_path, 'ab') as f:
+                offset = f.tell()
+                for record in records:
+                    line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+                    f.write(line)
+                    entries.append((record['id'], offset))
+                    offset += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+            # The stream is durable first, so a crash here only costs a re-index on load
+            self.append_index(entries)
+            self.offsets.update(entries)
+            return len(records)
+
+    def get(self, video_id):
+        """Read one exported record by ID, or None"""
+        offset = self.offsets.get(video_id)
+        if offset is None:
+            return None
+        with open(self.stream_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def iter_records(self):
+        """Yield every exported record in export order"""
+        if not self.stream_path.exists():
+            return
+        with open(self.stream_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def write_columnar(self, fmt=None):
+        """Write the whole stream as a columnar file next to it and return its path"""
+        fmt = fmt or default_columnar_format()
+        if fmt not in COLUMNAR_SUFFIXES:
+            raise ValueError(f"Unknown columnar format: {fmt}")
+
+        columns = {name: [] for name in COLUMNS}
+        for record in self.iter_records():
+            for name in COLUMNS:
+                value = record.get(name)
+                if name in NUMERIC_COLUMNS:
+                    columns[name].append(float('nan') if value is None else float(value))
+                else:
+                    columns[name].append('' if value is None else str(value))
+
+        output_path = self.stream_path.with_suffix(COLUMNAR_SUFFIXES[fmt])
+        tmp_path = output_path.with_name(output_path.name + '.tmp')
+        if fmt == 'npz':
+            import numpy as np
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **{name: np.array(values, dtype=float if name in NUMERIC_COLUMNS else str)
+                                           for name, values in columns.items()})
+        else:
+            import pyarrow as pa
+            table = pa.table({name: pa.array(values, type=pa.float64() if name in NUMERIC_COLUMNS else pa.string())
+                              for name, values in columns.items()})
+            if fmt == 'parquet':
+                import pyarrow.parquet as pq
+                pq.write_table(table, tmp_path)
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, tmp_path, compression='uncompressed')
+        os.replace(tmp_path, output_path)
+        return output_path
+
+
+def default_columnar_format():
+    """Parquet when pyarrow is installed, otherwise NumPy .npz"""
+    if importlib.util.find_spec('pyarrow') is not None:
+        return 'parquet'
+    if importlib.util.find_spec('numpy') is not None:
+        return 'npz'
+    raise RuntimeError("Columnar export needs pyarrow or numpy (pip install pyarrow)")
+
+
+# Open exports by folder, shared by the server's request handlers
+open_exports = {}
+open_exports_lock = threading.Lock()
+
+
+def get_label_export(data_dir):
+    """Return the shared export for a query folder's data directory"""
+    key = Path(data_dir).resolve()
+    with open_exports_lock:
+        if key not in open_exports:
+            open_exports[key] = LabelExport(key)
+        return open_exports[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a labeled-video export stream to a columnar file')
+    parser.add_argument('folders', nargs='+', help='Query folders containing labeled_videos.jsonl (e.g. data/dolly_zoom_out)')
+    parser.add_argument('--format', choices=sorted(COLUMNAR_SUFFIXES), default=None,
+                        help='Columnar format (default: parquet if pyarrow is installed, else npz)')
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        export = LabelExport(folder)
+        if not len(export):
+            print(f"⚠️ No exported videos in {folder}")
+            continue
+        try:
+            output_path = export.write_columnar(args.format)
+        except (ImportError, RuntimeError) as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Wrote {len(export)} videos to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Video Label Store
+Append-only JSONL journal of label changes over a compacted JSON snapshot,
+with the current labels kept in memory for the web server. A single writer
+thread group-commits bursts of changes with one fsync. Every change gets a
+sequence number so clients can sync deltas (`changes_since`/`apply_changes`),
+and per-query / per-dataset-pool counters are kept up to date as labels change.
+Dataset-pool labels live in their own map per (query, pool) and never touch
+the query's labels, even though pools reuse the query's video IDs.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+# Compacted labels ({"seq": n, "labels": {videoId: label}, "contexts": {videoId: query},
+# "pools": {query: {pool: {videoId: label}}}}; older files are a bare label map)
+LABELS_SNAPSHOT_PATH = Path('data') / 'video_labels.json'
+
+# Label changes since the last compaction, one JSON object per line
+LABELS_JOURNAL_PATH = Path('data') / 'video_labels.journal.jsonl'
+
+# Compact once the journal holds this many entries (or more entries than there are labels)
+COMPACT_MIN_ENTRIES = 1000
+
+# Seconds the writer waits after the first change of a burst before committing it
+COMMIT_INTERVAL = 0.25
+
+
+class LabelStore:
+    """In-memory view of all labels, persisted as snapshot + journal by a group-commit writer"""
+
+    def __init__(self, snapshot_path=LABELS_SNAPSHOT_PATH, journal_path=LABELS_JOURNAL_PATH,
+                 commit_interval=COMMIT_INTERVAL):
+        self.snapshot_path = Path(snapshot_path)
+        self.journal_path = Path(journal_path)
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        self.commit_interval = commit_interval
+        self.condition = threading.Condition()
+        self.labels = {}
+        # Sequence number of the latest change; the snapshot records the one it includes
+        self.seq = 0
+        # Seq of each video's last change since base_seq, oldest first (deleted labels included)
+        self.versions = {}
+        # Changes up to here are only known as a whole (snapshot or clear): older clients resync fully
+        self.base_seq = 0
+        # Query folder each label was made in
+        self.contexts = {}
+        # Dataset-pool labels by query and pool ({query: {pool: {videoId: label}}})
+        self.pool_labels = {}
+        # Label counts per query (its own labels) and per (query, pool)
+        self.query_stats = {}
+        self.pool_stats = {}
+        self.journal_entries = 0
+        self.load()
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        # Changes not yet on disk, merged per video so a burst on one video is one entry
+        self.pending = {}
+        self.compact_requested = False
+        self.committing = False
+        self.flush_requested = False
+        self.closed = False
+        self.commits = 0
+        self.writer = threading.Thread(target=self.run_writer, name='label-writer', daemon=True)
+        self.writer.start()
+
+    def load(self):
+        """Rebuild the view from the snapshot and replay the journal on top of it"""
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {}
+        if isinstance(snapshot.get('labels'), dict):
+            self.labels = snapshot['labels']
+            self.seq = snapshot.get('seq', 0)
+            # Contexts were [query, pool] pairs before pool labels got their own map
+            self.contexts = {video_id: context[0] if isinstance(context, list) else context
+                             for video_id, context in snapshot.get('contexts', {}).items()}
+            self.pool_labels = snapshot.get('pools', {})
+        else:
+            self.labels = snapshot
+        snapshot_seq = self.base_seq = self.seq
+        for video_id, label in self.labels.items():
+            self.count(self.contexts.get(video_id), None, label, 1)
+        for query, pools in self.pool_labels.items():
+            for pool, labels in pools.items():
+                for label in labels.values():
+                    self.count(query, pool, label, 1)
+
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-append leaves at most one torn line at the end
+                    continue
+                self.journal_entries += 1
+                # Entries already in the snapshot are left over from a compaction interrupted before truncating
+                if entry.get('seq', 0) <= snapshot_seq:
+                    continue
+                self.apply(entry)
+                if not entry.get('pool'):
+                    self.track(entry['id'], entry['seq'])
+                self.seq = max(self.seq, entry['seq'])
+
+    def apply(self, entry):
+        """Apply one journal entry to the in-memory view and the counters"""
+        if entry.get('pool'):
+            self.apply_pool(entry)
+            return
+        video_id = entry['id']
+        label = entry.get('label')
+        query = self.contexts.get(video_id)
+        self.count(query, None, self.labels.get(video_id), -1)
+        if entry.get('query'):
+            query = entry['query']
+        if label is None:
+            self.labels.pop(video_id, None)
+            self.contexts.pop(video_id, None)
+            return
+        self.labels[video_id] = label
+        if query:
+            self.contexts[video_id] = query
+        self.count(query, None, label, 1)
+
+    def apply_pool(self, entry):
+        """Apply a dataset-pool label entry to its pool's labels and counters"""
+        query, pool, video_id, label = entry['query'], entry['pool'], entry['id'], entry.get('label')
+        labels = self.pool_labels.setdefault(query, {}).setdefault(pool, {})
+        self.count(query, pool, labels.get(video_id), -1)
+        if label is None:
+            labels.pop(video_id, None)
+            return
+        labels[video_id] = label
+        self.count(query, pool, label, 1)
+
+    def count(self, query, pool, label, delta):
+        """Add `delta` to the counters of a label made in a query (or one of its pools)"""
+        if query is None or label is None:
+            return
+        if pool:
+            counter = self.pool_stats.setdefault(query, {}).setdefault(pool, {'total': 0, 'yes': 0, 'no': 0})
+        else:
+            counter = self.query_stats.setdefault(query, {'total': 0, 'yes': 0, 'no': 0})
+        counter['total'] += delta
+        if label in ('yes', 'no'):
+            counter[label] += delta
+
+    def unchanged(self, video_id, label, context):
+        """True if setting `label` in `context` would change neither the label nor the counters"""
+        query, pool = context or (None, None)
+        if pool:
+            return self.pool_labels.get(query, {}).get(pool, {}).get(video_id) == label
+        return self.labels.get(video_id) == label and (query is None or label is None or
+                                                       self.contexts.get(video_id) == query)
+
+    def label_stats(self, query=None, pool=None):
+        """
+        Return label counts with the true-positive rate (yes / labeled).
+        
+        Without a query: every query's counts; with a query: its counts and its
+        pools'; with a query and pool: that pool's counts. A query's counts cover
+        only its own labels, not its pools'. Labels saved without a query context
+        only appear in the overall label count.
+        """
+        def with_rate(counter):
+            counter = counter or {'total': 0, 'yes': 0, 'no': 0}
+            return {**counter, 'tpr': counter['yes'] / counter['total'] if counter['total'] else 0.0}
+        
+        with self.condition:
+            if query is None:
+                return {'seq': self.seq, 'labeled': len(self.labels),
+                        'queries': {name: with_rate(counter) for name, counter in self.query_stats.items()}}
+            if pool:
+                return {'seq': self.seq, 'query': query, 'pool': pool,
+                        **with_rate(self.pool_stats.get(query, {}).get(pool))}
+            return {'seq': self.seq, 'query': query, **with_rate(self.query_stats.get(query)),
+                    'pools': {name: with_rate(counter) for name, counter in self.pool_stats.get(query, {}).items()}}
+
+    def track(self, video_id, seq):
+        """Record a video's latest change, keeping `versions` ordered by seq"""
+        self.versions.pop(video_id, None)
+        self.versions[video_id] = seq
+
+    def version(self, video_id):
+        """Seq of a video's last change (base_seq if it predates the tracked history)"""
+        return self.versions.get(video_id, self.base_seq)
+
+    def stage(self, video_id, label, now, context=None):
+        """Apply a change and queue it for the writer (caller holds the condition)"""
+        self.seq += 1
+        entry = {'op': 'set', 'seq': self.seq, 'id': video_id, 'label': label, 'ts': now}
+        query, pool = context or (None, None)
+        if query:
+            entry['query'] = query
+        if pool:
+            # Pool labels are keyed by (query, pool, videoId) and stay out of the delta sync
+            entry.update(op='pool', pool=pool)
+        self.apply(entry)
+        if not pool:
+            self.track(video_id, self.seq)
+        self.pending[pending_key(entry)] = entry
+
+    def get_all(self):
+        """Return a copy of all labels ({videoId: label})"""
+        with self.condition:
+            return dict(self.labels)
+
+    def set_label(self, video_id, label, context=None):
+        """Set one label unconditionally; None clears it. Returns the store's seq afterwards"""
+        with self.condition:
+            if not self.unchanged(video_id, label, context):
+                self.stage(video_id, label, time.time(), context)
+                self.condition.notify_all()
+            return self.seq
+
+    def update_labels(self, labels, contexts=None):
+        """Merge {videoId: label} into the store (None clears); returns the number of changed labels"""
+        contexts = contexts or {}
+        with self.condition:
+            now = time.time()
+            changed = 0
+            for video_id, label in labels.items():
+                if not self.unchanged(video_id, label, contexts.get(video_id)):
+                    self.stage(video_id, label, now, contexts.get(video_id))
+                    changed += 1
+            if changed:
+                self.condition.notify_all()
+            return changed
+
+    def changes_since(self, since):
+        """
+        Return (seq, reset, labels) for a client that has seen changes up to `since`.
+        
+        `labels` maps each video changed after `since` to its label (None if cleared);
+        with `reset` it is the full label map and replaces the client's copy.
+        Cost is proportional to the number of changes, not the number of labels.
+        """
+        with self.condition:
+            if since < self.base_seq or since > self.seq:
+                return self.seq, True, dict(self.labels)
+            changes = {}
+            for video_id, seq in reversed(self.versions.items()):
+                if seq <= since:
+                    break
+                changes[video_id] = self.labels.get(video_id)
+            return self.seq, False, changes
+
+    def apply_changes(self, base_seq, changes, contexts=None):
+        """
+        Apply a client's changes ({videoId: label}, None clears) made on top of `base_seq`.
+        `contexts` optionally gives the (query, pool) each change was made in.
+        
+        A change conflicts when the server changed the same video to a different
+        label after `base_seq`; conflicting changes are not applied.
+        
+        Returns:
+            (seq, applied, conflicts) with conflicts as
+            [{'videoId', 'label' (client), 'serverLabel', 'serverSeq'}]
+        """
+        with self.condition:
+            now = time.time()
+            applied = 0
+            conflicts = []
+            contexts = contexts or {}
+            for video_id, label in changes.items():
+                current = self.labels.get(video_id)
+                if self.unchanged(video_id, label, contexts.get(video_id)):
+                    continue
+                is_pool_label = bool(contexts.get(video_id) and contexts[video_id][1])
+                if not is_pool_label and current != label and self.version(video_id) > base_seq:
+                    conflicts.append({'videoId': video_id, 'label': label,
+                                      'serverLabel': current, 'serverSeq': self.version(video_id)})
+                    continue
+                self.stage(video_id, label, now, contexts.get(video_id))
+                applied += 1
+            if applied:
+                self.condition.notify_all()
+            return self.seq, applied, conflicts
+
+    def update_pool_labels(self, query, pool, labels, clear=False):
+        """
+        Merge {videoId: label} (None clears) into one dataset pool's labels.
+        With `clear`, every label of the pool not in `labels` is cleared first.
+        
+        Returns:
+            (seq, number of changed labels)
+        """
+        with self.condition:
+            now = time.time()
+            changes = dict.fromkeys(self.pool_labels.get(query, {}).get(pool, {})) if clear else {}
+            changes.update(labels)
+            changed = 0
+            for video_id, label in changes.items():
+                if not self.unchanged(video_id, label, (query, pool)):
+                    self.stage(video_id, label, now, (query, pool))
+                    changed += 1
+            if changed:
+                self.condition.notify_all()
+            return self.seq, changed
+
+    def clear(self):
+        """Remove every label and wait until the empty snapshot is on disk"""
+        with self.condition:
+            self.labels.clear()
+            self.pending.clear()
+            self.versions.clear()
+            self.contexts.clear()
+            self.pool_labels.clear()
+            self.query_stats.clear()
+            self.pool_stats.clear()
+            # Clients synced before the clear get the (empty) full map on their next pull
+            self.seq += 1
+            self.base_seq = self.seq
+            self.compact_requested = True
+            self.condition.notify_all()
+        self.flush()
+
+    def flush(self):
+        """Block until every change made so far is committed"""
+        with self.condition:
+            self.flush_requested = True
+            self.condition.notify_all()
+            while (self.pending or self.compact_requested or self.committing) and self.writer.is_alive():
+                self.condition.wait()
+            self.flush_requested = False
+
+    def close(self):
+        """Commit outstanding changes and stop the writer"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.writer.join()
+        self.journal.close()
+
+    def run_writer(self):
+        """Writer thread: gather a burst of changes for `commit_interval`, then commit it"""
+        while True:
+            with self.condition:
+                while not (self.pending or self.compact_requested or self.closed):
+                    self.condition.wait()
+                deadline = time.monotonic() + self.commit_interval
+                while not (self.closed or self.flush_requested) and time.monotonic() < deadline:
+                    self.condition.wait(timeout=deadline - time.monotonic())
+                if self.closed and not (self.pending or self.compact_requested):
+                    return
+            self.commit()
+
+    def commit(self):
+        """Write the pending changes as one fsync'd journal append, or compact (writer thread only)"""
+        with self.condition:
+            entries = list(self.pending.values())
+            self.pending = {}
+            compact = (self.compact_requested or
+                       self.journal_entries + len(entries) >= max(COMPACT_MIN_ENTRIES, len(self.labels)))
+            # The snapshot already contains the pending changes, so they need no journal entries
+            snapshot = {'seq': self.seq, 'labels': dict(self.labels), 'contexts': dict(self.contexts),
+                        'pools': {query: {pool: dict(labels) for pool, labels in pools.items()}
+                                  for query, pools in self.pool_labels.items()}} if compact else None
+            self.compact_requested = False
+            self.committing = True
+
+        try:
+            if compact:
+                self.write_snapshot(snapshot)
+            elif entries:
+                self.journal.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries))
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+                self.journal_entries += len(entries)
+        except OSError as e:
+            print(f"❌ Error writing labels: {e}")
+            with self.condition:
+                # Keep the failed changes for the next commit unless newer ones replaced them
+                for entry in entries:
+                    self.pending.setdefault(pending_key(entry), entry)
+                self.compact_requested = self.compact_requested or compact
+        finally:
+            with self.condition:
+                self.committing = False
+                self.commits += 1
+                self.condition.notify_all()
+
+    def write_snapshot(self, snapshot):
+        """Atomically replace the snapshot and truncate the journal (writer thread only)"""
+        temp_path = self.snapshot_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # A crash before the truncate is harmless: replay skips entries up to the snapshot's seq
+        self.journal.truncate(0)
+        os.fsync(self.journal.fileno())
+        self.journal_entries = 0
+
+
+def pending_key(entry):
+    """Key a pending change is merged under: the video, or (query, pool, video) for pool labels"""
+    return (entry['query'], entry['pool'], entry['id']) if entry.get('pool') else entry['id']
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Annotation Score Cache
+Compiles each annotation file under downloads/ into NumPy arrays in
+data/score_cache/: float32 scores, string tables of video IDs and URLs, and
+the ranking permutation (highest score first). The arrays are memory-mapped
+on load and only rebuilt when the source file's size or mtime changes, so
+ranking, score filtering and pagination never re-parse the JSON.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from array import array
+from pathlib import Path
+
+from annotation_stream import AnnotationStream, annotation_video_id, iter_batches
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUMPY_AVAILABLE = np is not None
+
+SCORE_CACHE_DIR = Path('data') / 'score_cache'
+
+# Bumped when the cached layout changes, so older caches are rebuilt
+SCORE_CACHE_FORMAT = 3
+
+# Distribution summary written to meta.json at build time: quantiles, histogram bins over [0, 1],
+# and the frontend's confidence classes (getConfidenceClass / getScoreClass thresholds)
+STAT_QUANTILES = (0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+HISTOGRAM_BINS = 20
+CONFIDENCE_CLASSES = (('excellent', 0.8), ('good', 0.6), ('fair', 0.4), ('poor', 0.2), ('very-poor', None))
+
+# Arrays written per annotation file (<name>.npy)
+ARRAY_NAMES = ('scores', 'order', 'ranked_scores', 'ranked_cumsum', 'ids_data', 'ids_offsets', 'urls_data', 'urls_offsets')
+
+
+class StringTable:
+    """Read-only strings stored as one UTF-8 byte array plus n+1 offsets"""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode('utf-8')
+
+
+class ScoreTable:
+    """One annotation file's memory-mapped score arrays"""
+
+    def __init__(self, cache_dir, meta):
+        self.meta = meta
+        arrays = {name: np.load(cache_dir / f"{name}.npy", mmap_mode='r') for name in ARRAY_NAMES}
+        # Score of each result, in file order
+        self.scores = arrays['scores']
+        # Result indices by rank (descending score, ties in file order) and their scores
+        self.order = arrays['order']
+        self.ranked_scores = arrays['ranked_scores']
+        # Running float64 sums of ranked_scores (n + 1 entries, starting at 0) for O(1) range means
+        self.ranked_cumsum = arrays['ranked_cumsum']
+        self.ids = StringTable(arrays['ids_data'], arrays['ids_offsets'])
+        self.urls = StringTable(arrays['urls_data'], arrays['urls_offsets'])
+
+    def __len__(self):
+        return len(self.scores)
+
+    def rank_range(self, min_score=None, max_score=None):
+        """[start, end) ranks whose scores lie within the bounds (ranked_scores is descending)"""
+        # Binary searches over the reversed (ascending) view, which numpy searches without copying
+        ascending = self.ranked_scores[::-1]
+        count = len(self)
+        start = 0 if max_score is None else count - int(np.searchsorted(ascending, np.float32(max_score), side='right'))
+        end = count if min_score is None else count - int(np.searchsorted(ascending, np.float32(min_score), side='left'))
+        return start, max(start, end)
+
+    def row(self, rank):
+        """Ranked result as sent to the frontend"""
+        index = int(self.order[rank])
+        return {'rank': rank + 1, 'id': self.ids[index], 'url': self.urls[index],
+                'score': float(self.ranked_scores[rank])}
+
+    def summary(self, start, end):
+        """Count, mean and lowest score of the ranks in [start, end)"""
+        count = end - start
+        if count <= 0:
+            return {'count': 0, 'meanScore': None, 'cutoffScore': None}
+        return {'count': count,
+                'meanScore': float(self.ranked_cumsum[end] - self.ranked_cumsum[start]) / count,
+                'cutoffScore': float(self.ranked_scores[end - 1])}
+
+    def top(self, k, limit=0):
+        """Summary of the k best-scoring results plus the first `limit` of them"""
+        end = min(max(0, k), len(self))
+        return self.summary(0, end), [self.row(rank) for rank in range(min(end, limit))]
+
+    def above(self, min_score, limit=0):
+        """Summary of the results scoring at least min_score plus the first `limit` of them"""
+        start, end = self.rank_range(min_score=min_score)
+        return self.summary(start, end), [self.row(rank) for rank in range(start, min(end, start + limit))]
+
+    def page(self, offset=0, limit=50, min_score=None, max_score=None):
+        """(matching count, rows) for one page of the ranking, optionally limited to a score range"""
+        start, end = self.rank_range(min_score, max_score)
+        first = min(end, start + offset)
+        return end - start, [self.row(rank) for rank in range(first, min(end, first + limit))]
+
+
+def cache_dir_for(json_file):
+    """Cache directory of an annotation file (its downloads/-relative path made flat, plus a hash of it)"""
+    relative = Path(json_file).relative_to('downloads')
+    digest = hashlib.sha1(relative.as_posix().encode('utf-8')).hexdigest()[:8]
+    return SCORE_CACHE_DIR / f"{'__'.join(relative.with_suffix('').parts).replace(' ', '_')}-{digest}"
+
+
+def source_signature(json_file):
+    """What the cache is validated against: the source's size and mtime"""
+    stats = Path(json_file).stat()
+    return {'source': str(json_file), 'size': stats.st_size, 'mtimeNs': stats.st_mtime_ns,
+            'format': SCORE_CACHE_FORMAT}
+
+
+def score_distribution(ranked_scores):
+    """Count, mean/stddev, quantiles, histogram and confidence-class counts of descending scores"""
+    values = ranked_scores.astype(np.float64)
+    # Scores are probabilities; the outer bins absorb anything outside [0, 1]
+    edges = np.linspace(0.0, 1.0, HISTOGRAM_BINS + 1)
+    counts, _ = np.histogram(np.clip(values, 0.0, 1.0), bins=edges)
+    ascending = ranked_scores[::-1]
+    classes = {}
+    counted = 0
+    for name, threshold in CONFIDENCE_CLASSES:
+        # Results scoring >= threshold, minus those already counted in a higher class
+        at_least = len(values) if threshold is None else len(values) - int(np.searchsorted(ascending, np.float32(threshold), side='left'))
+        classes[name] = at_least - counted
+        counted = at_least
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values[-1]),
+        'max': float(values[0]),
+        'quantiles': {str(q): float(v) for q, v in zip(STAT_QUANTILES, np.quantile(values, STAT_QUANTILES))},
+        'histogram': {'edges': edges.round(6).tolist(), 'counts': counts.tolist()},
+        'classes': classes,
+    }
+
+
+def build_score_cache(json_file, cache_dir):
+    """Stream an annotation file into the cache arrays; returns the metadata, or None if it holds no scores"""
+    stream = AnnotationStream(json_file)
+    signature = source_signature(json_file)
+    scores = array('f')
+    strings = {'ids': (bytearray(), array('q', [0])), 'urls': (bytearray(), array('q', [0]))}
+    question = label = ''
+
+    for batch in iter_batches(stream):
+        if not scores:
+            first_result = batch[0]
+            if not isinstance(first_result, dict) or 'score' not in first_result:
+                return None
+            if stream.is_array and 'video' not in first_result:
+                return None
+            question = first_result.get('question', '')
+            label = first_result.get('label', '')
+        for result in batch:
+            video_url = result.get('video', '')
+            # Same ID (and None -> 0.0 score) as convert_annotation_data
+            values = {'ids': annotation_video_id(Path(json_file), video_url, len(scores)), 'urls': video_url}
+            scores.append(result.get('score') or 0.0)
+            for name, value in values.items():
+                data, offsets = strings[name]
+                data.extend(value.encode('utf-8'))
+                offsets.append(len(data))
+    if not scores:
+        return None
+
+    score_array = np.frombuffer(scores, dtype=np.float32)
+    # Stable sort of the negated scores: descending, equal scores keep file order
+    order = np.argsort(-score_array, kind='stable').astype(np.int64)
+    arrays = {
+        'scores': score_array,
+        'order': order,
+        'ranked_scores': score_array[order],
+        'ranked_cumsum': np.concatenate(([0.0], np.cumsum(score_array[order], dtype=np.float64))),
+        'ids_data': np.frombuffer(bytes(strings['ids'][0]), dtype=np.uint8),
+        'ids_offsets': np.frombuffer(strings['ids'][1], dtype=np.int64),
+        'urls_data': np.frombuffer(bytes(strings['urls'][0]), dtype=np.uint8),
+        'urls_offsets': np.frombuffer(strings['urls'][1], dtype=np.int64),
+    }
+
+    # Build next to the cache and swap it in, so readers only ever map a complete set
+    tmp_dir = cache_dir.with_name(cache_dir.name + f'.tmp{os.getpid()}')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for name, values in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", values)
+    meta = {**signature, 'count': len(score_array), 'question': question, 'label': label,
+            'processingTime': stream.meta.get('time', 0), 'stats': score_distribution(arrays['ranked_scores'])}
+    with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    # Already-mapped arrays stay valid after their files are replaced
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    return meta
+
+
+def load_meta(cache_dir):
+    try:
+        with open(cache_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class ScoreCache:
+    """Score tables by annotation file, rebuilt when their source changes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {}
+
+    def get(self, json_file):
+        """Return the ScoreTable for an annotation file (building its cache if stale), or None if it has no scores"""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("The score cache needs numpy (pip install numpy)")
+        json_file = Path(json_file)
+        signature = source_signature(json_file)
+        with self.lock:
+            table = self.tables.get(json_file)
+            if table is not None and all(table.meta.get(key) == value for key, value in signature.items()):
+                return table
+
+            cache_dir = cache_dir_for(json_file)
+            meta = load_meta(cache_dir)
+            if meta is None or any(meta.get(key) != value for key, value in signature.items()):
+                meta = build_score_cache(json_file, cache_dir)
+                if meta is None:
+                    self.tables.pop(json_file, None)
+                    return None
+                print(f"🧮 Compiled score cache for {json_file} ({meta['count']} results)")
+
+            table = self.tables[json_file] = ScoreTable(cache_dir, meta)
+            return table
+
+    def all_stats(self):
+        """Score statistics of every annotation file with an up-to-date cache, keyed by path under downloads/"""
+        stats = {}
+        if not SCORE_CACHE_DIR.exists():
+            return stats
+        for meta_path in sorted(SCORE_CACHE_DIR.glob('*/meta.json')):
+            meta = load_meta(meta_path.parent)
+            if not meta or meta.get('format') != SCORE_CACHE_FORMAT:
+                continue
+            try:
+                current = source_signature(meta['source'])
+            except OSError:
+                continue
+            if any(meta.get(key) != value for key, value in current.items()):
+                continue
+            stats[Path(meta['source']).relative_to('downloads').as_posix()] = {
+                'question': meta['question'], 'stats': meta['stats']}
+        return stats
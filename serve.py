@@ -15,84 +15,71 @@ import threading
 import webbrowser
 import time
 import hashlib
+import atexit
 import re
 import subprocess
 import requests
 from urllib.parse import urlparse
 import tempfile
+import shutil
 import concurrent.futures
 import random
-from collections import defaultdict
 from urllib.parse import urlparse
+from catalog_db import VideoCatalog, CATALOG_DB_PATH, load_catalog_version, monitor_is_live
+from adaptive_concurrency import AdaptiveConcurrencyLimiter, load_concurrency_status
+from label_store import LabelStore
+from label_export import get_label_export
+from annotation_stream import (AnnotationStream, VideoSpool, annotation_files_signature, annotation_video_id,
+                               find_annotation_files, iter_batches)
+from score_cache import ScoreCache, NUMPY_AVAILABLE
 
-class SmartRateLimiter:
-    """Smart rate limiter that only applies delays when rate limits are hit"""
-    
-    def __init__(self):
-        self.domain_requests = defaultdict(list)
-        self.rate_limited_domains = set()
-        self.lock = threading.Lock()
-    
-    def should_delay(self, url):
-        """Check if we should delay before making a request to this URL"""
-        domain = urlparse(url).netloc
-        
-        with self.lock:
-            # If this domain has been rate limited recently, add a delay
-            if domain in self.rate_limited_domains:
-                return True
-            
-            # Check recent requests to this domain
-            now = time.time()
-            recent_requests = [req_time for req_time in self.domain_requests[domain] 
-                             if now - req_time < 60]  # Last minute
-            
-            # If we've made more than 10 requests to this domain in the last minute, delay
-            if len(recent_requests) > 10:
-                return True
-            
-            return False
-    
-    def record_request(self, url):
-        """Record a request to track rate limiting"""
-        domain = urlparse(url).netloc
-        with self.lock:
-            self.domain_requests[domain].append(time.time())
-    
-    def record_rate_limit(self, url):
-        """Record that we hit a rate limit for this domain"""
-        domain = urlparse(url).netloc
-        with self.lock:
-            self.rate_limited_domains.add(domain)
-            # Remove from rate limited set after 5 minutes
-            threading.Timer(300, lambda: self.rate_limited_domains.discard(domain)).start()
-    
-    def get_delay(self, url):
-        """Get appropriate delay for a URL"""
-        domain = urlparse(url).netloc
-        
-        with self.lock:
-            if domain in self.rate_limited_domains:
-                return random.uniform(2, 5)  # Longer delay for rate limited domains
-            
-            # Check recent requests
-            now = time.time()
-            recent_requests = [req_time for req_time in self.domain_requests[domain] 
-                             if now - req_time < 60]
-            
-            if len(recent_requests) > 10:
-                return random.uniform(0.5, 1.5)  # Short delay for high activity
-            
-            return 0  # No delay needed
+# Adaptive per-host concurrency for remote thumbnail generation (AIMD on 429/5xx and latency)
+thumbnail_limiter = AdaptiveConcurrencyLimiter(per_host_limit=6, initial_limit=2)
+
+# Shared SQLite catalog written by file_monitor.py (opened lazily once it exists)
+video_catalog = None
+
+# Video labels (journal + snapshot in data/), loaded when the first label request arrives
+label_store = None
+label_store_lock = threading.Lock()
+
+# Memory-mapped score arrays per annotation file (data/score_cache/), rebuilt when a file changes
+score_cache = ScoreCache()
 
-# Global rate limiter instance
-rate_limiter = SmartRateLimiter()
+# Last /api/annotation-data response, written to disk and reused while its ETag is unchanged
+ANNOTATION_RESPONSE_PATH = Path('data') / 'annotation_response.json'
+annotation_response_cache = {'etag': None}
+
+# Placeholder a spooled video list is encoded as (json.dumps escapes the NULs, so data can't collide with it)
+SPOOL_PLACEHOLDER = re.compile(r'"\\u0000spool(\d+)\\u0000"')
+
+def get_catalog():
+    """Return the video catalog if the file monitor has created one, else None"""
+    global video_catalog
+    if video_catalog is None and CATALOG_DB_PATH.exists():
+        try:
+            video_catalog = VideoCatalog(CATALOG_DB_PATH)
+            print(f"🗄️ Using video catalog: {CATALOG_DB_PATH}")
+        except Exception as e:
+            print(f"❌ Error opening video catalog: {e}")
+    return video_catalog
+
+def get_label_store():
+    """Return the shared label store, loading it on first use"""
+    global label_store
+    with label_store_lock:
+        if label_store is None:
+            label_store = LabelStore()
+            # Commit label changes still waiting for the writer when the server exits
+            atexit.register(label_store.close)
+            print(f"🏷️ Loaded {len(label_store.labels)} video labels")
+    return label_store
 
 class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def end_headers(self):
         # Add CORS headers
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, DELETE')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PATCH, OPTIONS, DELETE')
         self.send_header('Access-Control-Allow-Headers', '*')
         super().end_headers()
     
@@ -104,8 +91,14 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         if parsed_path.path == '/api/ranking-results':
             self.handle_ranking_results()
             return
+        elif parsed_path.path == '/api/rankings' or parsed_path.path.startswith('/api/rankings/'):
+            self.handle_rankings(parsed_path)
+            return
         elif parsed_path.path == '/api/labels':
-            self.handle_get_labels()
+            self.handle_get_labels(parsed_path)
+            return
+        elif parsed_path.path == '/api/label-stats':
+            self.handle_label_stats(parsed_path)
             return
         elif parsed_path.path == '/api/annotation-data':
             self.handle_get_annotation_data()
@@ -113,6 +106,33 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         elif parsed_path.path == '/api/generate-thumbnails':
             self.handle_generate_thumbnails()
             return
+        elif parsed_path.path == '/api/scores':
+            self.handle_scores(parsed_path)
+            return
+        elif parsed_path.path == '/api/score-stats':
+            self.handle_score_stats(parsed_path)
+            return
+        elif parsed_path.path in ('/api/scores/top', '/api/scores/above'):
+            self.handle_score_selection(parsed_path)
+            return
+        elif parsed_path.path == '/api/catalog/queries':
+            self.handle_catalog_queries(parsed_path)
+            return
+        elif parsed_path.path == '/api/catalog/videos':
+            self.handle_catalog_videos(parsed_path)
+            return
+        elif parsed_path.path == '/api/catalog/count':
+            self.handle_catalog_count(parsed_path)
+            return
+        elif parsed_path.path == '/api/catalog-version':
+            self.send_json_response(load_catalog_version())
+            return
+        elif parsed_path.path == '/api/concurrency-status':
+            self.send_json_response({
+                'thumbnails': thumbnail_limiter.snapshot(),
+                'downloads': load_concurrency_status()
+            })
+            return
         
         # Default file serving
         try:
@@ -134,11 +154,29 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         elif parsed_path.path == '/api/labels':
             self.handle_save_labels()
             return
+        elif parsed_path.path == '/api/labels/sync':
+            self.handle_sync_labels()
+            return
+        elif parsed_path.path == '/api/labels/pool':
+            self.handle_pool_labels()
+            return
         
         # Return 404 for other POST requests
         self.send_response(404)
         self.end_headers()
     
+    def do_PATCH(self):
+        """Handle PATCH requests"""
+        parsed_path = urllib.parse.urlparse(self.path)
+        
+        if parsed_path.path.startswith('/api/labels/'):
+            self.handle_patch_label(urllib.parse.unquote(parsed_path.path[len('/api/labels/'):]))
+            return
+        
+        # Return 404 for other PATCH requests
+        self.send_response(404)
+        self.end_headers()
+    
     def do_DELETE(self):
         """Handle DELETE requests"""
         parsed_path = urllib.parse.urlparse(self.path)
@@ -156,101 +194,376 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_response(200)
         self.end_headers()
     
-    def get_labels_file_path(self):
-        """Get the path to the labels storage file"""
-        labels_dir = Path('data')
-        labels_dir.mkdir(exist_ok=True)
-        return labels_dir / 'video_labels.json'
+    def send_json_response(self, data, status=200, etag=None):
+        """Send a compact JSON response (with an ETag header if given)"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode('utf-8'))
+    
+    def get_catalog_filters(self, params):
+        """Extract catalog filter arguments from query string parameters"""
+        return {
+            'query_key': params.get('query', [None])[0],
+            'category': params.get('category', [None])[0],
+            'subconcept': params.get('subconcept', [None])[0],
+            'resolution': params.get('resolution', [None])[0],
+            'search': params.get('search', [None])[0],
+        }
+    
+    def handle_catalog_queries(self, parsed_path):
+        """List catalog queries, optionally filtered by category/subconcept"""
+        try:
+            catalog = get_catalog()
+            if catalog is None:
+                self.send_json_response({'error': 'Catalog not available'}, 404)
+                return
+            
+            params = urllib.parse.parse_qs(parsed_path.query)
+            queries = catalog.list_queries(
+                category=params.get('category', [None])[0],
+                subconcept=params.get('subconcept', [None])[0]
+            )
+            self.send_json_response({'queries': queries})
+            
+        except Exception as e:
+            print(f"❌ Error listing catalog queries: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def send_not_modified_if_matching(self, etag):
+        """Answer 304 if the client already has this ETag; returns whether it did"""
+        if self.headers.get('If-None-Match') != etag:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+    
+    def handle_rankings(self, parsed_path):
+        """Ranking index from the catalog (/api/rankings) or one page of a folder's ranking (/api/rankings/<folderKey>)"""
+        try:
+            catalog = get_catalog()
+            if catalog is None:
+                self.send_json_response({'error': 'Catalog not available'}, 404)
+                return
+            
+            folder_key = urllib.parse.unquote(parsed_path.path[len('/api/rankings/'):])
+            if not folder_key:
+                version, rankings = catalog.list_rankings()
+                etag = f'"{version}"'
+                if not self.send_not_modified_if_matching(etag):
+                    self.send_json_response({'version': version, 'rankings': rankings}, etag=etag)
+                return
+            
+            params = urllib.parse.parse_qs(parsed_path.query)
+            limit = max(1, min(int(params.get('limit', ['100'])[0]), 1000))
+            offset = max(0, int(params.get('offset', ['0'])[0]))
+            page = catalog.get_ranking_page(folder_key, offset, limit)
+            if page is None:
+                self.send_json_response({'error': f'No rankings for {folder_key}'}, 404)
+                return
+            
+            # The file's content hash: a page only changes when the ranking file does
+            etag = f'"{page["etag"]}"'
+            if not self.send_not_modified_if_matching(etag):
+                self.send_json_response(page, etag=etag)
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"❌ Error reading rankings: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def get_score_table(self, params):
+        """Resolve ?file=<annotation JSON under downloads/> to its score table (ValueError/LookupError if unusable)"""
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("numpy is not installed")
+        relative = params.get('file', [''])[0]
+        json_file = Path('downloads') / relative
+        if not relative or json_file.suffix != '.json' or not json_file.resolve().is_relative_to(Path('downloads').resolve()):
+            raise ValueError("file must be an annotation JSON path under downloads/")
+        if not json_file.is_file():
+            raise LookupError(f"No annotation file {relative}")
+        table = score_cache.get(json_file)
+        if table is None:
+            raise LookupError(f"{relative} has no annotation scores")
+        return table
+    
+    def handle_scores(self, parsed_path):
+        """Page through an annotation file's ranking (highest score first), optionally within a score range"""
+        try:
+            params = urllib.parse.parse_qs(parsed_path.query)
+            table = self.get_score_table(params)
+            limit = max(1, min(int(params.get('limit', ['50'])[0]), 1000))
+            offset = max(0, int(params.get('offset', ['0'])[0]))
+            min_score = params.get('min_score', [None])[0]
+            max_score = params.get('max_score', [None])[0]
+            
+            total, results = table.page(
+                offset=offset,
+                limit=limit,
+                min_score=None if min_score is None else float(min_score),
+                max_score=None if max_score is None else float(max_score)
+            )
+            self.send_json_response({
+                'question': table.meta['question'],
+                'count': len(table),
+                'total': total,
+                'limit': limit,
+                'offset': offset,
+                'results': results
+            })
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except LookupError as e:
+            self.send_json_response({'error': str(e)}, 404)
+        except RuntimeError as e:
+            self.send_json_response({'error': str(e)}, 501)
+        except Exception as e:
+            print(f"❌ Error reading scores: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_score_stats(self, parsed_path):
+        """Score distribution (count, mean/std, quantiles, histogram, confidence classes) of one annotation file, or of all"""
+        try:
+            params = urllib.parse.parse_qs(parsed_path.query)
+            if 'file' not in params:
+                if not NUMPY_AVAILABLE:
+                    raise RuntimeError("numpy is not installed")
+                self.send_json_response({'files': score_cache.all_stats()})
+                return
+            
+            table = self.get_score_table(params)
+            self.send_json_response({
+                'file': params['file'][0],
+                'question': table.meta['question'],
+                'stats': table.meta['stats']
+            })
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except LookupError as e:
+            self.send_json_response({'error': str(e)}, 404)
+        except RuntimeError as e:
+            self.send_json_response({'error': str(e)}, 501)
+        except Exception as e:
+            print(f"❌ Error reading score stats: {e}")
+            self.send_json_response({'error': str(e)}, 500)
     
-    def handle_get_labels(self):
-        """Handle GET request for video labels"""
+    def handle_score_selection(self, parsed_path):
+        """Top-k (?k=) or score >= t (?min_score=) selection: count, mean and cutoff score, plus the first ?limit= rows"""
         try:
-            labels_file = self.get_labels_file_path()
+            params = urllib.parse.parse_qs(parsed_path.query)
+            table = self.get_score_table(params)
+            limit = max(0, min(int(params.get('limit', ['0'])[0]), 1000))
             
-            if labels_file.exists():
-                with open(labels_file, 'r', encoding='utf-8') as f:
-                    labels_data = json.load(f)
+            if parsed_path.path == '/api/scores/top':
+                summary, results = table.top(int(params.get('k', ['100'])[0]), limit)
             else:
-                labels_data = {}
+                if 'min_score' not in params:
+                    raise ValueError("min_score is required")
+                summary, results = table.above(float(params['min_score'][0]), limit)
+            
+            self.send_json_response({'total': len(table), **summary, 'results': results})
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except LookupError as e:
+            self.send_json_response({'error': str(e)}, 404)
+        except RuntimeError as e:
+            self.send_json_response({'error': str(e)}, 501)
+        except Exception as e:
+            print(f"❌ Error selecting scores: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_catalog_videos(self, parsed_path):
+        """Browse catalog videos with filtering, sorting and pagination"""
+        try:
+            catalog = get_catalog()
+            if catalog is None:
+                self.send_json_response({'error': 'Catalog not available'}, 404)
+                return
+            
+            params = urllib.parse.parse_qs(parsed_path.query)
+            filters = self.get_catalog_filters(params)
+            limit = max(1, min(int(params.get('limit', ['50'])[0]), 1000))
+            offset = max(0, int(params.get('offset', ['0'])[0]))
+            
+            videos = catalog.browse_videos(
+                sort=params.get('sort', ['title'])[0],
+                order=params.get('order', ['asc'])[0],
+                limit=limit,
+                offset=offset,
+                **filters
+            )
+            self.send_json_response({
+                'total': catalog.count_videos(**filters),
+                'limit': limit,
+                'offset': offset,
+                'videos': videos
+            })
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"❌ Error browsing catalog videos: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_catalog_count(self, parsed_path):
+        """Count catalog videos matching the given filters"""
+        try:
+            catalog = get_catalog()
+            if catalog is None:
+                self.send_json_response({'error': 'Catalog not available'}, 404)
+                return
             
-            # Send success response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
+            params = urllib.parse.parse_qs(parsed_path.query)
+            self.send_json_response({'count': catalog.count_videos(**self.get_catalog_filters(params))})
             
-            self.wfile.write(json.dumps(labels_data).encode('utf-8'))
+        except Exception as e:
+            print(f"❌ Error counting catalog videos: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def read_json_body(self):
+        """Read and parse the request's JSON body"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        if content_length == 0:
+            raise ValueError("No data provided")
+        return json.loads(self.rfile.read(content_length).decode('utf-8'))
+    
+    def parse_label_context(self, context):
+        """Turn a {"query": folder, "pool": name} object into the store's (query, pool) context"""
+        if not isinstance(context, dict) or not context.get('query'):
+            return None
+        return (str(context['query']), str(context['pool']) if context.get('pool') else None)
+    
+    def handle_get_labels(self, parsed_path):
+        """Handle GET request for video labels (all, or the changes after ?since=<seq>)"""
+        try:
+            params = urllib.parse.parse_qs(parsed_path.query)
+            if 'since' not in params:
+                self.send_json_response(get_label_store().get_all())
+                return
+            
+            seq, reset, labels = get_label_store().changes_since(int(params['since'][0]))
+            self.send_json_response({'seq': seq, 'reset': reset, 'labels': labels})
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
             
         except Exception as e:
             print(f"❌ Error getting labels: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
-            error_response = {'error': str(e)}
-            self.wfile.write(json.dumps(error_response).encode('utf-8'))
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_patch_label(self, video_id):
+        """Handle PATCH request to set ({"label": "yes"|"no"}) or clear ({"label": null}) one label"""
+        try:
+            if not video_id:
+                raise ValueError("No video ID provided")
+            request_data = self.read_json_body()
+            label = request_data.get('label')
+            if label is not None and not isinstance(label, str):
+                raise ValueError("Label must be a string or null")
+            
+            seq = get_label_store().set_label(video_id, label, self.parse_label_context(request_data))
+            self.send_json_response({'success': True, 'videoId': video_id, 'label': label, 'seq': seq})
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"❌ Error saving label: {e}")
+            self.send_json_response({'error': str(e)}, 500)
     
     def handle_save_labels(self):
-        """Handle POST request to save video labels"""
+        """Handle POST request to merge labels ({videoId: label}, null clears) into the store"""
         try:
-            # Get the content length
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
-                raise ValueError("No data provided")
+            labels_data = self.read_json_body()
+            if not isinstance(labels_data, dict):
+                raise ValueError("Labels must be a JSON object")
             
-            # Read the request body
-            post_data = self.rfile.read(content_length)
-            labels_data = json.loads(post_data.decode('utf-8'))
+            # Merged per video, so concurrent labelers never drop each other's labels
+            changes = get_label_store().update_labels(labels_data)
+            self.send_json_response({'success': True, 'message': 'Labels saved successfully', 'changes': changes})
             
-            # Save labels to file
-            labels_file = self.get_labels_file_path()
-            with open(labels_file, 'w', encoding='utf-8') as f:
-                json.dump(labels_data, f, indent=2, ensure_ascii=False)
+            print(f"✅ Saved labels for {len(labels_data)} videos ({changes} changed)")
             
-            # Send success response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
+        except Exception as e:
+            print(f"❌ Error saving labels: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_sync_labels(self):
+        """Handle POST of a client's label changes: {"baseSeq": n, "changes": {videoId: label|null}, "contexts": {...}}"""
+        try:
+            request_data = self.read_json_body()
+            changes = request_data.get('changes')
+            if not isinstance(changes, dict):
+                raise ValueError("changes must be a JSON object")
+            contexts = {
+                video_id: self.parse_label_context(context)
+                for video_id, context in (request_data.get('contexts') or {}).items()
+            }
             
-            response = {'success': True, 'message': 'Labels saved successfully'}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            seq, applied, conflicts = get_label_store().apply_changes(
+                int(request_data.get('baseSeq', 0)), changes, contexts)
+            self.send_json_response({'success': True, 'seq': seq, 'applied': applied, 'conflicts': conflicts})
             
-            print(f"✅ Saved labels for {len(labels_data)} videos")
+            if conflicts:
+                print(f"⚠️ Label sync: {applied} applied, {len(conflicts)} conflicts")
             
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
         except Exception as e:
-            print(f"❌ Error saving labels: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
+            print(f"❌ Error syncing labels: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_label_stats(self, parsed_path):
+        """Handle GET request for label counters (?query=<folder>&pool=<name> narrow them)"""
+        try:
+            params = urllib.parse.parse_qs(parsed_path.query)
+            self.send_json_response(get_label_store().label_stats(
+                query=params.get('query', [None])[0],
+                pool=params.get('pool', [None])[0]
+            ))
             
-            error_response = {'error': str(e)}
-            self.wfile.write(json.dumps(error_response).encode('utf-8'))
+        except Exception as e:
+            print(f"❌ Error loading label stats: {e}")
+            self.send_json_response({'error': str(e)}, 500)
+    
+    def handle_pool_labels(self):
+        """Handle POST of one dataset pool's labels: {"query", "pool", "labels": {videoId: label|null}, "clear": bool}"""
+        try:
+            request_data = self.read_json_body()
+            query, pool = request_data.get('query'), request_data.get('pool')
+            labels = request_data.get('labels') or {}
+            if not query or not pool:
+                raise ValueError("query and pool are required")
+            if not isinstance(labels, dict):
+                raise ValueError("labels must be a JSON object")
+            
+            seq, changed = get_label_store().update_pool_labels(
+                str(query), str(pool), labels, clear=bool(request_data.get('clear')))
+            self.send_json_response({'success': True, 'seq': seq, 'changed': changed})
+            
+        except ValueError as e:
+            self.send_json_response({'error': str(e)}, 400)
+        except Exception as e:
+            print(f"❌ Error saving pool labels: {e}")
+            self.send_json_response({'error': str(e)}, 500)
     
     def handle_clear_labels(self):
         """Handle DELETE request to clear all video labels"""
         try:
-            labels_file = self.get_labels_file_path()
-            
-            # Remove the labels file if it exists
-            if labels_file.exists():
-                labels_file.unlink()
-                print("✅ Cleared all video labels")
-            
-            # Send success response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
+            get_label_store().clear()
+            print("✅ Cleared all video labels")
             
-            response = {'success': True, 'message': 'All labels cleared successfully'}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self.send_json_response({'success': True, 'message': 'All labels cleared successfully'})
             
         except Exception as e:
             print(f"❌ Error clearing labels: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
-            error_response = {'error': str(e)}
-            self.wfile.write(json.dumps(error_response).encode('utf-8'))
+            self.send_json_response({'error': str(e)}, 500)
 
     def handle_ranking_results(self):
         """Scan for ranking_results.json files and return them"""
@@ -290,77 +603,30 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def handle_get_annotation_data(self):
         """Scan for annotation JSON files and integrate them with scraped data"""
         try:
-            combined_data = {}
-            downloads_dir = Path('downloads')
-            
-            # First, load existing scraped data if it exists
-            scraped_data_file = Path('scraped-data.json')
-            if scraped_data_file.exists():
-                with open(scraped_data_file, 'r', encoding='utf-8') as f:
-                    combined_data = json.load(f)
-            
-            # Then scan for annotation JSON files in downloads directory
-            if downloads_dir.exists():
-                for json_file in downloads_dir.rglob('*.json'):
-                    # Skip ranking_results.json and query_metadata.json files
-                    if json_file.name in ['ranking_results.json', 'query_metadata.json']:
-                        continue
-                    
-                    try:
-                        with open(json_file, 'r', encoding='utf-8') as f:
-                            annotation_data = json.load(f)
-                        
-                        # Check if this is an annotation file (has 'results' field with score data)
-                        if 'results' in annotation_data and isinstance(annotation_data['results'], list):
-                            if annotation_data['results'] and 'score' in annotation_data['results'][0]:
-                                # Convert annotation data to our format
-                                converted_data = self.convert_annotation_data(json_file, annotation_data)
-                                if converted_data:
-                                    # Merge into combined data
-                                    category = converted_data['category']
-                                    subconcept = converted_data['subconcept']
-                                    
-                                    if category not in combined_data:
-                                        combined_data[category] = {}
-                                    if subconcept not in combined_data[category]:
-                                        combined_data[category][subconcept] = {'queries': []}
-                                    
-                                    combined_data[category][subconcept]['queries'].append(converted_data['query'])
-                                    
-                                    print(f"✅ Loaded annotation data: {json_file}")
-                        # Also check if the file is directly an array of annotation results
-                        elif isinstance(annotation_data, list) and annotation_data:
-                            if 'score' in annotation_data[0] and 'video' in annotation_data[0]:
-                                # Convert to the expected format
-                                formatted_data = {
-                                    'results': annotation_data,
-                                    'time': 0  # Default time if not provided
-                                }
-                                # Convert annotation data to our format
-                                converted_data = self.convert_annotation_data(json_file, formatted_data)
-                                if converted_data:
-                                    # Merge into combined data
-                                    category = converted_data['category']
-                                    subconcept = converted_data['subconcept']
-                                    
-                                    if category not in combined_data:
-                                        combined_data[category] = {}
-                                    if subconcept not in combined_data[category]:
-                                        combined_data[category][subconcept] = {'queries': []}
-                                    
-                                    combined_data[category][subconcept]['queries'].append(converted_data['query'])
-                                    
-                                    print(f"✅ Loaded annotation data (array format): {json_file}")
-                    except Exception as e:
-                        print(f"Error reading annotation file {json_file}: {e}")
-            
-            # Send JSON response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
-            response_data = json.dumps(combined_data, indent=2)
-            self.wfile.write(response_data.encode('utf-8'))
+            # The ETag is the catalog version, which covers scraped data and every annotation file,
+            # so unchanged data is answered with 304 (or from disk) without parsing anything
+            etag, catalog_version = self.get_annotation_data_etag()
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('X-Catalog-Version', str(catalog_version))
+                self.end_headers()
+                return
+            
+            if annotation_response_cache['etag'] != etag or not ANNOTATION_RESPONSE_PATH.exists():
+                self.write_annotation_response(self.build_annotation_data())
+                annotation_response_cache['etag'] = etag
+            
+            # Send the JSON response straight from the file
+            with open(ANNOTATION_RESPONSE_PATH, 'rb') as f:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+                self.send_header('ETag', etag)
+                self.send_header('X-Catalog-Version', str(catalog_version))
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile)
             
         except Exception as e:
             print(f"Error handling annotation data: {e}")
@@ -371,8 +637,99 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             error_response = json.dumps({'error': str(e)})
             self.wfile.write(error_response.encode('utf-8'))
     
-    def convert_annotation_data(self, json_file_path, annotation_data):
-        """Convert annotation JSON to our data format"""
+    def get_annotation_data_etag(self):
+        """Return (etag, catalog_version) for the current scraped + annotation data"""
+        version_info = load_catalog_version()
+        # A running file monitor keeps annotationHash current; otherwise it may be stale, so stat the files
+        annotation_hash = version_info.get('annotationHash') if monitor_is_live() else None
+        if not annotation_hash:
+            annotation_hash = annotation_files_signature(Path('downloads'))
+        
+        # The file monitor bumps the version whenever scraped data or an annotation file changes
+        digest = hashlib.sha256(f"{version_info.get('contentHash')}:{annotation_hash}".encode('utf-8'))
+        return f'"{digest.hexdigest()[:32]}"', version_info.get('version', 0)
+    
+    def write_annotation_response(self, combined_data):
+        """Write the combined data to ANNOTATION_RESPONSE_PATH, copying spooled annotation videos in score order"""
+        spools = []
+        for subconcepts in combined_data.values():
+            for subconcept_data in subconcepts.values():
+                for query in subconcept_data.get('queries', []):
+                    if isinstance(query.get('videos'), VideoSpool):
+                        # Encoded as a placeholder string that is swapped for the spooled entries below
+                        spools.append(query['videos'])
+                        query['videos'] = f"\0spool{len(spools) - 1}\0"
+        
+        # Everything but the spooled videos is small enough to encode in one go
+        parts = SPOOL_PLACEHOLDER.split(json.dumps(combined_data, ensure_ascii=False))
+        ANNOTATION_RESPONSE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = ANNOTATION_RESPONSE_PATH.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                for i, part in enumerate(parts):
+                    if i % 2 == 0:
+                        f.write(part.encode('utf-8'))
+                        continue
+                    f.write(b'[')
+                    for j, entry in enumerate(spools[int(part)].iter_ranked()):
+                        if j:
+                            f.write(b', ')
+                        f.write(entry)
+                    f.write(b']')
+            os.replace(tmp_path, ANNOTATION_RESPONSE_PATH)
+        finally:
+            for spool in spools:
+                spool.close()
+    
+    def build_annotation_data(self):
+        """
+        Merge scraped data with every annotation JSON file under downloads/
+        (annotation queries hold their videos as a VideoSpool; see write_annotation_response)
+        """
+        combined_data = {}
+        downloads_dir = Path('downloads')
+        
+        # First, load existing scraped data (from the catalog when available)
+        scraped_data_file = Path('scraped-data.json')
+        catalog = get_catalog()
+        if catalog is not None:
+            combined_data = catalog.get_tree()
+        if not combined_data and scraped_data_file.exists():
+            with open(scraped_data_file, 'r', encoding='utf-8') as f:
+                combined_data = json.load(f)
+        
+        # Then scan for annotation JSON files in downloads directory (ranking results, query metadata
+        # and downloader sidecars are skipped)
+        if downloads_dir.exists():
+            for json_file in find_annotation_files(downloads_dir):
+                try:
+                    # Results are streamed into the conversion in batches instead of loading the whole file
+                    stream = AnnotationStream(json_file)
+                    converted_data = self.convert_annotation_data(json_file, stream)
+                    if converted_data:
+                        # Merge into combined data
+                        category = converted_data['category']
+                        subconcept = converted_data['subconcept']
+                        
+                        if category not in combined_data:
+                            combined_data[category] = {}
+                        if subconcept not in combined_data[category]:
+                            combined_data[category][subconcept] = {'queries': []}
+                        
+                        combined_data[category][subconcept]['queries'].append(converted_data['query'])
+                        
+                        print(f"✅ Loaded annotation data{' (array format)' if stream.is_array else ''}: {json_file}")
+                        
+                        # Compile the score arrays and distribution summary now, not on the first ranking request
+                        if NUMPY_AVAILABLE:
+                            score_cache.get(json_file)
+                except Exception as e:
+                    print(f"Error reading annotation file {json_file}: {e}")
+        
+        return combined_data
+    
+    def convert_annotation_data(self, json_file_path, results):
+        """Convert annotation results (any iterable, e.g. an AnnotationStream) to our data format"""
         try:
             # Extract category and subconcept from file path
             # Example: downloads/camera movement/dolly_zoom/dolly_zoom.json
@@ -386,120 +743,29 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             subconcept = path_parts[1] if len(path_parts) > 1 else path_parts[0]  # "dolly_zoom"
             file_stem = json_file_path.stem  # "dolly_zoom"
             
-            # Get the first result to extract common fields
-            if not annotation_data['results']:
-                return None
-            
-            first_result = annotation_data['results'][0]
-            question = first_result.get('question', '')
-            label = first_result.get('label', '')
-            
-            # Collect all videos that need thumbnails
-            videos_needing_thumbnails = []
-            video_data = []
-            
-            for i, result in enumerate(annotation_data['results']):
-                video_url = result.get('video', '')
-                score = result.get('score', 0.0)
+            question = ''
+            # Converted entries go to a temporary file and are read back highest score first,
+            # so only one batch of raw results and one of converted entries is alive at a time
+            videos = VideoSpool()
+            for batch in iter_batches(results):
+                if not len(videos):
+                    # The first result decides whether this is an annotation file and carries the common fields
+                    first_result = batch[0]
+                    if not isinstance(first_result, dict) or 'score' not in first_result:
+                        videos.close()
+                        return None
+                    if getattr(results, 'is_array', False) and 'video' not in first_result:
+                        videos.close()
+                        return None
+                    question = first_result.get('question', '')
+                    label = first_result.get('label', '')
                 
-                # Handle None values explicitly
-                if score is None:
-                    score = 0.0
-                
-                # Extract video ID from URL (e.g., adobe_stock_11573423 from the URL)
-                video_id_match = re.search(r'adobe_stock_(\d+)', video_url)
-                if not video_id_match:
-                    # Try to extract from other URL patterns like dolly_out/1000564187.mp4
-                    video_id_match = re.search(r'/([^/]+)\.mp4$', video_url)
-                    video_id = video_id_match.group(1) if video_id_match else f"annotation_{i}"
-                else:
-                    video_id = video_id_match.group(1)
-                
-                # Generate a unique ID for this video
-                unique_id = hashlib.md5(f"{json_file_path}_{video_id}".encode()).hexdigest()[:8]
-                
-                # Extract filename from URL
-                filename = video_url.split('/')[-1] if video_url else f"video_{i}.mp4"
-                title = filename.replace('.mp4', '').replace('adobe_stock_', '')
-                
-                # Check if thumbnail already exists
-                thumbnails_dir = Path('thumbnails')
-                thumbnails_dir.mkdir(exist_ok=True)
-                thumbnail_filename = f"{unique_id}.jpg"
-                thumbnail_path = thumbnails_dir / thumbnail_filename
-                
-                # Store video data for later processing
-                video_data.append({
-                    'unique_id': unique_id,
-                    'title': title,
-                    'filename': filename,
-                    'video_url': video_url,
-                    'score': score,
-                    'question': question,
-                    'label': label,
-                    'thumbnail_path': thumbnail_path,
-                    'thumbnail_filename': thumbnail_filename
-                })
-                
-                # Add to parallel processing if thumbnail doesn't exist and is remote
-                if not thumbnail_path.exists() and video_url.startswith(('http://', 'https://')):
-                    videos_needing_thumbnails.append((video_url, thumbnail_path))
-            
-            # Generate thumbnails in parallel for remote videos
-            if videos_needing_thumbnails:
-                print(f"🖼️ Generating {len(videos_needing_thumbnails)} remote thumbnails in parallel...")
-                # Use smart rate limiting with more workers for better performance
-                with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                    future_to_path = {}
-                    for video_url, thumbnail_path in videos_needing_thumbnails:
-                        # Check if we need to delay based on smart rate limiting
-                        if rate_limiter.should_delay(video_url):
-                            delay = rate_limiter.get_delay(video_url)
-                            if delay > 0:
-                                print(f"⏰ Rate limiting: waiting {delay:.1f}s before {video_url.split('/')[-1]}")
-                                time.sleep(delay)
-                        
-                        future = executor.submit(self.generate_thumbnail_from_remote, video_url, thumbnail_path)
-                        future_to_path[future] = video_url
-                    
-                    # Collect results as they complete
-                    for future in concurrent.futures.as_completed(future_to_path):
-                        video_url = future_to_path[future]
-                        try:
-                            thumbnail_path = future.result()
-                            print(f"✅ Generated remote thumbnail for {video_url.split('/')[-1]}")
-                        except Exception as e:
-                            print(f"❌ Error generating remote thumbnail for {video_url}: {e}")
-            
-            # Now process all videos with thumbnails ready
-            videos = []
-            for video_info in video_data:
-                # Get thumbnail path (should already be generated or exist)
-                thumbnail_path = self.generate_thumbnail(video_info['video_url'], video_info['unique_id'])
-                
-                video_entry = {
-                    "id": video_info['unique_id'],
-                    "title": video_info['title'],
-                    "filename": video_info['filename'],
-                    "filepath": video_info['filename'],
-                    "duration": "0:00",  # Unknown duration
-                    "resolution": "Unknown",
-                    "fileSize": "Unknown",
-                    "modified": "Unknown",
-                    "tags": [],
-                    "thumbnail": thumbnail_path,
-                    "url": video_info['video_url'],
-                    "localPath": video_info['video_url'],
-                    "confidenceScore": video_info['score'],  # Add confidence score
-                    "question": video_info['question'],
-                    "label": video_info['label'],
-                    "isAnnotation": True  # Flag to identify annotation data
-                }
-                
-                videos.append(video_entry)
+                for video in self.convert_annotation_batch(json_file_path, batch, len(videos), question, label):
+                    videos.append(video)
             
-            # Sort videos by confidence score (highest first)
-            videos.sort(key=lambda x: x['confidenceScore'], reverse=True)
+            if not len(videos):
+                videos.close()
+                return None
             
             # Create query entry
             query_entry = {
@@ -509,7 +775,8 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 "totalResults": len(videos),
                 "videos": videos,
                 "isAnnotation": True,
-                "processingTime": annotation_data.get('time', 0)
+                "processingTime": getattr(results, 'meta', {}).get('time', 0),
+                "annotationFile": relative_path.as_posix()  # ?file= for /api/scores and /api/score-stats
             }
             
             return {
@@ -522,6 +789,98 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             print(f"Error converting annotation data from {json_file_path}: {e}")
             return None
     
+    def convert_annotation_batch(self, json_file_path, batch, start_index, question, label):
+        """Turn one batch of annotation results into video entries, generating missing thumbnails in parallel"""
+        # Collect all videos that need thumbnails
+        videos_needing_thumbnails = []
+        video_data = []
+        
+        for i, result in enumerate(batch, start_index):
+            video_url = result.get('video', '')
+            score = result.get('score', 0.0)
+            
+            # Handle None values explicitly
+            if score is None:
+                score = 0.0
+            
+            # Unique ID from the file path and the video ID in the URL
+            unique_id = annotation_video_id(json_file_path, video_url, i)
+            
+            # Extract filename from URL
+            filename = video_url.split('/')[-1] if video_url else f"video_{i}.mp4"
+            title = filename.replace('.mp4', '').replace('adobe_stock_', '')
+            
+            # Check if thumbnail already exists
+            thumbnails_dir = Path('thumbnails')
+            thumbnails_dir.mkdir(exist_ok=True)
+            thumbnail_filename = f"{unique_id}.jpg"
+            thumbnail_path = thumbnails_dir / thumbnail_filename
+            
+            # Store video data for later processing
+            video_data.append({
+                'unique_id': unique_id,
+                'title': title,
+                'filename': filename,
+                'video_url': video_url,
+                'score': score,
+                'question': question,
+                'label': label,
+                'thumbnail_path': thumbnail_path,
+                'thumbnail_filename': thumbnail_filename
+            })
+            
+            # Add to parallel processing if thumbnail doesn't exist and is remote
+            if not thumbnail_path.exists() and video_url.startswith(('http://', 'https://')):
+                videos_needing_thumbnails.append((video_url, thumbnail_path))
+        
+        # Generate thumbnails in parallel for remote videos
+        if videos_needing_thumbnails:
+            print(f"🖼️ Generating {len(videos_needing_thumbnails)} remote thumbnails in parallel...")
+            # Workers share the adaptive limiter, which sets how many hit each host at once
+            with concurrent.futures.ThreadPoolExecutor(max_workers=thumbnail_limiter.per_host_limit) as executor:
+                future_to_path = {}
+                for video_url, thumbnail_path in videos_needing_thumbnails:
+                    future = executor.submit(self.generate_thumbnail_from_remote, video_url, thumbnail_path)
+                    future_to_path[future] = video_url
+                
+                # Collect results as they complete
+                for future in concurrent.futures.as_completed(future_to_path):
+                    video_url = future_to_path[future]
+                    try:
+                        thumbnail_path = future.result()
+                        print(f"✅ Generated remote thumbnail for {video_url.split('/')[-1]}")
+                    except Exception as e:
+                        print(f"❌ Error generating remote thumbnail for {video_url}: {e}")
+        
+        # Now process all videos with thumbnails ready
+        videos = []
+        for video_info in video_data:
+            # Get thumbnail path (should already be generated or exist)
+            thumbnail_path = self.generate_thumbnail(video_info['video_url'], video_info['unique_id'])
+            
+            video_entry = {
+                "id": video_info['unique_id'],
+                "title": video_info['title'],
+                "filename": video_info['filename'],
+                "filepath": video_info['filename'],
+                "duration": "0:00",  # Unknown duration
+                "resolution": "Unknown",
+                "fileSize": "Unknown",
+                "modified": "Unknown",
+                "tags": [],
+                "thumbnail": thumbnail_path,
+                "url": video_info['video_url'],
+                "localPath": video_info['video_url'],
+                "confidenceScore": video_info['score'],  # Add confidence score
+                "question": video_info['question'],
+                "label": video_info['label'],
+                "isAnnotation": True  # Flag to identify annotation data
+            }
+            
+            videos.append(video_entry)
+        
+        return videos
+    
     def generate_thumbnail(self, video_url, unique_id):
         """Generate thumbnail for a video (local or remote)"""
         try:
@@ -554,9 +913,6 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             try:
                 print(f"🖼️ Generating thumbnail from remote video: {video_url} (attempt {attempt + 1})")
                 
-                # Record this request for rate limiting
-                rate_limiter.record_request(video_url)
-                
                 # Use ffmpeg to extract a frame directly from the remote URL
                 cmd = [
                     'ffmpeg', '-y',  # Overwrite output file
@@ -568,8 +924,15 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     str(thumbnail_path)
                 ]
                 
-                # Run ffmpeg with timeout
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+                # Run ffmpeg with timeout, holding one of the host's adaptive slots
+                with thumbnail_limiter.limit(video_url):
+                    started = time.monotonic()
+                    try:
+                        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+                    except subprocess.TimeoutExpired:
+                        thumbnail_limiter.record(video_url, None)
+                        raise
+                    thumbnail_limiter.record(video_url, self.ffmpeg_http_status(result), time.monotonic() - started)
                 
                 if result.returncode == 0 and thumbnail_path.exists():
                     print(f"✅ Successfully generated thumbnail: {thumbnail_path}")
@@ -578,7 +941,6 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                     # Check if it's a rate limit error
                     stderr = result.stderr.lower()
                     if "429" in stderr or "too many requests" in stderr or "rate limit" in stderr:
-                        rate_limiter.record_rate_limit(video_url)
                         if attempt < max_retries - 1:
                             delay = base_delay * (2 ** attempt) + random.uniform(0, 1)
                             print(f"⏰ Rate limited, waiting {delay:.1f}s before retry...")
@@ -612,6 +974,19 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         
         return self.create_placeholder_thumbnail(thumbnail_path, video_url)
     
+    def ffmpeg_http_status(self, result):
+        """Best-effort HTTP status of an ffmpeg run on a remote URL (200 on success, None if unknown)"""
+        if result.returncode == 0:
+            return 200
+        stderr = result.stderr.lower()
+        if "429" in stderr or "too many requests" in stderr or "rate limit" in stderr:
+            return 429
+        match = re.search(r'http error (\d{3})|server returned (\d)xx', stderr)
+        if match:
+            return int(match.group(1)) if match.group(1) else int(match.group(2)) * 100
+        # Non-HTTP failures (codec, missing frame) say nothing about the host's load
+        return 200
+    
     def generate_thumbnail_from_local(self, video_path, thumbnail_path):
         """Generate thumbnail from local video file"""
         try:
@@ -676,80 +1051,50 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             return str(thumbnail_path)
     
     def handle_export_labels(self):
-        """Handle export of labeled videos to JSON file"""
+        """Handle export of labeled videos: append new ones to the query's JSONL stream (+ optional columnar file)"""
         try:
-            # Get the content length
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
-                raise ValueError("No data provided")
-            
-            # Read the request body
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            request_data = self.read_json_body()
             
             query_folder = request_data.get('queryFolder', '').strip()
             export_data = request_data.get('data', {})
+            columnar_format = request_data.get('format')
             
             if not query_folder or not export_data:
                 raise ValueError("Missing queryFolder or data")
             
-            # Create the data directory structure
-            data_dir = Path('data') / query_folder
-            data_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Generate filename with timestamp
-            timestamp = export_data.get('timestamp', '').replace(':', '-').replace('T', '_').split('.')[0]
-            filename = f"labeled_videos_{timestamp}.json"
-            file_path = data_dir / filename
-            
-            # Check if file already exists and append if it does
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        existing_data = json.load(f)
-                    
-                    # Append new videos to existing ones, avoiding duplicates
-                    existing_ids = {video['id'] for video in existing_data.get('exported_videos', [])}
-                    new_videos = [video for video in export_data['exported_videos'] 
-                                if video['id'] not in existing_ids]
-                    
-                    if new_videos:
-                        existing_data['exported_videos'].extend(new_videos)
-                        existing_data['timestamp'] = export_data['timestamp']  # Update timestamp
-                        export_data = existing_data
-                        print(f"Appended {len(new_videos)} new videos to existing file")
-                    else:
-                        print("No new videos to add - all videos already exist in file")
-                        
-                except Exception as e:
-                    print(f"Error reading existing file, creating new: {e}")
-            
-            # Write the JSON file
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False)
-            
-            # Send success response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
+            # Append to data/<queryFolder>/labeled_videos.jsonl; the ID index skips videos already exported
+            export = get_label_export(Path('data') / query_folder)
+            added = export.append(
+                export_data.get('exported_videos', []),
+                query=export_data.get('query', ''),
+                folder=export_data.get('folder', query_folder),
+                exported_at=export_data.get('timestamp', '')
+            )
+            if added:
+                print(f"Appended {added} new videos to {export.stream_path}")
+            else:
+                print("No new videos to add - all videos already exported")
             
             response = {
                 'success': True,
-                'filename': str(file_path),
-                'video_count': len(export_data['exported_videos'])
+                'filename': str(export.stream_path),
+                'video_count': len(export),
+                'added': added
             }
-            self.wfile.write(json.dumps(response).encode('utf-8'))
             
-            print(f"✅ Exported {len(export_data['exported_videos'])} videos to {file_path}")
+            # Optional columnar copy for training pipelines ("auto" picks parquet or npz)
+            if columnar_format:
+                columnar_path = export.write_columnar(None if columnar_format == 'auto' else columnar_format)
+                response['columnar'] = str(columnar_path)
+                print(f"📊 Wrote columnar export {columnar_path}")
+            
+            self.send_json_response(response)
+            
+            print(f"✅ Exported {len(export)} videos to {export.stream_path}")
             
         except Exception as e:
             print(f"❌ Export error: {e}")
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
-            error_response = {'success': False, 'error': str(e)}
-            self.wfile.write(json.dumps(error_response).encode('utf-8'))
+            self.send_json_response({'success': False, 'error': str(e)}, 500)
     
     def handle_generate_thumbnails(self):
         """Handle bulk thumbnail generation for local videos"""
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+WebDataset Shard Export
+
+Packs the "yes"-labeled videos exported to data/<queryFolder>/ into
+WebDataset-style tar shards: each sample is `<key>.mp4`, `<key>.jpg` (the
+thumbnail) and `<key>.json` (score, question, label, ...), stored next to
+each other so loaders can stream large sequential files. Shards hold a fixed
+number of samples, are written in parallel, and are listed in a wids-style
+shard index (`<prefix>-index.json`).
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from download_utils import (create_pooled_session, file_sha256, find_json_files, parse_json_file,
+                            resumable_download)
+
+logger = logging.getLogger(__name__)
+
+# Samples per shard unless --shard-size says otherwise
+DEFAULT_SHARD_SIZE = 1000
+
+# Fixed member mtime so re-exporting the same samples produces identical shards
+MEMBER_MTIME = 0
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; scraping-vis shard export)'}
+
+
+class ShardResult(NamedTuple):
+    """One written shard."""
+    path: Path
+    samples: int
+    size: int
+    sha256: str
+    missing: List[str]   # Sample keys written without a video (not found locally, fetch failed)
+
+
+def sample_key(record: Dict[str, Any]) -> str:
+    """WebDataset sample key: the video ID made safe for tar member names (no dots or slashes)."""
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in str(record['id']))
+
+
+def load_samples(data_dirs: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Collect the exported videos under the given data folders, first export of each ID wins.
+
+    Reads both the JSONL export streams and older labeled_videos_<timestamp>.json files.
+    """
+    samples = []
+    seen = set()
+    for data_dir in data_dirs:
+        for json_path in sorted(find_json_files(data_dir)):
+            if not json_path.name.startswith('labeled_videos'):
+                continue
+            data = parse_json_file(json_path)
+            for video in data.get('exported_videos', []):
+                if not video.get('id') or video['id'] in seen:
+                    continue
+                seen.add(video['id'])
+                samples.append({**video, 'query': video.get('query') or data.get('query', ''),
+                                'folder': video.get('folder') or data.get('folder', '')})
+    return samples
+
+
+def index_local_videos(video_dirs: Iterable[str]) -> Dict[str, List[Path]]:
+    """Map file names to every path they occur at under `video_dirs` (where the downloaders save them)."""
+    by_name = {}
+    for video_dir in video_dirs:
+        for root, dirs, files in os.walk(video_dir):
+            for file in files:
+                if file.lower().endswith(('.mp4', '.mov', '.webm')):
+                    by_name.setdefault(file, []).append(Path(root) / file)
+    return by_name
+
+
+def match_local_video(record: Dict[str, Any], paths: List[Path]) -> Optional[Path]:
+    """
+    Pick the local copy of a record's video among files sharing its name.
+
+    Videos of different queries can share a file name (e.g. title-derived
+    Adobe names), so with several candidates the one inside the record's query
+    folder wins; if none is, no local copy is used rather than guessing.
+    """
+    if len(paths) == 1:
+        return paths[0]
+    folder = Path(record.get('folder') or '').name.lower()
+    matches = [path for path in paths if folder and path.parent.name.lower() == folder]
+    if len(matches) == 1:
+        return matches[0]
+    if paths:
+        logger.warning(f"{len(paths)} local videos named {paths[0].name}, none in query folder "
+                       f"{record.get('folder')!r}; not using a local copy for {record['id']}")
+    return None
+
+
+class ShardWriter:
+    """Writes WebDataset tar shards from export records, fetching remote videos not found locally."""
+
+    def __init__(self, output_dir: Path, prefix: str = 'labeled', shard_size: int = DEFAULT_SHARD_SIZE,
+                 workers: int = 4, local_videos: Optional[Dict[str, List[Path]]] = None, fetch_remote: bool = True):
+        """
+        Initialize the writer.
+
+        Args:
+            output_dir: Directory receiving the shards and the shard index
+            prefix: Shard file name prefix (`<prefix>-000000.tar`)
+            shard_size: Samples per shard
+            workers: Shards written at the same time
+            local_videos: File name -> paths of videos already on disk
+            fetch_remote: Download http(s) videos that are not on disk (otherwise they are left out)
+        """
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+        self.shard_size = max(1, shard_size)
+        self.workers = max(1, workers)
+        self.local_videos = local_videos or {}
+        self.fetch_remote = fetch_remote
+        self.session = create_pooled_session(HEADERS, pool_size=self.workers) if fetch_remote else None
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def shard_path(self, number: int) -> Path:
+        return self.output_dir / f"{self.prefix}-{number:06d}.tar"
+
+    def resolve_video(self, record: Dict[str, Any], scratch_dir: Path) -> Optional[Path]:
+        """Find the video on disk, or download it into `scratch_dir`; None if neither works."""
+        url = record.get('url') or ''
+        if url and not url.startswith(('http://', 'https://')) and Path(url).is_file():
+            return Path(url)
+        local = match_local_video(record, self.local_videos.get(record.get('filename') or Path(url).name, []))
+        if local:
+            return local
+        if not (self.fetch_remote and url.startswith(('http://', 'https://'))):
+            return None
+
+        file_path = scratch_dir / (sample_key(record) + (Path(url).suffix or '.mp4'))
+        try:
+            resumable_download(self.session, url, file_path, show_progress=False)
+            return file_path
+        except Exception as e:
+            logger.warning(f"Could not fetch {url}: {e}")
+            return None
+
+    def add_bytes(self, tar: tarfile.TarFile, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = MEMBER_MTIME
+        tar.addfile(info, io.BytesIO(data))
+
+    def add_file(self, tar: tarfile.TarFile, name: str, file_path: Path) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = file_path.stat().st_size
+        info.mtime = MEMBER_MTIME
+        with open(file_path, 'rb') as f:
+            tar.addfile(info, f)
+
+    def write_shard(self, number: int, records: List[Dict[str, Any]]) -> ShardResult:
+        """Write one shard through a temporary file, so a finished name is always a complete shard."""
+        path = self.shard_path(number)
+        tmp_path = path.with_name(path.name + '.tmp')
+        missing = []
+        with tempfile.TemporaryDirectory(prefix='shard-') as scratch, tarfile.open(tmp_path, 'w') as tar:
+            for record in records:
+                key = sample_key(record)
+                # Members of a sample must be adjacent: json, thumbnail, then video
+                meta = {
+                    'id': record['id'],
+                    'title': record.get('title'),
+                    'query': record.get('query'),
+                    'folder': record.get('folder'),
+                    'url': record.get('url'),
+                    'score': record.get('confidenceScore'),
+                    'question': record.get('question'),
+                    'label': 'yes',
+                }
+                self.add_bytes(tar, f"{key}.json", json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+                thumbnail = Path(record.get('thumbnail') or '')
+                if thumbnail.suffix and thumbnail.is_file():
+                    self.add_file(tar, f"{key}{thumbnail.suffix.lower()}", thumbnail)
+
+                video_path = self.resolve_video(record, Path(scratch))
+                if video_path:
+                    self.add_file(tar, f"{key}{video_path.suffix.lower()}", video_path)
+                    if video_path.parent == Path(scratch):
+                        video_path.unlink()
+                else:
+                    missing.append(key)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.written += 1
+            logger.info(f"Wrote {path.name} ({len(records)} samples, {self.written} shards done)")
+        return ShardResult(path, len(records), path.stat().st_size, file_sha256(path), missing)
+
+    def write(self, samples: List[Dict[str, Any]]) -> List[ShardResult]:
+        """Split the samples into shards and write them in parallel, returning them in shard order."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        chunks = [samples[i:i + self.shard_size] for i in range(0, len(samples), self.shard_size)]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard') as executor:
+            return list(executor.map(self.write_shard, range(len(chunks)), chunks))
+
+    def write_index(self, results: List[ShardResult]) -> Path:
+        """Write the shard index (wids shard-index format, plus checksums and missing videos)."""
+        index = {
+            '__kind__': 'wids-shard-index-v1',
+            'wids_version': 1,
+            'name': self.prefix,
+            'shardlist': [
+                {'url': result.path.name, 'nsamples': result.samples, 'filesize': result.size,
+                 'sha256': result.sha256, 'missing_video': result.missing}
+                for result in results
+            ],
+        }
+        index_path = self.output_dir / f"{self.prefix}-index.json"
+        tmp_path = index_path.with_name(index_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, index_path)
+        return index_path
+
+
+def export_shards(data_dirs: Iterable[str], output_dir: Path, prefix: str = 'labeled',
+                  shard_size: int = DEFAULT_SHARD_SIZE, workers: int = 4,
+                  video_dirs: Iterable[str] = ('downloads',), fetch_remote: bool = True) -> Tuple[Path, List[ShardResult]]:
+    """
+    Export every labeled video under `data_dirs` to tar shards in `output_dir`.
+
+    Returns:
+        The shard index path and the written shards
+    """
+    samples = load_samples(data_dirs)
+    logger.info(f"Found {len(samples)} labeled videos")
+    writer = ShardWriter(output_dir, prefix, shard_size, workers,
+                         index_local_videos(video_dirs), fetch_remote)
+    results = writer.write(samples)
+    return writer.write_index(results), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack labeled videos into WebDataset tar shards')
+    parser.add_argument('data_dirs', nargs='*', default=['data'],
+                        help='Folders holding labeled video exports (default: data)')
+    parser.add_argument('-o', '--output', default='shards', help='Output directory (default: shards)')
+    parser.add_argument('--prefix', default='labeled', help='Shard name prefix (default: labeled)')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help=f'Samples per shard (default: {DEFAULT_SHARD_SIZE})')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Shards written in parallel (default: 4)')
+    parser.add_argument('--video-dir', action='append', default=None,
+                        help='Where downloaded videos are looked up by file name (repeatable, default: downloads)')
+    parser.add_argument('--no-fetch', action='store_true', help='Leave out videos that are not on disk instead of downloading them')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose logging')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    index_path, results = export_shards(args.data_dirs, Path(args.output), args.prefix, args.shard_size,
+                                        args.workers, args.video_dir or ['downloads'], not args.no_fetch)
+    missing = sum(len(result.missing) for result in results)
+    logger.info(f"Wrote {sum(result.samples for result in results)} samples in {len(results)} shards; index: {index_path}")
+    if missing:
+        logger.warning(f"{missing} samples have no video (see missing_video in the index)")
+
+
+if __name__ == '__main__':
+    main()
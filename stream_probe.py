@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Inline Stream Probing
+
+Tees a download's first bytes into ffmpeg so the thumbnail and basic
+metadata are extracted while the video is being written, instead of
+re-reading the file from disk afterwards. Results are stored next to the
+video as `<video>.thumb.jpg` and a `<video>.meta.json` sidecar, which
+file_monitor.py picks up in place of running ffprobe/ffmpeg itself.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = '.meta.json'
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+
+# Frames past this many bytes are not worth waiting for; the file monitor probes instead
+PROBE_MAX_BYTES = 64 * 1024 * 1024
+
+# Seconds to wait for ffmpeg once the stream has been fed
+PROBE_FINISH_TIMEOUT = 30
+
+THUMBNAIL_FILTER = 'scale=300:180:force_original_aspect_ratio=decrease,pad=300:180:(ow-iw)/2:(oh-ih)/2'
+
+
+def sidecar_path_for(video_path: Path) -> Path:
+    """Return the metadata sidecar path for a video."""
+    return video_path.with_name(video_path.name + SIDECAR_SUFFIX)
+
+
+def thumbnail_path_for(video_path: Path) -> Path:
+    """Return the inline thumbnail path for a video."""
+    return video_path.with_name(video_path.name + THUMBNAIL_SUFFIX)
+
+
+def load_sidecar(video_path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Return a video's sidecar metadata if it describes the file currently on disk.
+
+    The sidecar records the file size it was written for, so a replaced or
+    re-downloaded video is probed again rather than trusted.
+    """
+    try:
+        with open(sidecar_path_for(video_path), 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+        if sidecar.get('size') != video_path.stat().st_size:
+            return None
+        return sidecar
+    except (OSError, ValueError):
+        return None
+
+
+class StreamProbe:
+    """Feeds the beginning of a download into ffmpeg to grab a frame and the stream metadata."""
+
+    def __init__(self, video_path: Path, seek_seconds: float = 2.0):
+        """
+        Start ffmpeg reading from a pipe.
+
+        Args:
+            video_path: Final path of the video being downloaded
+            seek_seconds: Position of the thumbnail frame (matches file_monitor.py)
+        """
+        self.video_path = video_path
+        self.thumbnail_path = thumbnail_path_for(video_path)
+        self.fed_bytes = 0
+        self.active = True
+        self.stderr_lines = []
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-nostats', '-i', 'pipe:0',
+             '-ss', str(seek_seconds), '-frames:v', '1', '-vf', THUMBNAIL_FILTER,
+             '-q:v', '2', '-y', str(self.thumbnail_path)],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        # Drain stderr on a thread so ffmpeg never blocks on a full pipe
+        self.stderr_thread = threading.Thread(target=self.read_stderr, daemon=True)
+        self.stderr_thread.start()
+
+    @classmethod
+    def create(cls, video_path: Path) -> Optional['StreamProbe']:
+        """Return a probe for `video_path`, or None when ffmpeg is unavailable."""
+        if shutil.which('ffmpeg') is None:
+            return None
+        try:
+            return cls(video_path)
+        except OSError as e:
+            logger.debug(f"Could not start inline probe: {e}")
+            return None
+
+    def read_stderr(self) -> None:
+        for line in iter(self.process.stderr.readline, b''):
+            self.stderr_lines.append(line.decode('utf-8', errors='replace'))
+
+    def feed(self, offset: int, chunk: bytes) -> None:
+        """
+        Pass the chunk written at `offset` to ffmpeg.
+
+        Only a contiguous stream from byte 0 can be decoded, so a gap (resumed
+        download) or a restart from scratch stops the probe.
+        """
+        if not self.active:
+            return
+        if offset != self.fed_bytes or self.fed_bytes >= PROBE_MAX_BYTES:
+            self.close_input()
+            return
+        try:
+            self.process.stdin.write(chunk)
+            self.fed_bytes += len(chunk)
+        except (BrokenPipeError, OSError):
+            # ffmpeg exits as soon as it has its frame
+            self.close_input()
+
+    def close_input(self) -> None:
+        """Stop feeding ffmpeg."""
+        self.active = False
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def abort(self) -> None:
+        """Discard the probe after a failed download."""
+        self.close_input()
+        self.process.kill()
+        self.process.wait()
+        self.thumbnail_path.unlink(missing_ok=True)
+        sidecar_path_for(self.video_path).unlink(missing_ok=True)
+
+    def finish(self, size: int) -> bool:
+        """
+        Wait for ffmpeg and write the sidecar for the completed video.
+
+        Called just before the .part file is renamed, so the sidecar is in
+        place by the time the file monitor sees the video.
+
+        Args:
+            size: Final size of the video in bytes
+
+        Returns:
+            True if both the thumbnail and the metadata were extracted from the
+            stream; False leaves probing to the file monitor (e.g. MP4s whose
+            moov atom sits at the end cannot be decoded from a pipe).
+        """
+        self.close_input()
+        try:
+            self.process.wait(timeout=PROBE_FINISH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.stderr_thread.join(timeout=1)
+
+        stderr = ''.join(self.stderr_lines)
+        duration_match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', stderr)
+        size_match = re.search(r'Stream #\S+.*Video:.*?\b(\d{2,5})x(\d{2,5})\b', stderr)
+        if self.process.returncode != 0 or not self.thumbnail_path.exists() or not duration_match:
+            logger.debug(f"Inline probe of {self.video_path.name} incomplete; leaving it to the file monitor")
+            self.thumbnail_path.unlink(missing_ok=True)
+            return False
+
+        hours, minutes, seconds = duration_match.groups()
+        sidecar = {
+            'durationSeconds': int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+            'width': int(size_match.group(1)) if size_match else 0,
+            'height': int(size_match.group(2)) if size_match else 0,
+            'size': size,
+            'thumbnail': self.thumbnail_path.name,
+            'probedAt': time.time(),
+        }
+        sidecar_path = sidecar_path_for(self.video_path)
+        temp_path = sidecar_path.with_name(sidecar_path.name + '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(sidecar, f, indent=2)
+        os.replace(temp_path, sidecar_path)
+        return True
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming annotation reader at every read chunk size, so values
+and separators split across reads are covered
+"""
+
+import json
+
+import pytest
+
+import annotation_stream
+from annotation_stream import AnnotationStream
+
+DOCUMENTS = [
+    '{"time": 12.5, "results": [1]}',
+    '[1 ,2]',
+    '[{"a":1} ,{"a":2}]',
+    '[1.25, -3e5 , 7 ,{"b": [1, 2.5]}\n,\n"x"]',
+    '{"results": [{"video": "v/1.mp4", "score": 0.875} , {"video": "v/2.mp4", "score": 1e-3}], "time": 3.25}',
+]
+
+
+def read(path, chunk_size, monkeypatch):
+    monkeypatch.setattr(annotation_stream, 'READ_CHUNK_SIZE', chunk_size)
+    stream = AnnotationStream(path)
+    return list(stream), stream.meta
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_matches_json_load_at_every_chunk_size(document, tmp_path, monkeypatch):
+    path = tmp_path / 'annotations.json'
+    path.write_text(document, encoding='utf-8')
+    parsed = json.loads(document)
+    expected = parsed if isinstance(parsed, list) else parsed['results']
+    expected_meta = {} if isinstance(parsed, list) else {k: v for k, v in parsed.items() if k != 'results'}
+
+    for chunk_size in range(1, len(document) + 2):
+        assert read(path, chunk_size, monkeypatch) == (expected, expected_meta), chunk_size
+
+
+def test_truncated_array_raises(tmp_path, monkeypatch):
+    path = tmp_path / 'annotations.json'
+    path.write_text('[1, 2', encoding='utf-8')
+    for chunk_size in (1, 3, 1024):
+        with pytest.raises(ValueError):
+            read(path, chunk_size, monkeypatch)
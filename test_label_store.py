@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the label store's delta sync: conflict and reset rules, dataset-pool
+contexts, and the sequence numbers surviving a journal replay and compaction
+"""
+
+import pytest
+
+import label_store
+from label_store import LabelStore
+
+
+def open_store(path):
+    return LabelStore(path / 'labels.json', path / 'labels.journal.jsonl', commit_interval=0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = open_store(tmp_path)
+    yield store
+    store.close()
+
+
+def test_conflict_only_when_server_changed_video_after_base_seq(store):
+    base_seq = store.seq
+    store.set_label('v1', 'yes')
+    store.set_label('v2', 'no')
+
+    seq, applied, conflicts = store.apply_changes(base_seq, {'v1': 'no', 'v2': 'no', 'v3': 'yes'})
+
+    # v1 changed to a different label after base_seq; v2 already has the client's label
+    assert conflicts == [{'videoId': 'v1', 'label': 'no', 'serverLabel': 'yes', 'serverSeq': base_seq + 1}]
+    assert applied == 1
+    assert store.get_all() == {'v1': 'yes', 'v2': 'no', 'v3': 'yes'}
+    assert seq == store.seq
+
+    # A client that has seen the server's change may overwrite it
+    _, applied, conflicts = store.apply_changes(seq, {'v1': 'no'})
+    assert (applied, conflicts) == (1, [])
+    assert store.get_all()['v1'] == 'no'
+
+
+def test_clearing_a_label_conflicts_like_setting_one(store):
+    store.set_label('v1', 'yes')
+    base_seq = store.seq
+    store.set_label('v1', None)
+
+    _, applied, conflicts = store.apply_changes(base_seq, {'v1': 'no'})
+    assert applied == 0
+    assert conflicts[0]['serverLabel'] is None
+
+
+def test_changes_since_returns_delta_including_cleared_labels(store):
+    store.set_label('v1', 'yes')
+    since = store.seq
+    store.set_label('v2', 'no')
+    store.set_label('v1', None)
+
+    assert store.changes_since(since) == (store.seq, False, {'v1': None, 'v2': 'no'})
+    assert store.changes_since(store.seq) == (store.seq, False, {})
+
+
+def test_changes_since_resets_outside_the_tracked_history(store):
+    store.set_label('v1', 'yes')
+    # Ahead of the server (e.g. the server's data was replaced)
+    assert store.changes_since(store.seq + 1) == (store.seq, True, {'v1': 'yes'})
+
+    since = store.seq
+    store.clear()
+    store.set_label('v2', 'no')
+    # Before the clear: only the full map is known
+    assert since < store.base_seq
+    assert store.changes_since(since) == (store.seq, True, {'v2': 'no'})
+
+
+def test_pool_contexts_go_to_the_pool_map(store):
+    store.set_label('v1', 'yes', ('cats', None))
+    base_seq = store.seq - 1
+    store.set_label('v1', 'no', ('cats', None))
+    since = store.seq
+
+    # Pool labels neither touch the query's label nor conflict with its changes
+    seq, applied, conflicts = store.apply_changes(base_seq, {'v1': 'yes'}, {'v1': ('cats', 'pool-a')})
+    assert (applied, conflicts) == (1, [])
+    assert store.get_all() == {'v1': 'no'}
+    assert store.pool_labels == {'cats': {'pool-a': {'v1': 'yes'}}}
+    assert store.changes_since(since) == (seq, False, {})
+
+    assert store.label_stats('cats')['yes'] == 0
+    assert store.label_stats('cats', 'pool-a')['yes'] == 1
+
+
+def test_seq_and_history_survive_journal_replay(tmp_path):
+    store = open_store(tmp_path)
+    store.set_label('v1', 'yes', ('cats', None))
+    since = store.seq
+    store.set_label('v2', 'no', ('cats', None))
+    store.update_pool_labels('cats', 'pool-a', {'v1': 'no'})
+    seq = store.seq
+    store.close()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.seq == seq
+        assert store.get_all() == {'v1': 'yes', 'v2': 'no'}
+        assert store.pool_labels == {'cats': {'pool-a': {'v1': 'no'}}}
+        assert store.changes_since(since) == (seq, False, {'v2': 'no'})
+        assert store.label_stats('cats')['total'] == 2
+        # The replayed history still drives conflict detection
+        _, applied, conflicts = store.apply_changes(since, {'v2': 'yes'})
+        assert applied == 0 and conflicts[0]['serverSeq'] == since + 1
+    finally:
+        store.close()
+
+
+def test_seq_survives_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(label_store, 'COMPACT_MIN_ENTRIES', 2)
+    store = open_store(tmp_path)
+    store.set_label('v1', 'yes')
+    before_compaction = store.seq
+    for label in ('no', 'yes', 'no'):
+        store.set_label('v2', label)
+        store.flush()
+    seq = store.seq
+    store.close()
+    assert (tmp_path / 'labels.json').exists()
+
+    store = open_store(tmp_path)
+    try:
+        assert store.seq == seq
+        assert store.get_all() == {'v1': 'yes', 'v2': 'no'}
+        # Changes folded into the snapshot are only known as a whole
+        assert store.changes_since(before_compaction) == (seq, True, {'v1': 'yes', 'v2': 'no'})
+        assert store.changes_since(seq) == (seq, False, {})
+        store.set_label('v3', 'yes')
+        assert store.changes_since(seq) == (seq + 1, False, {'v3': 'yes'})
+    finally:
+        store.close()